@@ -1,7 +1,155 @@
+from threading import Lock
+from time import perf_counter, time
+
 import can
+import numpy as np
+
+from BMS_dispatcher import (
+    BMSLOOKUP,
+    BMSSTAT_HEX,
+    BMSTINF_HEX,
+    BMSVINF_HEX,
+    CELLVALUE_HEX,
+    CHARGER_OUT_HEX,
+    MAX_PAYLOAD_BYTES,
+    PACKSTAT_HEX,
+    decode_cell_value_batch,
+    unpack_cell_value,
+)
+from cell_history import CellHistory
+from data_processing import CANBatch, CANMessage, ProcessedData
+from pack_layout import DEFAULT_LAYOUT, PackLayout
+
+### DATA GROUPS ###
+"""
+Every container is tracked as a data group named after its message type.
+A group is marked dirty whenever new data is stored in it, so consumers
+only redraw what changed since they last looked.
+"""
+DATA_GROUPS = ("CELLVALUE", "BMSVINF", "BMSTINF", "BMSSTAT", "PACKSTAT", "CHARGEROUT")
+
+### FRESHNESS ###
+"""
+Every decoded arbitration ID has a slot in the per-message last-seen and
+frame count arrays, in ascending ID order.
+"""
+TRACKED_IDS = np.array(
+    sorted(key for key in BMSLOOKUP if isinstance(key, int)), dtype=np.uint32
+)
+TRACKED_SLOTS = {
+    int(arbitration_id): slot for slot, arbitration_id in enumerate(TRACKED_IDS)
+}
+
+### DISPATCH TABLE ###
+"""
+Every decoded arbitration ID maps straight to its decoder, the slot of
+BMSData.messages its newest decoded message is stored in (the same slot it
+is tracked in) and its data group. CELLVALUE frames are decoded together by
+store_cell_values and scattered into the cell store instead of their slot;
+their entry unpacks a single frame into a (cell number, voltage, temperature)
+tuple rather than a ProcessedData.
+"""
+DISPATCH = {
+    arbitration_id: (BMSLOOKUP[arbitration_id][0], slot, BMSLOOKUP[arbitration_id][1])
+    for arbitration_id, slot in TRACKED_SLOTS.items()
+}
+DISPATCH[CELLVALUE_HEX] = (unpack_cell_value, TRACKED_SLOTS[CELLVALUE_HEX], "CELLVALUE")
+CELLVALUE_SLOT = TRACKED_SLOTS[CELLVALUE_HEX]
+BMSVINF_SLOT = TRACKED_SLOTS[BMSVINF_HEX]
+BMSTINF_SLOT = TRACKED_SLOTS[BMSTINF_HEX]
+BMSSTAT_SLOT = TRACKED_SLOTS[BMSSTAT_HEX]
+PACKSTAT_SLOT = TRACKED_SLOTS[PACKSTAT_HEX]
+CHARGER_OUT_SLOT = TRACKED_SLOTS[CHARGER_OUT_HEX]
+
+
+def read_only_copy(array: np.ndarray) -> np.ndarray:
+    copy = array.copy()
+    copy.flags.writeable = False
+    return copy
+
+
+class PackSnapshot:
+    """
+    An immutable, versioned view of the pack state, published by BMSData.
+    Cell arrays are read-only copies and the decoded messages are never
+    modified once decoded, so a snapshot can be read from any thread without
+    locks. version increases with every publish; group_versions holds the
+    version at which every data group last changed, so readers can skip the
+    groups that didn't change since the version they last drew.
+    Snapshots share the arrays and messages of groups that didn't change.
+    """
+
+    def __init__(
+        self,
+        version: int,
+        group_versions: dict,
+        cell_voltages: np.ndarray,
+        cell_temperatures: np.ndarray,
+        cell_last_update: np.ndarray,
+        message_last_seen: np.ndarray,
+        message_counts: np.ndarray,
+        bms_system_voltage: ProcessedData | None = None,
+        bms_system_temp: ProcessedData | None = None,
+        bms_faults: ProcessedData | None = None,
+        pack_status: ProcessedData | None = None,
+        charger_out: ProcessedData | None = None,
+    ):
+        self.version = version
+        self.group_versions = group_versions
+        self.cell_voltages = cell_voltages
+        self.cell_temperatures = cell_temperatures
+        self.cell_last_update = cell_last_update
+        self.message_last_seen = message_last_seen
+        self.message_counts = message_counts
+        self.bms_system_voltage = bms_system_voltage
+        self.bms_system_temp = bms_system_temp
+        self.bms_faults = bms_faults
+        self.pack_status = pack_status
+        self.charger_out = charger_out
+
+    def changed_since(self, version: int) -> set[str]:
+        """Data groups changed after the given version"""
+        return {
+            group for group, changed in self.group_versions.items() if changed > version
+        }
+
+    def get_cell_voltages(self) -> np.ndarray:
+        return self.cell_voltages
+
+    def get_cell_temperatures(self) -> np.ndarray:
+        return self.cell_temperatures
 
-from BMS_dispatcher import BMSLOOKUP
-from data_processing import CANMessage, CANMessageHandler, ProcessedData
+    def get_cell_last_update(self) -> np.ndarray:
+        return self.cell_last_update
+
+    def get_message_last_seen(self) -> np.ndarray:
+        return self.message_last_seen
+
+    def get_message_counts(self) -> np.ndarray:
+        return self.message_counts
+
+    def stale_cells(self, now: float, max_age: float) -> np.ndarray:
+        """
+        Mask of the cells last updated more than max_age seconds before now.
+        Cells never received are not stale, they are still shown as N/A.
+        """
+        last_update = self.cell_last_update
+        return (last_update > 0) & (now - last_update > max_age)
+
+    def get_bms_system_voltage(self) -> ProcessedData:
+        return self.bms_system_voltage
+
+    def get_bms_system_temp(self) -> ProcessedData:
+        return self.bms_system_temp
+
+    def get_bms_processed_faults(self) -> ProcessedData:
+        return self.bms_faults
+
+    def get_bms_pack_status(self) -> ProcessedData:
+        return self.pack_status
+
+    def get_bms_charger_out(self) -> ProcessedData:
+        return self.charger_out
 
 
 class BMSData:
@@ -13,62 +161,317 @@ class BMSData:
     3. Contains getter functions to access those values from other parts of the program.
     """
 
-    def __init__(self):
+    def __init__(
+        self, layout: PackLayout = DEFAULT_LAYOUT, recorder=None, metrics=None
+    ):
         """
         Containers for storing most recent decoded values.
-        Each container should be of the ProcessedData object type,
-        except for the cell val container, which will be a
-        144 item list of ProcessedData objects.
+        The newest decoded message of every type is kept as a ProcessedData
+        object in its DISPATCH slot of the messages list, except for the cell
+        values, which are kept in a columnar store:
+        preallocated arrays indexed by cell number - 1 holding the latest
+        voltage, temperature (NaN until first received) and the timestamp
+        of the frame they came from (0 until first received).
+        Likewise, every arbitration ID in TRACKED_IDS has the timestamp of its
+        newest frame and a running count of its frames, so readers can tell
+        stale cells and silent messages and measure update rates.
+        The store is sized by the pack layout; CELLVALUE frames for cell numbers
+        outside of it are counted and ignored.
+        Every cell sample is also appended to a bounded CellHistory, for trends.
+        An optional SessionRecorder (see recorder.py) receives every decoded
+        sample of the batches processed, not only the newest ones.
+        An optional PipelineMetrics (see metrics.py) is told how long decoding
+        every message type takes.
+
+        All of these containers are the back buffer: only the thread decoding
+        messages touches them. Once a batch has been decoded, publish() makes
+        an immutable PackSnapshot of them and swaps it in as the snapshot
+        attribute, a single reference assignment, so readers on other threads
+        always see a complete batch. The getters read the latest snapshot.
+        """
+        self.layout = layout
+        self.num_cells = layout.num_cells
+        self.cell_voltages = np.full(self.num_cells, np.nan, dtype=np.float32)
+        self.cell_temperatures = np.full(self.num_cells, np.nan, dtype=np.float32)
+        self.cell_last_update = np.zeros(self.num_cells, dtype=np.float64)
+        self.message_last_seen = np.zeros(len(TRACKED_IDS), dtype=np.float64)
+        self.message_counts = np.zeros(len(TRACKED_IDS), dtype=np.int64)
+        self.cell_history = CellHistory(self.num_cells)
+        self.ignored_cell_count = 0
+        self.messages = [None] * len(TRACKED_IDS)
+        self.dirty_groups = set()
+        self.dirty_lock = Lock()
+        self.pending_groups = set()
+        self.recorder = recorder
+        self.metrics = metrics
+        self.snapshot = PackSnapshot(
+            0,
+            {group: 0 for group in DATA_GROUPS},
+            read_only_copy(self.cell_voltages),
+            read_only_copy(self.cell_temperatures),
+            read_only_copy(self.cell_last_update),
+            read_only_copy(self.message_last_seen),
+            read_only_copy(self.message_counts),
+        )
+
+    def mark_dirty(self, group: str) -> None:
+        """Flag a data group as changed in the back buffer, to be published by publish"""
+        self.pending_groups.add(group)
+
+    def publish(self) -> PackSnapshot:
+        """
+        Publish the back buffer as a new snapshot if anything changed since the
+        last publish. Only then are the changed groups handed to take_dirty, so
+        whoever takes them finds their data in the snapshot.
+        """
+        pending = self.pending_groups
+        if not pending:
+            return self.snapshot
+        previous = self.snapshot
+        version = previous.version + 1
+        cells_changed = "CELLVALUE" in pending
+        self.snapshot = PackSnapshot(
+            version,
+            {**previous.group_versions, **{group: version for group in pending}},
+            (
+                read_only_copy(self.cell_voltages)
+                if cells_changed
+                else previous.cell_voltages
+            ),
+            (
+                read_only_copy(self.cell_temperatures)
+                if cells_changed
+                else previous.cell_temperatures
+            ),
+            (
+                read_only_copy(self.cell_last_update)
+                if cells_changed
+                else previous.cell_last_update
+            ),
+            read_only_copy(self.message_last_seen),
+            read_only_copy(self.message_counts),
+            self.messages[BMSVINF_SLOT],
+            self.messages[BMSTINF_SLOT],
+            self.messages[BMSSTAT_SLOT],
+            self.messages[PACKSTAT_SLOT],
+            self.messages[CHARGER_OUT_SLOT],
+        )
+        self.pending_groups = set()
+        with self.dirty_lock:
+            self.dirty_groups |= pending
+        return self.snapshot
+
+    def get_snapshot(self) -> PackSnapshot:
+        """The latest published pack state; safe to read from any thread"""
+        return self.snapshot
+
+    def take_dirty(self) -> set[str]:
+        """Return the data groups published since the last call and reset them"""
+        with self.dirty_lock:
+            dirty, self.dirty_groups = self.dirty_groups, set()
+        return dirty
+
+    def is_dirty(self) -> bool:
+        return bool(self.dirty_groups)
+
+    def process_bms_batch(self, batch: CANBatch) -> None:
+        """
+        Decode a whole drained batch of messages. CELLVALUE frames are decoded
+        together with vectorised bit operations and scattered into the cell store;
+        every other message type is decoded once, from its newest frame only.
+        Frames of IDs missing from the DISPATCH table are dropped before any
+        message object is made for them. The result is published as one snapshot.
+        """
+        if len(batch) == 0:
+            return
+        tracked = self.track_messages(batch)
+
+        is_cell_value = batch.arbitration_ids == CELLVALUE_HEX
+        if is_cell_value.any():
+            if self.metrics is not None:
+                started = perf_counter()
+            self.store_cell_values(
+                batch.payloads[is_cell_value], batch.timestamps[is_cell_value]
+            )
+            if self.metrics is not None:
+                self.metrics.record_decode(
+                    "CELLVALUE", perf_counter() - started, int(is_cell_value.sum())
+                )
+
+        other_rows = np.flatnonzero(tracked & ~is_cell_value)
+        if len(other_rows):
+            arbitration_ids = batch.arbitration_ids[other_rows]
+            # index of the last occurrence of every arbitration ID, in arrival order
+            _, last_reversed = np.unique(arbitration_ids[::-1], return_index=True)
+            newest_rows = np.sort(other_rows[len(other_rows) - 1 - last_reversed])
+            if self.metrics is not None:
+                self.metrics.record_coalesced(len(other_rows) - len(newest_rows))
+            # a recording keeps every frame; decoded in arrival order, the newest
+            # frame of every ID is still the one left stored
+            rows = other_rows if self.recorder is not None else newest_rows
+            self.process_bms_messages(
+                [
+                    CANMessage(
+                        int(batch.arbitration_ids[row]),
+                        bytearray(batch.payloads[row, : batch.dlcs[row]]),
+                    )
+                    for row in rows
+                ],
+                track=False,
+                publish=False,
+                timestamps=batch.timestamps[rows],
+            )
+        self.publish()
+
+    def track_messages(self, batch: CANBatch) -> np.ndarray:
         """
-        self.processed_bms_cell_vals = [None] * 144
-        self.processed_bms_system_voltage = None
-        self.processed_bms_system_temp = None
-        self.processed_bms_faults = None
-        self.processed_pack_status = None
-        self.processed_charger_out = None
-
-    def process_bms_messages(self, messages: list[can.Message]) -> None:
+        Store the timestamp of every tracked frame of a batch in its ID's slot and
+        count it. Returns the mask of the tracked (decodable) frames.
+        """
+        slots = np.minimum(
+            np.searchsorted(TRACKED_IDS, batch.arbitration_ids), len(TRACKED_IDS) - 1
+        )
+        tracked = TRACKED_IDS[slots] == batch.arbitration_ids
+        slots = slots[tracked]
+        # later frames of the same ID overwrite earlier ones, leaving the newest timestamp
+        self.message_last_seen[slots] = batch.timestamps[tracked]
+        self.message_counts += np.bincount(slots, minlength=len(TRACKED_IDS))
+        return tracked
+
+    def store_cell_values(self, payloads: np.ndarray, timestamps: np.ndarray) -> None:
+        """
+        Decode a stack of CELLVALUE payloads and scatter the results into the cell
+        store. When a cell appears more than once only its newest frame is kept.
+        """
+        cell_numbers, voltages, temperatures = decode_cell_value_batch(payloads)
+        valid = np.flatnonzero((cell_numbers >= 1) & (cell_numbers <= self.num_cells))
+        self.ignored_cell_count += len(cell_numbers) - len(valid)
+        self.cell_history.add(
+            cell_numbers[valid] - 1,
+            timestamps[valid],
+            voltages[valid],
+            temperatures[valid],
+        )
+        if self.recorder is not None:
+            self.recorder.record_cells(
+                timestamps[valid],
+                cell_numbers[valid],
+                voltages[valid],
+                temperatures[valid],
+            )
+
+        _, last_reversed = np.unique(cell_numbers[valid][::-1], return_index=True)
+        newest = valid[len(valid) - 1 - last_reversed]
+        if self.metrics is not None:
+            self.metrics.record_coalesced(len(valid) - len(newest))
+
+        cell_indices = cell_numbers[newest] - 1
+        self.cell_voltages[cell_indices] = voltages[newest]
+        self.cell_temperatures[cell_indices] = temperatures[newest]
+        self.cell_last_update[cell_indices] = timestamps[newest]
+        if len(newest):
+            self.mark_dirty("CELLVALUE")
+
+    def process_bms_messages(
+        self, messages: list[can.Message], track=True, publish=True, timestamps=None
+    ) -> None:
         """
         This function contains the logic for routing a received CANMessage to
-        its appropriate decoding function. It then places the returned ProcessedData
-        object in its appropriate container.
+        its appropriate decoding function, looked up by arbitration ID in the
+        DISPATCH table. It then places the returned ProcessedData object in its
+        slot of the messages list. The CELLVALUE messages are stacked and stored
+        together through store_cell_values, as the batch path stores them. With a
+        recorder attached every decoded message is also recorded. Messages are
+        timestamped with the given timestamps (one per message), or else with
+        the time they were processed.
+        Unless track is False (the batch path tracks every frame itself), every
+        message is stamped as seen now in its ID's last-seen slot and counted.
+        Unless publish is False (the batch path publishes once, when the whole
+        batch is applied), the result is published as a new snapshot.
         """
-        handler = CANMessageHandler(BMSLOOKUP)
-        for individual_message in messages:
-            if individual_message.arbitration_id in BMSLOOKUP:
-                decoded_message = handler.decode_message(individual_message)
-                match BMSLOOKUP[individual_message.arbitration_id][1]:
-                    case "CELLVALUE":
-                        self.processed_bms_cell_vals[
-                            decoded_message.values["cell_number"] - 1
-                        ] = decoded_message
-                    case "BMSSTAT":
-                        self.processed_bms_faults = decoded_message
-                    case "BMSVINF":
-                        self.processed_bms_system_voltage = decoded_message
-                    case "BMSTINF":
-                        self.processed_bms_system_temp = decoded_message
-                    case "PACKSTAT":
-                        self.processed_pack_status = decoded_message
-                    case "CHARGEROUT":
-                        self.processed_charger_out = decoded_message
-                    case _:
-                        print(f'failed to decode {decoded_message}')
-
-    def get_bms_cell_vals(self) -> list[ProcessedData] | list[None]:
-        return self.processed_bms_cell_vals
+        dispatch = DISPATCH
+        stored = self.messages
+        metrics = self.metrics
+        recorder = self.recorder
+        received = time()
+        cell_payloads = []
+        cell_timestamps = []
+        for index, individual_message in enumerate(messages):
+            entry = dispatch.get(individual_message.arbitration_id)
+            if entry is None:
+                continue
+            decoder, slot, message_type = entry
+            if track:
+                self.message_last_seen[slot] = received
+                self.message_counts[slot] += 1
+            if slot == CELLVALUE_SLOT:
+                data = bytes(individual_message.data[:MAX_PAYLOAD_BYTES])
+                cell_payloads.append(data.ljust(MAX_PAYLOAD_BYTES, b"\x00"))
+                cell_timestamps.append(
+                    received if timestamps is None else timestamps[index]
+                )
+                continue
+            if metrics is not None:
+                started = perf_counter()
+            decoded_message = decoder(individual_message.data)
+            if metrics is not None:
+                metrics.record_decode(message_type, perf_counter() - started)
+            stored[slot] = decoded_message
+            if recorder is not None:
+                recorder.record(
+                    message_type,
+                    received if timestamps is None else float(timestamps[index]),
+                    decoded_message.values,
+                )
+            self.mark_dirty(message_type)
+        if cell_payloads:
+            if metrics is not None:
+                started = perf_counter()
+            self.store_cell_values(
+                np.frombuffer(b"".join(cell_payloads), dtype=np.uint8).reshape(
+                    -1, MAX_PAYLOAD_BYTES
+                ),
+                np.array(cell_timestamps, dtype=np.float64),
+            )
+            if metrics is not None:
+                metrics.record_decode(
+                    "CELLVALUE", perf_counter() - started, len(cell_payloads)
+                )
+        if publish:
+            self.publish()
+
+    def get_cell_voltages(self) -> np.ndarray:
+        return self.snapshot.cell_voltages
+
+    def get_cell_temperatures(self) -> np.ndarray:
+        return self.snapshot.cell_temperatures
+
+    def get_cell_last_update(self) -> np.ndarray:
+        return self.snapshot.cell_last_update
+
+    def get_message_last_seen(self) -> np.ndarray:
+        return self.snapshot.message_last_seen
+
+    def get_message_counts(self) -> np.ndarray:
+        return self.snapshot.message_counts
+
+    def get_cell_history(self) -> CellHistory:
+        return self.cell_history
+
+    def get_ignored_cell_count(self) -> int:
+        return self.ignored_cell_count
 
     def get_bms_system_voltage(self) -> ProcessedData:
-        return self.processed_bms_system_voltage
+        return self.snapshot.bms_system_voltage
 
     def get_bms_system_temp(self) -> ProcessedData:
-        return self.processed_bms_system_temp
+        return self.snapshot.bms_system_temp
 
     def get_bms_processed_faults(self) -> ProcessedData:
-        return self.processed_bms_faults
+        return self.snapshot.bms_faults
 
     def get_bms_pack_status(self) -> ProcessedData:
-        return self.processed_pack_status
+        return self.snapshot.pack_status
 
     def get_bms_charger_out(self) -> ProcessedData:
-        return self.processed_charger_out
+        return self.snapshot.charger_out
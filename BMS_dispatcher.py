@@ -1,6 +1,17 @@
 ##### IMPORTS #####
-from data_processing import CANMessage, ProcessedData
+import threading
+
 import cantools
+import numpy as np
+
+from BMS_fastdecode import (
+    MAX_PAYLOAD_BYTES,
+    build_batch_decoder,
+    build_batch_encoder,
+    build_fast_decoders,
+    build_fast_unpacker,
+)
+from data_processing import CANMessage, ProcessedData
 
 ##### CONSTANTS #####
 VOLTAGE_OFFSET = 10000.0
@@ -15,26 +26,141 @@ PACKSTAT_HEX = 0x180
 CHARGER_OUT_HEX = 0x405
 CHARGER_IN_HEX = 0x381
 POLLING_HEX = 0x380
+ZERO_PADDING = [
+    bytes(MAX_PAYLOAD_BYTES - length) for length in range(MAX_PAYLOAD_BYTES + 1)
+]
+# charger status byte errors, by bit
+CHARGER_STATUS_ERRORS = (
+    "Hardware Malfunction",
+    "Charger Temperature",
+    "Input Voltage Error",
+    "Battery Connection Error",
+    "Communication Timeout",
+)
+
+db = cantools.database.load_file("can_1.dbc")
+
+
+FAST_DECODERS = build_fast_decoders(
+    db, [CELLVALUE_HEX, BMSSTAT_HEX, BMSVINF_HEX, BMSTINF_HEX]
+)
+FAST_ENCODERS = {
+    frame_id: encoder
+    for frame_id in (CELLVALUE_HEX, BMSSTAT_HEX, BMSVINF_HEX, BMSTINF_HEX)
+    if (encoder := build_batch_encoder(db.get_message_by_frame_id(frame_id)))
+    is not None
+}
+
+
+# one reusable 8-byte buffer per decoding thread, for payloads cantools needs padded
+_padding = threading.local()
+
+
+def padded_payload(data) -> bytearray:
+    """
+    Copy a payload into this thread's reusable 8-byte buffer, zero filling the
+    rest, and return the buffer. The caller's data is left as it is, and nothing
+    is allocated per frame; the buffer is overwritten by the next call.
+    """
+    buffer = getattr(_padding, "buffer", None)
+    if buffer is None:
+        buffer = _padding.buffer = bytearray(MAX_PAYLOAD_BYTES)
+    length = len(data)
+    buffer[:length] = data
+    buffer[length:] = ZERO_PADDING[length]
+    return buffer
+
+
+def decode_signals(frame_id: int, data: bytearray) -> dict:
+    """
+    Decode a payload into its DBC signals, using the generated decoder for the
+    arbitration ID when there is one and cantools otherwise. The generated
+    decoders read short payloads as they are; cantools gets them padded.
+    """
+    decoder = FAST_DECODERS.get(frame_id)
+    if decoder is not None:
+        return decoder(data)
+    return db.decode_message(frame_id, padded_payload(data))
+
+
+def encode_signals(frame_id: int, signals: dict) -> bytearray:
+    """
+    Encode DBC signal values into a payload of the message's length, using the
+    generated batch encoder for the arbitration ID when there is one and cantools
+    otherwise. The inverse of decode_signals.
+    """
+    message = db.get_message_by_frame_id(frame_id)
+    encoder = FAST_ENCODERS.get(frame_id)
+    if encoder is None:
+        return bytearray(db.encode_message(frame_id, signals, strict=False))
+    return bytearray(encoder(**signals)[0, : message.length].tobytes())
 
-db = cantools.database.load_file('can_1.dbc')
 
 ##### BMS DECODING FUNCTIONS #####
+"""
+Decoders never modify the payload they are given; short payloads are read
+as if zero padded to the message length.
+"""
+CELL_VALUE_FIELDS = ("idx_cell_data", "vlt_cell_data", "temp_cell_data")
+
+
+def unpack_cell_value_signals(data: bytearray) -> tuple[int, float, float]:
+    """unpack_cell_value for when no unpacker can be generated from the DBC"""
+    decoded = decode_signals(CELLVALUE_HEX, data)
+    return tuple(decoded[field] for field in CELL_VALUE_FIELDS)
+
+
+# Decodes a CELLVALUE payload into (cell number, voltage, temperature) without
+# building any dictionary, for the per-frame decode path. The generated
+# unpacker is called directly, not through a wrapper, as it runs for every frame.
+unpack_cell_value = (
+    build_fast_unpacker(db.get_message_by_frame_id(CELLVALUE_HEX), CELL_VALUE_FIELDS)
+    or unpack_cell_value_signals
+)
+
+
 def decode_cell_value(data: bytearray) -> ProcessedData:
-    data.extend([0] * (8 - len(data)))
-    decoded = db.decode_message(CELLVALUE_HEX, data)
+    cell_number, cell_voltage, cell_temperature = unpack_cell_value(data)
     ret = ProcessedData(
         message_type="CELLVALUE",
         values={
-            "cell_number": decoded["idx_cell_data"],
-            "cell_voltage": decoded["vlt_cell_data"],
-            "cell_temperature": decoded["temp_cell_data"],
+            "cell_number": cell_number,
+            "cell_voltage": cell_voltage,
+            "cell_temperature": cell_temperature,
         },
     )
     return ret
 
+
+_decode_cell_value_columns = build_batch_decoder(
+    db.get_message_by_frame_id(CELLVALUE_HEX)
+)
+
+
+def decode_cell_value_batch(
+    payloads: np.ndarray,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Decode a whole (N, 8) uint8 array of CELLVALUE payloads at once.
+    Returns the cell numbers, voltages and temperatures as NumPy arrays.
+    """
+    if _decode_cell_value_columns is None:
+        rows = [decode_signals(CELLVALUE_HEX, bytearray(row)) for row in payloads]
+        return (
+            np.array([row["idx_cell_data"] for row in rows], dtype=np.int64),
+            np.array([row["vlt_cell_data"] for row in rows], dtype=np.float64),
+            np.array([row["temp_cell_data"] for row in rows], dtype=np.float64),
+        )
+    decoded = _decode_cell_value_columns(payloads)
+    return (
+        decoded["idx_cell_data"],
+        decoded["vlt_cell_data"],
+        decoded["temp_cell_data"],
+    )
+
+
 def decode_bmsvinf(data: bytearray) -> ProcessedData:
-    data.extend([0] * (6 - len(data)))
-    decoded = db.decode_message(BMSVINF_HEX, data)
+    decoded = decode_signals(BMSVINF_HEX, data)
     return ProcessedData(
         message_type="BMSVINF",
         values={
@@ -48,8 +174,7 @@ def decode_bmsvinf(data: bytearray) -> ProcessedData:
 
 
 def decode_bmstinf(data: bytearray) -> ProcessedData:
-    data.extend([0] * (6 - len(data)))
-    decoded = db.decode_message(BMSTINF_HEX, data)
+    decoded = decode_signals(BMSTINF_HEX, data)
     return ProcessedData(
         message_type="BMSTINF",
         values={
@@ -63,8 +188,7 @@ def decode_bmstinf(data: bytearray) -> ProcessedData:
 
 
 def decode_bmsstat(data: bytearray) -> ProcessedData:
-    data.extend([0] * (6 - len(data)))
-    decoded = db.decode_message(BMSSTAT_HEX, data)
+    decoded = decode_signals(BMSSTAT_HEX, data)
     faults = {}
     if decoded["bms_fault_ovp"]:
         faults["Over Voltage"] = decoded["bms_fault_ovp"]
@@ -80,6 +204,7 @@ def decode_bmsstat(data: bytearray) -> ProcessedData:
 
 # Removed
 def decode_packstat(data: bytearray) -> ProcessedData:
+    data = padded_payload(data)
     pack_voltage = ((data[0] << 8) | data[1]) / DECIMAL_OFFSET
     pack_current = ((data[2] << 8) | data[3]) / DECIMAL_OFFSET
     pack_power = ((data[4] << 8) | data[5]) / DECIMAL_OFFSET
@@ -94,22 +219,17 @@ def decode_packstat(data: bytearray) -> ProcessedData:
     )
 
 
-def decode_charger_out(message: CANMessage) -> ProcessedData:
-    charger_voltage = ((message.data[0] << 8) | message.data[1]) / DECIMAL_OFFSET
-    charger_current = ((message.data[2] << 8) | message.data[3]) / DECIMAL_OFFSET
-    status_byte = message.data[4]
+def decode_charger_out(data: bytearray) -> ProcessedData:
+    data = padded_payload(data)
+    charger_voltage = ((data[0] << 8) | data[1]) / DECIMAL_OFFSET
+    charger_current = ((data[2] << 8) | data[3]) / DECIMAL_OFFSET
+    status_byte = data[4]
 
-    status_errors = []
-    if status_byte & 0x01:
-        status_errors.append("Hardware Malfunction")
-    if status_byte & 0x02:
-        status_errors.append("Charger Temperature")
-    if status_byte & 0x04:
-        status_errors.append("Input Voltage Error")
-    if status_byte & 0x08:
-        status_errors.append("Battery Connection Error")
-    if status_byte & 0x10:
-        status_errors.append("Communication Timeout")
+    status_errors = [
+        error
+        for bit, error in enumerate(CHARGER_STATUS_ERRORS)
+        if status_byte & (1 << bit)
+    ]
 
     return ProcessedData(
         message_type="CHARGEROUT",
@@ -154,12 +274,150 @@ def encode_manual_charge(values: dict) -> CANMessage:
         ],
     )
 
+
 def encode_polling() -> CANMessage:
+    return CANMessage(arbitration_id=POLLING_HEX, data=[0xFF])
+
+
+### SYNTHETIC BMS ENCODING FUNCTIONS ###
+"""
+The inverse of the BMS decoding functions: each takes the values dictionary
+the matching decoder produces and builds the frame the BMS would send.
+Used to generate synthetic traffic (see traffic_generator.py).
+"""
+
+
+def encode_cell_value(values: dict) -> CANMessage:
+    return CANMessage(
+        arbitration_id=CELLVALUE_HEX,
+        data=encode_signals(
+            CELLVALUE_HEX,
+            {
+                "idx_cell_data": values["cell_number"],
+                "vlt_cell_data": values["cell_voltage"],
+                "temp_cell_data": values["cell_temperature"],
+            },
+        ),
+    )
+
+
+_encode_cell_value_columns = FAST_ENCODERS.get(CELLVALUE_HEX)
+
+
+def encode_cell_value_batch(
+    cell_numbers: np.ndarray, voltages: np.ndarray, temperatures: np.ndarray
+) -> np.ndarray:
+    """
+    Encode whole columns of cell values at once, into an (N, 8) uint8 array
+    of CELLVALUE payloads. The inverse of decode_cell_value_batch.
+    """
+    if _encode_cell_value_columns is None:
+        payloads = [
+            bytes(
+                encode_cell_value(
+                    {
+                        "cell_number": number,
+                        "cell_voltage": voltage,
+                        "cell_temperature": temperature,
+                    }
+                ).data
+            ).ljust(8, b"\x00")
+            for number, voltage, temperature in zip(
+                cell_numbers.tolist(), voltages.tolist(), temperatures.tolist()
+            )
+        ]
+        return np.frombuffer(b"".join(payloads), dtype=np.uint8).reshape(-1, 8)
+    return _encode_cell_value_columns(
+        idx_cell_data=cell_numbers, vlt_cell_data=voltages, temp_cell_data=temperatures
+    )
+
+
+def encode_bmsvinf(values: dict) -> CANMessage:
+    # decode_bmsvinf reads the max voltage cell from idx_vlt_min and vice versa
+    return CANMessage(
+        arbitration_id=BMSVINF_HEX,
+        data=encode_signals(
+            BMSVINF_HEX,
+            {
+                "vlt_cell_max": values["max_voltage"],
+                "vlt_cell_min": values["min_voltage"],
+                "idx_vlt_min": values["max_voltage_cell"],
+                "idx_vlt_max": values["min_voltage_cell"],
+            },
+        ),
+    )
+
+
+def encode_bmstinf(values: dict) -> CANMessage:
+    # decode_bmstinf reads the max temperature cell from idx_temp_min and vice versa
+    return CANMessage(
+        arbitration_id=BMSTINF_HEX,
+        data=encode_signals(
+            BMSTINF_HEX,
+            {
+                "temp_cell_max": values["max_temp"],
+                "temp_cell_min": values["min_temp"],
+                "idx_temp_min": values["max_temp_cell"],
+                "idx_temp_max": values["min_temp_cell"],
+            },
+        ),
+    )
+
+
+def encode_bmsstat(values: dict) -> CANMessage:
+    faults = values["faults"]
     return CANMessage(
-        arbitration_id=POLLING_HEX,
-        data=[0xFF]
+        arbitration_id=BMSSTAT_HEX,
+        data=encode_signals(
+            BMSSTAT_HEX,
+            {
+                "bms_fault_ovp": int(bool(faults.get("Over Voltage"))),
+                "bms_fault_uvp": int(bool(faults.get("Under Voltage"))),
+                "bms_fault_otp": int(bool(faults.get("Over Temp"))),
+                "bms_fault_utp": int(bool(faults.get("Under Temp"))),
+            },
+        ),
     )
 
+
+def encode_packstat(values: dict) -> CANMessage:
+    pack_voltage_raw = int(round(values["pack_voltage"] * DECIMAL_OFFSET)) & 0xFFFF
+    pack_current_raw = int(round(values["pack_current"] * DECIMAL_OFFSET)) & 0xFFFF
+    pack_power_raw = int(round(values["pack_power"] * DECIMAL_OFFSET)) & 0xFFFF
+
+    return CANMessage(
+        arbitration_id=PACKSTAT_HEX,
+        data=bytearray(
+            pack_voltage_raw.to_bytes(2, "big")
+            + pack_current_raw.to_bytes(2, "big")
+            + pack_power_raw.to_bytes(2, "big")
+        ),
+    )
+
+
+def encode_charger_out(values: dict) -> CANMessage:
+    charger_voltage_raw = (
+        int(round(values["charger_voltage"] * DECIMAL_OFFSET)) & 0xFFFF
+    )
+    charger_current_raw = (
+        int(round(values["charger_current"] * DECIMAL_OFFSET)) & 0xFFFF
+    )
+    status_byte = sum(
+        1 << bit
+        for bit, error in enumerate(CHARGER_STATUS_ERRORS)
+        if error in values["status_errors"]
+    )
+
+    return CANMessage(
+        arbitration_id=CHARGER_OUT_HEX,
+        data=bytearray(
+            charger_voltage_raw.to_bytes(2, "big")
+            + charger_current_raw.to_bytes(2, "big")
+            + bytes([status_byte])
+        ),
+    )
+
+
 ### BMS LOOKUP TABLE ###
 """
 If the key in this dictionary is a number, then 
@@ -177,6 +435,12 @@ BMSLOOKUP = {
     PACKSTAT_HEX: (decode_packstat, "PACKSTAT"),
     CHARGER_OUT_HEX: (decode_charger_out, "CHARGEROUT"),
     "CHARGERIN": encode_manual_charge,
+    "CELLVALUE": encode_cell_value,
+    "BMSSTAT": encode_bmsstat,
+    "BMSVINF": encode_bmsvinf,
+    "BMSTINF": encode_bmstinf,
+    "PACKSTAT": encode_packstat,
+    "CHARGEROUT": encode_charger_out,
 }
 
 ### BMS CAN BUS FILTERS ###
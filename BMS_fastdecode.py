@@ -0,0 +1,299 @@
+"""
+Generates specialised decoders for the BMS message set from the DBC.
+
+cantools decodes a frame by iterating over every signal of the message
+through bitstruct, then scaling it and looking up its choices. The BMS
+layout never changes at runtime, so this module reads it once at startup
+and generates one plain Python function per arbitration ID that turns the
+payload into an integer, pulls every signal out with a shift and a mask,
+and applies the scaling inline. The generated functions return the same
+dictionary cantools would; unpackers generated for a chosen list of signals
+return just those values as a tuple, without building a dictionary per frame.
+
+Messages the generator can't express (multiplexed messages, float signals
+or payloads longer than 8 bytes) are left out, and callers keep using
+cantools for those.
+
+Validate the generated decoders against cantools on a recorded log with:
+    python BMS_fastdecode.py --validate can_data.log
+"""
+
+### IMPORTS ###
+import argparse
+
+import can
+import cantools
+import numpy as np
+
+### CONSTANTS ###
+MAX_PAYLOAD_BYTES = 8
+
+
+def signal_shift(signal) -> tuple[str, int]:
+    """
+    Return the byte order the payload should be read in as an integer, and how far
+    that integer has to be shifted right so the signal's least significant bit lands
+    at bit 0. Big endian payloads are assumed to be left aligned to 8 bytes.
+    """
+    if signal.byte_order == "little_endian":
+        return "little", signal.start
+    # DBC big endian start bits count from the MSB of byte 0 in sawtooth order
+    msb = 8 * (MAX_PAYLOAD_BYTES - 1 - signal.start // 8) + signal.start % 8
+    return "big", msb - signal.length + 1
+
+
+def is_supported(message) -> bool:
+    """Check whether a decoder can be generated for the given cantools message."""
+    if message.is_multiplexed() or message.length > MAX_PAYLOAD_BYTES:
+        return False
+    return not any(signal.is_float for signal in message.signals)
+
+
+def generate_decoder_source(message, fields=None) -> tuple[str, dict]:
+    """
+    Emit the source of a decoder for one cantools message, along with the
+    globals it needs (choice tables). The function is named decode_<frame id>.
+    Given fields, a list of signal names, it emits an unpacker named
+    unpack_<frame id> instead, which returns only those signals, as a tuple
+    in that order.
+    """
+    namespace = {}
+    if fields is None:
+        signals = message.signals
+        lines = [f"def decode_{message.frame_id:#x}(data):"]
+    else:
+        signals = [message.get_signal_by_name(name) for name in fields]
+        lines = [f"def unpack_{message.frame_id:#x}(data):"]
+    byte_orders = {signal_shift(signal)[0] for signal in signals}
+    if "little" in byte_orders:
+        lines.append('    little = int.from_bytes(data, "little")')
+    if "big" in byte_orders:
+        lines.append(
+            f'    big = int.from_bytes(data, "big") << (8 * ({MAX_PAYLOAD_BYTES} - len(data)))'
+        )
+
+    values = []
+    for index, signal in enumerate(signals):
+        byte_order, shift = signal_shift(signal)
+        raw = f"raw{index}"
+        lines.append(
+            f"    {raw} = ({byte_order} >> {shift}) & {(1 << signal.length) - 1:#x}"
+        )
+        if signal.is_signed:
+            sign_bit = 1 << (signal.length - 1)
+            lines.append(f"    {raw} = ({raw} ^ {sign_bit:#x}) - {sign_bit:#x}")
+
+        if signal.scale == 1 and signal.offset == 0:
+            scaled = raw
+        elif signal.offset == 0:
+            scaled = f"{raw} * {signal.scale!r}"
+        else:
+            scaled = f"{raw} * {signal.scale!r} + {signal.offset!r}"
+        if signal.choices:
+            choices = f"CHOICES{index}"
+            namespace[choices] = signal.choices
+            scaled = f"{choices}.get({raw}, {scaled})"
+        values.append((signal.name, scaled))
+
+    if fields is None:
+        lines.append("    return {")
+        lines.extend(f"        {name!r}: {scaled}," for name, scaled in values)
+        lines.append("    }")
+    else:
+        lines.append(f"    return ({', '.join(scaled for _, scaled in values)},)")
+    return "\n".join(lines) + "\n", namespace
+
+
+def build_fast_decoders(database, frame_ids) -> dict:
+    """
+    Generate and compile decoders for the given arbitration IDs.
+    IDs missing from the database or not supported by the generator are left out.
+    """
+    decoders = {}
+    for frame_id in frame_ids:
+        try:
+            message = database.get_message_by_frame_id(frame_id)
+        except KeyError:
+            continue
+        if not is_supported(message):
+            continue
+        source, namespace = generate_decoder_source(message)
+        exec(compile(source, f"<decoder {frame_id:#x}>", "exec"), namespace)
+        decoders[frame_id] = namespace[f"decode_{frame_id:#x}"]
+    return decoders
+
+
+def build_fast_unpacker(message, fields):
+    """
+    Generate and compile an unpacker for the given signals of one cantools message
+    (see generate_decoder_source). Returns None if the message isn't supported.
+    """
+    if not is_supported(message):
+        return None
+    source, namespace = generate_decoder_source(message, fields)
+    exec(compile(source, f"<unpacker {message.frame_id:#x}>", "exec"), namespace)
+    return namespace[f"unpack_{message.frame_id:#x}"]
+
+
+def build_batch_decoder(message):
+    """
+    Build a vectorised decoder for one cantools message. It takes an (N, 8) uint8
+    array of zero padded payloads and returns a dict of NumPy columns, one per
+    signal, holding the scaled values (choices are not applied).
+    Returns None for messages the generator doesn't support.
+    """
+    if not is_supported(message):
+        return None
+
+    columns = []
+    for signal in message.signals:
+        byte_order, shift = signal_shift(signal)
+        sign_bit = 1 << (signal.length - 1) if signal.is_signed else 0
+        columns.append(
+            (
+                signal.name,
+                byte_order,
+                shift,
+                (1 << signal.length) - 1,
+                sign_bit,
+                signal.scale,
+                signal.offset,
+            )
+        )
+
+    def decode(payloads: np.ndarray) -> dict:
+        payloads = np.ascontiguousarray(payloads, dtype=np.uint8)
+        words = {
+            "little": payloads.view("<u8")[:, 0],
+            "big": payloads.view(">u8")[:, 0],
+        }
+        values = {}
+        for name, byte_order, shift, mask, sign_bit, scale, offset in columns:
+            raw = (words[byte_order] >> shift) & mask
+            if sign_bit:
+                raw = (raw.astype(np.int64) ^ sign_bit) - sign_bit
+            if scale == 1 and offset == 0:
+                values[name] = raw
+            else:
+                values[name] = raw * scale + offset
+        return values
+
+    return decode
+
+
+def build_batch_encoder(message):
+    """
+    Build the inverse of build_batch_decoder for one cantools message: it takes
+    one array (or scalar) of scaled values per signal, as keyword arguments
+    named after the signals, and returns an (N, 8) uint8 array of payloads.
+    Values are rounded to the nearest raw step and clipped to the signal's range;
+    signals not given are encoded as 0. Returns None for messages the generator
+    doesn't support.
+    """
+    if not is_supported(message):
+        return None
+
+    columns = []
+    for signal in message.signals:
+        byte_order, shift = signal_shift(signal)
+        if signal.is_signed:
+            low, high = -(1 << (signal.length - 1)), (1 << (signal.length - 1)) - 1
+        else:
+            low, high = 0, (1 << signal.length) - 1
+        columns.append(
+            (
+                signal.name,
+                byte_order,
+                shift,
+                np.uint64((1 << signal.length) - 1),
+                low,
+                high,
+                signal.scale,
+                signal.offset,
+            )
+        )
+
+    def encode(**values) -> np.ndarray:
+        rows = max((np.size(value) for value in values.values()), default=1)
+        words = {"little": np.zeros(rows, np.uint64), "big": np.zeros(rows, np.uint64)}
+        for name, byte_order, shift, mask, low, high, scale, offset in columns:
+            if name not in values:
+                continue
+            raw = np.clip(
+                np.rint((np.asarray(values[name]) - offset) / scale), low, high
+            )
+            # two's complement of negative raw values, masked to the signal length
+            words[byte_order] |= (
+                raw.astype(np.int64).astype(np.uint64) & mask
+            ) << np.uint64(shift)
+        payloads = (
+            words["little"]
+            .astype("<u8")
+            .view(np.uint8)
+            .reshape(rows, MAX_PAYLOAD_BYTES)
+        )
+        return payloads | words["big"].astype(">u8").view(np.uint8).reshape(
+            rows, MAX_PAYLOAD_BYTES
+        )
+
+    return encode
+
+
+def validate_fast_decoders(database, decoders: dict, log_file: str) -> tuple[int, list]:
+    """
+    Decode every frame of a candump -L log with both the generated decoders and
+    cantools and compare the results. Returns the number of frames checked and
+    a list of (timestamp, frame id, fast result, cantools result) mismatches.
+    """
+    checked = 0
+    mismatches = []
+    for msg in can.CanutilsLogReader(log_file):
+        decoder = decoders.get(msg.arbitration_id)
+        if decoder is None:
+            continue
+        length = database.get_message_by_frame_id(msg.arbitration_id).length
+        expected = database.decode_message(
+            msg.arbitration_id, bytes(msg.data).ljust(length, b"\x00")
+        )
+        actual = decoder(msg.data)
+        checked += 1
+        if actual != expected:
+            mismatches.append((msg.timestamp, msg.arbitration_id, actual, expected))
+    return checked, mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generated BMS decoder tools")
+    parser.add_argument("--dbc", default="can_1.dbc")
+    parser.add_argument(
+        "--show", action="store_true", help="Print the generated decoder source"
+    )
+    parser.add_argument(
+        "--validate", metavar="LOG FILE", help="Compare against cantools on a log"
+    )
+    args = parser.parse_args()
+
+    database = cantools.database.load_file(args.dbc)
+    frame_ids = [message.frame_id for message in database.messages]
+    decoders = build_fast_decoders(database, frame_ids)
+
+    for message in database.messages:
+        if message.frame_id in decoders:
+            if args.show:
+                print(generate_decoder_source(message)[0])
+        else:
+            print(
+                f"{message.name} ({message.frame_id:#x}): not generated, uses cantools"
+            )
+
+    if args.validate:
+        checked, mismatches = validate_fast_decoders(database, decoders, args.validate)
+        for timestamp, frame_id, actual, expected in mismatches[:20]:
+            print(f"({timestamp:.6f}) {frame_id:#x}: {actual} != {expected}")
+        print(f"{checked} frames checked, {len(mismatches)} mismatches")
+        if mismatches:
+            exit(-1)
+
+
+if __name__ == "__main__":
+    main()
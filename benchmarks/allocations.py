@@ -0,0 +1,128 @@
+"""
+Per-frame memory allocation of the ingest and decode paths, measured with
+tracemalloc on a replayed log.
+
+Every frame of the log is replayed through CANFakeBus (as fast as possible,
+with the BMS acceptance filters) and handed to each stage on its own:
+
+    bus       CANFakeBus.recv, making the can.Message
+    listener  CANMessageListener.on_message_received
+    decode    the arbitration ID's decoder from the DISPATCH table, per ID
+    message   BMSData.process_bms_messages on one CANMessage (decoding, storing
+              and publishing a snapshot), per ID
+    batch     BMSData.process_bms_batch on drained batches of --batch-size frames
+
+For every stage it reports the bytes allocated while handling a frame that
+were still allocated at the peak (transient, averaged over frames), and the
+bytes still held afterwards (retained, e.g. by a history buffer). tracemalloc
+slows everything down a lot, so use benchmarks.suite for timings.
+
+Run from the repository root (the DBC has to be in the working directory):
+    python -m benchmarks.allocations [--file can_data.log] [--frames 20000]
+"""
+
+import argparse
+import tracemalloc
+
+from BMS_data_processing import DISPATCH, BMSData
+from BMS_dispatcher import BMSFILTERS, BMSLOOKUP
+from data_processing import CANMessage
+from parse import CANFakeBus, CANMessageListener
+
+DEFAULT_FRAMES = 20000
+DEFAULT_BATCH_SIZE = 1024
+
+
+class AllocationStats:
+    """Accumulates the transient and retained bytes of the frames of one stage"""
+
+    def __init__(self):
+        self.frames = 0
+        self.transient = 0
+        self.retained = 0
+
+    def measure(self, function, *args, frames=1):
+        """Call function(*args), counting its allocations against the given number of frames"""
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        result = function(*args)
+        current, peak = tracemalloc.get_traced_memory()
+        self.frames += frames
+        self.transient += peak - before
+        self.retained += current - before
+        return result
+
+    def row(self, name: str) -> str:
+        frames = max(self.frames, 1)
+        return f"{name:<24}{self.frames:>10}{self.transient / frames:>14.1f}{self.retained / frames:>14.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Per-frame allocations of the ingest and decode paths"
+    )
+    parser.add_argument(
+        "--file", default="can_data.log", help="Log or capture file to replay"
+    )
+    parser.add_argument("--frames", type=int, default=DEFAULT_FRAMES)
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    bus = CANFakeBus(args.file, speed=None)
+    bus.set_filters(BMSFILTERS)
+    listener = CANMessageListener(args.batch_size)
+    per_frame_data = BMSData()
+    batch_data = BMSData()
+    # warm up lazily built state (decoder caches, history buffers) outside of the measurement
+    for _ in range(args.batch_size):
+        message = bus.recv(1.0)
+        listener.on_message_received(message)
+        per_frame_data.process_bms_messages(
+            [CANMessage(message.arbitration_id, bytearray(message.data))]
+        )
+    batch_data.process_bms_batch(listener.drain())
+
+    stages = {
+        "bus": AllocationStats(),
+        "listener": AllocationStats(),
+        "batch": AllocationStats(),
+    }
+    decodes = {}
+    messages = {}
+    tracemalloc.start()
+    for _ in range(args.frames):
+        message = stages["bus"].measure(bus.recv, 1.0)
+        if message is None:
+            break
+
+        stages["listener"].measure(listener.on_message_received, message)
+        if listener.get_queue_depth() >= args.batch_size:
+            batch = listener.drain()
+            stages["batch"].measure(
+                batch_data.process_bms_batch, batch, frames=len(batch)
+            )
+
+        entry = DISPATCH.get(message.arbitration_id)
+        if entry is not None:
+            stats = decodes.setdefault(message.arbitration_id, AllocationStats())
+            stats.measure(entry[0], bytearray(message.data))
+        can_message = CANMessage(message.arbitration_id, bytearray(message.data))
+        stats = messages.setdefault(message.arbitration_id, AllocationStats())
+        stats.measure(per_frame_data.process_bms_messages, [can_message])
+    tracemalloc.stop()
+
+    print(f"{'bytes per frame':<24}{'frames':>10}{'transient':>14}{'retained':>14}")
+    for name, stats in stages.items():
+        print(stats.row(name))
+    for stage, by_id in (("decode", decodes), ("message", messages)):
+        for arbitration_id, stats in sorted(by_id.items()):
+            name = (
+                BMSLOOKUP[arbitration_id][1]
+                if arbitration_id in BMSLOOKUP
+                else f"{arbitration_id:#x}"
+            )
+            print(stats.row(f"{stage} {name}"))
+
+
+if __name__ == "__main__":
+    main()
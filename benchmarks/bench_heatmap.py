@@ -0,0 +1,128 @@
+"""
+Benchmark for heatmap redraws: time spent updating and repainting one
+Heatmap at 10, 50 and 100 Hz update rates. For the default 12x12 pack the
+model/view Heatmap is compared with the QTableWidget version it replaced;
+--layout benchmarks the Heatmap alone on another pack layout (e.g. the
+painted grid used for large packs).
+
+Each tick random-walks a fraction of the cells, like a live pack where
+only some cells report between redraws. Uses the offscreen Qt platform,
+so it runs headless. Run from the repository root:
+    python -m benchmarks.bench_heatmap [--seconds S] [--changed FRACTION] [--layout FILE]
+"""
+
+import argparse
+import os
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import numpy as np
+from PyQt5.QtCore import QEventLoop, QTimer
+from PyQt5.QtWidgets import QApplication, QTableWidget, QTableWidgetItem
+
+from heatmap import BLUE_COLOR, GRAY_COLOR, RED_COLOR, Heatmap
+from pack_layout import DEFAULT_LAYOUT, PackLayout
+
+TABLE_SIZE = 12
+
+RATES = (10, 50, 100)
+
+
+class TableWidgetHeatmap(Heatmap):
+    """The previous heatmap: a QTableWidget refilled with new items on every plot."""
+
+    def __init__(self, min_safe, max_safe, title, pack_layout=DEFAULT_LAYOUT):
+        super().__init__(min_safe, max_safe, title, pack_layout)
+        self.layout().removeWidget(self.view)
+        self.view.deleteLater()
+        self.view = QTableWidget(TABLE_SIZE, TABLE_SIZE)
+        self.layout().addWidget(self.view)
+
+    def plot(self, heatmapData):
+        for i in range(TABLE_SIZE):
+            for j in range(TABLE_SIZE):
+                value = heatmapData[i][j]
+                if np.isnan(value):
+                    item = QTableWidgetItem("N/A")
+                    item.setBackground(GRAY_COLOR)
+                else:
+                    item = QTableWidgetItem(f"{value:.3f}")
+                    if value > self.max_safe_value:
+                        item.setBackground(RED_COLOR)
+                    elif value < self.min_safe_value:
+                        item.setBackground(BLUE_COLOR)
+                self.view.setItem(i, j, item)
+
+
+def bench_rate(
+    heatmap, pack_layout, rate, seconds, changed_fraction, rng
+) -> np.ndarray:
+    """Drive plot() from a QTimer at the given rate; return per-update redraw times."""
+    values = rng.uniform(3.0, 4.2, size=pack_layout.num_cells).astype(np.float32)
+    durations = []
+    loop = QEventLoop()
+    timer = QTimer()
+    timer.setInterval(int(1000 / rate))
+
+    def tick():
+        changed = rng.random(values.shape) < changed_fraction
+        values[changed] += rng.normal(0, 0.05, size=changed.sum()).astype(np.float32)
+        start = time.perf_counter()
+        heatmap.plot(pack_layout.to_grid(values))
+        # let Qt repaint whatever the update invalidated, as it would in the app
+        QApplication.processEvents()
+        durations.append(time.perf_counter() - start)
+        if len(durations) >= rate * seconds:
+            timer.stop()
+            loop.quit()
+
+    timer.timeout.connect(tick)
+    timer.start()
+    loop.exec_()
+    return np.array(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Heatmap redraw benchmark")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--changed", type=float, default=0.25)
+    parser.add_argument("--layout", metavar="PACK LAYOUT FILE")
+    args = parser.parse_args()
+
+    app = QApplication([])
+    if args.layout is None:
+        pack_layout = DEFAULT_LAYOUT
+        heatmaps = (("table widget", TableWidgetHeatmap), ("model/view", Heatmap))
+    else:
+        pack_layout = PackLayout.from_file(args.layout)
+        heatmaps = (("heatmap", Heatmap),)
+
+    print(
+        f"{pack_layout.num_cells} cells on a {pack_layout.rows}x{pack_layout.columns} grid"
+    )
+    print(f"{'heatmap':<14}{'rate':>6}{'mean ms':>10}{'p95 ms':>10}{'busy %':>9}")
+    for name, heatmap_class in heatmaps:
+        heatmap = heatmap_class(3.0, 4.2, "Voltage", pack_layout)
+        heatmap.resize(800, 600)
+        heatmap.show()
+        app.processEvents()
+        for rate in RATES:
+            durations = bench_rate(
+                heatmap,
+                pack_layout,
+                rate,
+                args.seconds,
+                args.changed,
+                np.random.default_rng(0),
+            )
+            print(
+                f"{name:<14}{rate:>4}Hz{durations.mean() * 1e3:>10.3f}"
+                f"{np.percentile(durations, 95) * 1e3:>10.3f}"
+                f"{durations.sum() / (len(durations) / rate) * 100:>8.1f}%"
+            )
+        heatmap.close()
+
+
+if __name__ == "__main__":
+    main()
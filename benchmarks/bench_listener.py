@@ -0,0 +1,116 @@
+"""
+Microbenchmark for the CAN listener: frames/sec through the ring buffer
+CANMessageListener versus the queue.Queue based listener it replaced.
+
+Run from the repository root:
+    python -m benchmarks.bench_listener [--frames N]
+"""
+
+import argparse
+import threading
+import time
+from queue import Queue
+
+import can
+
+from data_processing import CANMessage
+from parse import CANMessageListener
+
+
+class QueueListener(can.Listener):
+    """The previous queue.Queue based listener, kept here as the reference point."""
+
+    def __init__(self, max_queue_size=16384):
+        self.messages = Queue(maxsize=max_queue_size)
+        self.overflow_count = 0
+
+    def on_message_received(self, msg: can.Message):
+        can_message = CANMessage(msg.arbitration_id, msg.data)
+        if not self.messages.full():
+            self.messages.put_nowait(can_message)
+        else:
+            self.overflow_count += 1
+            self.messages.get_nowait()
+            self.messages.put_nowait(can_message)
+
+    def drain(self):
+        messages = []
+        while not self.messages.empty():
+            messages.append(self.messages.get_nowait())
+        return messages
+
+
+def make_frames(count: int) -> list[can.Message]:
+    """A fixed mix of full CELLVALUE frames and short status frames."""
+    frames = []
+    for index in range(count):
+        if index % 150 < 144:
+            frame = can.Message(
+                timestamp=index * 1e-4,
+                arbitration_id=0x620,
+                data=bytes([index % 144 + 1, 0x10, 0x8C, 0x00, 0xFA, 0x00, 0, 0]),
+                is_extended_id=False,
+            )
+        else:
+            frame = can.Message(
+                timestamp=index * 1e-4,
+                arbitration_id=0x720,
+                data=bytes([0x9C, 0x40, 0x7D, 0x00, 5, 9]),
+                is_extended_id=False,
+            )
+        frames.append(frame)
+    return frames
+
+
+def bench_producer(listener, frames) -> float:
+    """Frames/sec through on_message_received alone, consumer idle."""
+    start = time.perf_counter()
+    for frame in frames:
+        listener.on_message_received(frame)
+    elapsed = time.perf_counter() - start
+    listener.drain()
+    return len(frames) / elapsed
+
+
+def bench_concurrent(listener, frames) -> float:
+    """Frames/sec with a producer thread and a consumer draining every millisecond."""
+    done = threading.Event()
+    received = 0
+
+    def consume():
+        nonlocal received
+        while not done.is_set():
+            received += len(listener.drain())
+            time.sleep(0.001)
+        received += len(listener.drain())
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    start = time.perf_counter()
+    for frame in frames:
+        listener.on_message_received(frame)
+    done.set()
+    consumer.join()
+    elapsed = time.perf_counter() - start
+    return received / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CAN listener microbenchmark")
+    parser.add_argument("--frames", type=int, default=200_000)
+    args = parser.parse_args()
+
+    frames = make_frames(args.frames)
+    print(f"{args.frames} frames")
+    print(f"{'listener':<12}{'producer only':>18}{'with consumer':>18}")
+    for name, listener_class in (
+        ("queue", QueueListener),
+        ("ring", CANMessageListener),
+    ):
+        producer = bench_producer(listener_class(), frames)
+        concurrent = bench_concurrent(listener_class(), frames)
+        print(f"{name:<12}{producer:>14,.0f} f/s{concurrent:>14,.0f} f/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Load test: runs the whole viewer (offscreen) on synthetic BMS traffic and steps
+the CELLVALUE rate up until the pipeline saturates. For every step it reports
+the offered and sustained frames/sec, the drop rate, and the queue and
+frame-to-pixel latencies measured by the pipeline metrics.
+
+A step counts as saturated when less than SATURATION_FRACTION of the offered
+frames are ingested, or more than MAX_DROP_RATE of them are dropped; the test
+stops after the first saturated step.
+
+Run from the repository root (the DBC has to be in the working directory):
+    python -m benchmarks.bench_load [--rates 1000 5000 20000] [--step-seconds 5] [--fault overvoltage]
+"""
+
+import argparse
+import os
+import sys
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QApplication
+
+from heatmapGUI import DEFAULT_MAX_FPS, HeatmapGUI
+from metrics import PipelineMetrics, report
+from pack_layout import DEFAULT_LAYOUT, PackLayout
+from traffic_generator import (
+    DEFAULT_STATUS_RATE,
+    FAULT_PATTERNS,
+    SyntheticBus,
+    TrafficGenerator,
+)
+
+DEFAULT_RATES = [1000, 2000, 5000, 10000, 20000, 50000, 100000, 200000]
+WARMUP_SECONDS = 1.0
+SATURATION_FRACTION = 0.9
+MAX_DROP_RATE = 0.01
+# BMSVINF, BMSTINF, BMSSTAT, PACKSTAT and CHARGEROUT, at the status rate
+STATUS_MESSAGES = 5
+
+
+class LoadTest:
+    """Drives the load steps from timers on the GUI thread, so the viewer runs undisturbed."""
+
+    def __init__(
+        self, bus: SyntheticBus, metrics: PipelineMetrics, rates, step_seconds
+    ):
+        self.bus = bus
+        self.metrics = metrics
+        self.rates = list(rates)
+        self.step_seconds = step_seconds
+        self.results = []
+
+    def start(self):
+        print(
+            f"{'offered/s':>12}{'delivered/s':>13}{'ingested/s':>12}{'drop %':>8}"
+            f"{'queue p99':>11}{'pixel p50':>11}{'pixel p99':>11}{'redraws/s':>11}"
+        )
+        self.next_step()
+
+    def next_step(self):
+        if not self.rates:
+            self.finish()
+            return
+        self.rate = self.rates.pop(0)
+        self.bus.set_cell_rate(self.rate)
+        QTimer.singleShot(int(WARMUP_SECONDS * 1000), self.begin_measurement)
+
+    def begin_measurement(self):
+        self.first = self.metrics.snapshot()
+        self.first_sent = self.bus.sent_count
+        QTimer.singleShot(int(self.step_seconds * 1000), self.end_measurement)
+
+    def end_measurement(self):
+        step = report(self.metrics.snapshot(), self.first)
+        offered = self.rate + STATUS_MESSAGES * self.bus.generator.status_rate
+        delivered = (self.bus.sent_count - self.first_sent) / step["interval_s"]
+        ingested = step["frames_per_s"]
+        dropped = step["drops"] / step["interval_s"]
+        drop_rate = dropped / (ingested + dropped) if ingested + dropped else 0.0
+        latency = step["latency"]
+        saturated = (
+            ingested < SATURATION_FRACTION * offered or drop_rate > MAX_DROP_RATE
+        )
+
+        def ms(value):
+            return "-" if value is None else f"{value:.1f}"
+
+        print(
+            f"{offered:>12,.0f}{delivered:>13,.0f}{ingested:>12,.0f}{drop_rate * 100:>8.2f}"
+            f"{ms(latency['queue']['p99_ms']):>11}{ms(latency['frame_to_pixel']['p50_ms']):>11}"
+            f"{ms(latency['frame_to_pixel']['p99_ms']):>11}{step['redraws_per_s']:>11.1f}"
+            + ("  saturated" if saturated else "")
+        )
+        sys.stdout.flush()
+        self.results.append((offered, ingested, drop_rate, saturated))
+        if saturated:
+            self.rates = []
+        self.next_step()
+
+    def finish(self):
+        sustained = [
+            ingested for _, ingested, _, saturated in self.results if not saturated
+        ]
+        if sustained:
+            print(f"Highest sustained rate: {max(sustained):,.0f} frames/s")
+        else:
+            print("Saturated at the lowest rate")
+        sys.stdout.flush()
+        QApplication.quit()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Viewer load test on synthetic traffic"
+    )
+    parser.add_argument("--rates", type=float, nargs="+", default=DEFAULT_RATES)
+    parser.add_argument("--step-seconds", type=float, default=5.0)
+    parser.add_argument("--status-rate", type=float, default=DEFAULT_STATUS_RATE)
+    parser.add_argument("--fault", choices=FAULT_PATTERNS, default="none")
+    parser.add_argument("--max-fps", type=float, default=DEFAULT_MAX_FPS)
+    parser.add_argument("--layout", metavar="PACK LAYOUT FILE")
+    args = parser.parse_args()
+
+    pack_layout = (
+        DEFAULT_LAYOUT if args.layout is None else PackLayout.from_file(args.layout)
+    )
+    app = QApplication([])
+    metrics = PipelineMetrics()
+    bus = SyntheticBus(
+        TrafficGenerator(
+            pack_layout.num_cells, args.rates[0], args.status_rate, args.fault, seed=0
+        )
+    )
+    gui = HeatmapGUI(
+        {"synthetic": bus},
+        max_fps=args.max_fps,
+        pack_layout=pack_layout,
+        metrics=metrics,
+    )
+    print(
+        f"{pack_layout.num_cells} cells, {args.step_seconds:g}s per step, fault pattern {args.fault}"
+    )
+    load_test = LoadTest(bus, metrics, args.rates, args.step_seconds)
+    QTimer.singleShot(0, load_test.start)
+    app.exec_()
+    gui.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark for parallel offline decoding: frames/sec of decode_parallel on a
+synthetic multi-million-frame candump -L log, for an increasing number of
+worker processes, checking every run against the single-process result.
+
+Run from the repository root (the DBC has to be in the working directory):
+    python -m benchmarks.bench_parallel_decode [--frames N] [--workers 1 2 4 8]
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from parallel_decode import decode_parallel
+
+# cells 1-144 every cycle, then one frame of each other BMS message
+CELLS = 144
+OTHER_FRAMES = [
+    "220#0100000000",
+    "720#9C407D000509",
+    "721#C201E2FF6307",
+    "180#0E1000640123",
+    "405#0E1000320300",
+]
+
+
+def write_synthetic_log(path: str, frames: int, seed=0) -> None:
+    """Write a candump -L log of the given number of frames, 0.1 ms apart."""
+    rng = np.random.default_rng(seed)
+    voltages = rng.integers(30000, 42000, frames).tolist()
+    temperatures = rng.integers(0, 600, frames).tolist()
+    cycle = CELLS + len(OTHER_FRAMES)
+    with open(path, "w") as f:
+        lines = []
+        for index in range(frames):
+            position = index % cycle
+            if position < CELLS:
+                payload = (
+                    (
+                        (position + 1).to_bytes(2, "little")
+                        + voltages[index].to_bytes(2, "little")
+                        + temperatures[index].to_bytes(2, "little")
+                    )
+                    .hex()
+                    .upper()
+                )
+                frame = f"620#{payload}"
+            else:
+                frame = OTHER_FRAMES[position - CELLS]
+            lines.append(f"({1700000000 + index * 1e-4:.6f}) can0 {frame}\n")
+            if len(lines) == 100_000:
+                f.writelines(lines)
+                lines = []
+        f.writelines(lines)
+
+
+def same_results(first: dict, second: dict) -> bool:
+    return all(
+        np.array_equal(first[stream][name], second[stream][name], equal_nan=True)
+        for stream in first
+        for name in first[stream]
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel decoding benchmark")
+    parser.add_argument("--frames", type=int, default=2_000_000)
+    parser.add_argument(
+        "--workers", type=int, nargs="+", default=sorted({1, 2, 4, os.cpu_count() or 1})
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        log = os.path.join(directory, "synthetic.log")
+        start = time.perf_counter()
+        write_synthetic_log(log, args.frames)
+        print(
+            f"{args.frames} frames, {os.path.getsize(log) / 1e6:.0f} MB log "
+            f"written in {time.perf_counter() - start:.1f}s ({os.cpu_count()} CPUs)"
+        )
+
+        print(
+            f"{'workers':<10}{'seconds':>10}{'frames/sec':>14}{'speedup':>10}  identical"
+        )
+        reference = None
+        baseline = None
+        for workers in args.workers:
+            start = time.perf_counter()
+            decoded, frames = decode_parallel(log, workers)
+            elapsed = time.perf_counter() - start
+            if reference is None:
+                reference, baseline = decoded, elapsed
+            print(
+                f"{workers:<10}{elapsed:>10.2f}{frames / elapsed:>14,.0f}"
+                f"{baseline / elapsed:>9.2f}x  {same_results(reference, decoded)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,347 @@
+"""
+Benchmark suite for the decode, ingest and render hot paths, with regression
+checking against a stored baseline.
+
+Every benchmark runs on fixed synthetic input (seeded traffic from
+traffic_generator.py) and needs no CAN hardware; the widget benchmarks use
+the offscreen Qt platform. A benchmark is timed REPEAT times, each sample
+running it for at least MIN_SAMPLE_SECONDS, and the fastest sample counts, as
+the least disturbed by the rest of the machine.
+
+Results are compared against benchmarks/baseline.json: a benchmark more than
+--threshold slower per operation than its baseline is a regression, and the
+suite exits with status 1. Baselines only mean something on the machine they
+were recorded on; record a new one with --update-baseline.
+
+Run from the repository root (the DBC has to be in the working directory):
+    python -m benchmarks.suite [--filter NAME] [--threshold 0.2] [--output results.json]
+    python -m benchmarks.suite --update-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+import can
+import numpy as np
+from PyQt5.QtWidgets import QApplication
+
+from BMS_data_processing import BMSData
+from BMS_dispatcher import CELLVALUE_HEX, decode_cell_value, decode_cell_value_batch
+from capture import CaptureWriter
+from convert import write_log
+from data_processing import CANBatch, CANMessage
+from heatmap import Heatmap
+from pack_layout import DEFAULT_LAYOUT, PackLayout
+from parse import PAYLOAD_SIZE, CANFakeBus, CANMessageListener
+from traffic_generator import TrafficGenerator
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_THRESHOLD = 0.2
+REPEAT = 7
+# every timed sample repeats the benchmark until it takes at least this long
+MIN_SAMPLE_SECONDS = 0.2
+SEED = 0
+# 10 s of traffic from a 144 cell pack at 2000 CELLVALUE frames/s, plus status messages
+TRAFFIC_SECONDS = 10.0
+TRAFFIC_RATE = 2000.0
+LARGE_LAYOUT = PackLayout(cells_per_module=48, module_count=10, modules_per_row=2)
+HEATMAP_UPDATES = 200
+
+BENCHMARKS = {}
+
+
+def benchmark(name: str):
+    """
+    Register a benchmark. The decorated function prepares its input and returns
+    (run, operations): a function doing the timed work, and how many operations
+    (frames, messages, redraws...) one call of it performs.
+    """
+
+    def register(function):
+        BENCHMARKS[name] = function
+        return function
+
+    return register
+
+
+def synthetic_frames() -> list[tuple[float, int, bytes]]:
+    generator = TrafficGenerator(
+        DEFAULT_LAYOUT.num_cells, TRAFFIC_RATE, seed=SEED, start_time=1_700_000_000.0
+    )
+    return generator.generate(TRAFFIC_SECONDS)
+
+
+def synthetic_batch(frames) -> CANBatch:
+    return CANBatch(
+        np.array([arbitration_id for _, arbitration_id, _ in frames], dtype=np.uint32),
+        np.array([timestamp for timestamp, _, _ in frames], dtype=np.float64),
+        np.array([len(data) for _, _, data in frames], dtype=np.uint8),
+        np.frombuffer(
+            b"".join(data.ljust(PAYLOAD_SIZE, b"\x00") for _, _, data in frames),
+            dtype=np.uint8,
+        ).reshape(-1, PAYLOAD_SIZE),
+    )
+
+
+### DECODE ###
+
+
+@benchmark("decode_cell_value")
+def bench_decode_cell_value():
+    payloads = [
+        data
+        for _, arbitration_id, data in synthetic_frames()
+        if arbitration_id == CELLVALUE_HEX
+    ]
+
+    def run():
+        for data in payloads:
+            decode_cell_value(bytearray(data))
+
+    return run, len(payloads)
+
+
+@benchmark("decode_cell_value_batch")
+def bench_decode_cell_value_batch():
+    batch = synthetic_batch(synthetic_frames())
+    payloads = batch.payloads[batch.arbitration_ids == CELLVALUE_HEX]
+
+    def run():
+        decode_cell_value_batch(payloads)
+
+    return run, len(payloads)
+
+
+@benchmark("process_bms_messages")
+def bench_process_bms_messages():
+    messages = [
+        CANMessage(arbitration_id, bytearray(payload))
+        for _, arbitration_id, payload in synthetic_frames()
+    ]
+    data = BMSData()
+
+    def run():
+        data.process_bms_messages(messages)
+
+    return run, len(messages)
+
+
+@benchmark("process_bms_batch")
+def bench_process_bms_batch():
+    batch = synthetic_batch(synthetic_frames())
+    data = BMSData()
+
+    def run():
+        data.process_bms_batch(batch)
+
+    return run, len(batch)
+
+
+### INGEST ###
+
+
+@benchmark("listener_on_message_received")
+def bench_listener():
+    messages = [
+        can.Message(
+            timestamp=timestamp,
+            arbitration_id=arbitration_id,
+            data=data,
+            is_extended_id=False,
+        )
+        for timestamp, arbitration_id, data in synthetic_frames()
+    ]
+    listener = CANMessageListener(len(messages))
+
+    def run():
+        for message in messages:
+            listener.on_message_received(message)
+        listener.drain()
+
+    return run, len(messages)
+
+
+def bench_fake_bus(suffix, write):
+    frames = synthetic_frames()
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, f"synthetic{suffix}")
+    write(((*frame, 0) for frame in frames), path)
+    bus = CANFakeBus(path, speed=None)
+
+    def run():
+        for _ in range(len(frames)):
+            bus.next_msg()
+
+    return run, len(frames)
+
+
+def write_capture(frames, path):
+    with CaptureWriter(path) as writer:
+        for timestamp, arbitration_id, data, channel in frames:
+            writer.write_frame(timestamp, arbitration_id, data, channel)
+
+
+@benchmark("fake_bus_next_msg_log")
+def bench_fake_bus_log():
+    return bench_fake_bus(".log", write_log)
+
+
+@benchmark("fake_bus_next_msg_capture")
+def bench_fake_bus_capture():
+    return bench_fake_bus(".bmscap", write_capture)
+
+
+### RENDER ###
+
+
+def bench_heatmap(pack_layout):
+    heatmap = Heatmap(3.0, 4.2, "Voltage", pack_layout)
+    heatmap.resize(800, 600)
+    heatmap.show()
+    QApplication.processEvents()
+    rng = np.random.default_rng(SEED)
+    grids = [
+        pack_layout.to_grid(
+            rng.uniform(3.0, 4.2, pack_layout.num_cells).astype(np.float32)
+        )
+        for _ in range(HEATMAP_UPDATES)
+    ]
+
+    def run():
+        for grid in grids:
+            heatmap.plot(grid)
+            # let Qt repaint whatever the update invalidated, as it would in the app
+            QApplication.processEvents()
+
+    return run, len(grids)
+
+
+@benchmark("heatmap_plot_144")
+def bench_heatmap_default():
+    return bench_heatmap(DEFAULT_LAYOUT)
+
+
+@benchmark("heatmap_plot_480")
+def bench_heatmap_large():
+    return bench_heatmap(LARGE_LAYOUT)
+
+
+### RUNNER ###
+
+
+def run_benchmark(function, repeat: int) -> dict:
+    run, operations = function()
+    # warm up caches and lazily built state, and find how many calls make a long enough sample
+    start = time.perf_counter()
+    run()
+    calls = max(1, int(np.ceil(MIN_SAMPLE_SECONDS / (time.perf_counter() - start))))
+    operations *= calls
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(calls):
+            run()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {
+        "operations": operations,
+        "ns_per_op": best / operations * 1e9,
+        "ops_per_sec": operations / best,
+        "median_ns_per_op": float(np.median(times)) / operations * 1e9,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Names of the benchmarks more than threshold slower than their baseline"""
+    return [
+        name
+        for name, result in results.items()
+        if name in baseline
+        and result["ns_per_op"] > baseline[name]["ns_per_op"] * (1 + threshold)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Decode, ingest and render benchmark suite"
+    )
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help="Allowed slowdown per operation before a regression, e.g. 0.2 for 20%%",
+    )
+    parser.add_argument(
+        "--baseline", default=BASELINE, help="Baseline JSON to compare against"
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Store the results as the new baseline instead of comparing",
+    )
+    parser.add_argument(
+        "--output", metavar="FILE", help="Also save the results to this JSON file"
+    )
+    args = parser.parse_args()
+
+    baseline = {}
+    if not args.update_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    app = QApplication([])
+    results = {}
+    print(f"{'benchmark':<30}{'ns/op':>12}{'ops/sec':>14}{'baseline':>12}{'change':>9}")
+    for name, function in BENCHMARKS.items():
+        if args.filter and args.filter not in name:
+            continue
+        result = run_benchmark(function, args.repeat)
+        results[name] = result
+        line = f"{name:<30}{result['ns_per_op']:>12,.0f}{result['ops_per_sec']:>14,.0f}"
+        if name in baseline:
+            reference = baseline[name]["ns_per_op"]
+            change = result["ns_per_op"] / reference - 1
+            line += f"{reference:>12,.0f}{change * 100:>+8.1f}%"
+            if change > args.threshold:
+                line += "  REGRESSION"
+        print(line)
+        sys.stdout.flush()
+
+    document = {
+        "machine": {
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(
+            f"{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}"
+        )
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Periodic transmit timing: the TransmitScheduler against the send-then-sleep
+loop it replaced, both sending to a virtual bus whose send takes --send-ms.
+
+For each it reports the number of sends, the mean interval between them and
+how far the last send drifted from where a perfect schedule would have put it,
+plus the scheduler's own lateness and missed-deadline stats.
+
+Run from the repository root:
+    python -m benchmarks.transmit [--seconds 10] [--period 0.1] [--send-ms 5]
+"""
+
+import argparse
+import asyncio
+import time
+
+import can
+
+from BMS_dispatcher import encode_polling
+from transmit import TransmitScheduler, format_transmit_stats, to_can_message
+
+
+class SlowParser:
+    """Sends to a virtual bus, taking send_seconds per send, and keeps the send times"""
+
+    def __init__(self, send_seconds: float):
+        self.bus = can.Bus(interface="virtual", channel="transmit-benchmark")
+        self.send_seconds = send_seconds
+        self.sent = []
+
+    def send(self, message: can.Message):
+        self.sent.append(time.monotonic())
+        time.sleep(self.send_seconds)
+        self.bus.send(message)
+
+
+async def sleep_loop(
+    parser: SlowParser, message: can.Message, period: float, seconds: float
+):
+    """The previous polling loop: send, then sleep a period"""
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        parser.send(message)
+        await asyncio.sleep(period)
+
+
+async def scheduled(
+    parser: SlowParser, message: can.Message, period: float, seconds: float
+) -> str:
+    scheduler = TransmitScheduler()
+    scheduler.add("poll", parser, message, period)
+    task = asyncio.create_task(scheduler.run())
+    await asyncio.sleep(seconds)
+    stats = format_transmit_stats(scheduler.stats())
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    return stats
+
+
+def row(name: str, sent: list[float], period: float) -> str:
+    intervals = [later - earlier for earlier, later in zip(sent, sent[1:])]
+    mean = sum(intervals) / len(intervals) if intervals else 0.0
+    drift = sent[-1] - sent[0] - (len(sent) - 1) * period if sent else 0.0
+    return f"{name:<16}{len(sent):>8}{mean * 1000:>18.3f}{drift * 1000:>14.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Periodic transmit timing")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--period", type=float, default=0.1)
+    parser.add_argument("--send-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    message = to_can_message(encode_polling())
+    loop_parser = SlowParser(args.send_ms / 1000)
+    asyncio.run(sleep_loop(loop_parser, message, args.period, args.seconds))
+    scheduler_parser = SlowParser(args.send_ms / 1000)
+    stats = asyncio.run(scheduled(scheduler_parser, message, args.period, args.seconds))
+    loop_parser.bus.shutdown()
+    scheduler_parser.bus.shutdown()
+
+    print(f"{'':<16}{'sends':>8}{'mean interval ms':>18}{'drift ms':>14}")
+    print(row("sleep loop", loop_parser.sent, args.period))
+    print(row("scheduler", scheduler_parser.sent, args.period))
+    print()
+    print(stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Headless BMS log analysis.
+
+Decodes a recorded candump -L log (or binary capture file) as fast as the CPU allows, using the same
+decoders as the viewer, and prints per-cell voltage/temperature statistics,
+fault timelines and pack statistics along with the decode throughput.
+Nothing here imports PyQt5, so it starts quickly on machines without a display.
+With --at, it instead prints the complete pack state at one moment, using the
+state index of the recording (built on first use, see state_index.py).
+
+    python bms_cli.py can_data.log|capture.bmscap [--layout FILE] [--json OUT]
+    python bms_cli.py can_data.log --at 14:03:12
+"""
+
+### IMPORTS ###
+import argparse
+import datetime
+import json
+import time
+
+import numpy as np
+
+from BMS_dispatcher import BMSLOOKUP, CELLVALUE_HEX, decode_cell_value_batch
+from capture import capture_batches, is_capture_file
+from data_processing import CANBatch
+from pack_layout import DEFAULT_LAYOUT, PackLayout
+from parse import read_log_batches
+from state_index import PackState, StateIndex, parse_time
+
+
+class RunningStats:
+    """Count, min, max and mean of a stream of scalar samples."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "min": self.minimum,
+            "max": self.maximum,
+            "mean": self.total / self.count if self.count else None,
+        }
+
+
+class LogSummary:
+    """
+    Accumulates statistics over decoded BMS messages, batch by batch.
+    Per-cell values are kept in preallocated arrays sized by the pack layout;
+    fault timelines record when each fault (BMSSTAT) or charger error
+    (CHARGEROUT) was raised and cleared.
+    """
+
+    def __init__(self, layout: PackLayout = DEFAULT_LAYOUT):
+        self.layout = layout
+        num_cells = layout.num_cells
+        self.cell_samples = np.zeros(num_cells, dtype=np.int64)
+        self.voltage_sum = np.zeros(num_cells, dtype=np.float64)
+        self.voltage_min = np.full(num_cells, np.inf)
+        self.voltage_max = np.full(num_cells, -np.inf)
+        self.temperature_sum = np.zeros(num_cells, dtype=np.float64)
+        self.temperature_min = np.full(num_cells, np.inf)
+        self.temperature_max = np.full(num_cells, -np.inf)
+        self.ignored_cell_count = 0
+
+        self.pack_stats = {
+            name: RunningStats()
+            for name in (
+                "pack_voltage",
+                "pack_current",
+                "pack_power",
+                "charger_voltage",
+                "charger_current",
+            )
+        }
+        self.active_faults = set()
+        self.fault_timeline = []
+        self.frame_count = 0
+        self.decoded_count = 0
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def add_batch(self, batch: CANBatch) -> None:
+        if len(batch) == 0:
+            return
+        self.frame_count += len(batch)
+        if self.first_timestamp is None:
+            self.first_timestamp = float(batch.timestamps[0])
+        self.last_timestamp = float(batch.timestamps[-1])
+
+        is_cell_value = batch.arbitration_ids == CELLVALUE_HEX
+        if is_cell_value.any():
+            self.add_cell_values(batch.payloads[is_cell_value])
+
+        for row in np.flatnonzero(~is_cell_value).tolist():
+            arbitration_id = int(batch.arbitration_ids[row])
+            if arbitration_id not in BMSLOOKUP:
+                continue
+            decoder, message_type = BMSLOOKUP[arbitration_id]
+            data = bytearray(batch.payloads[row, : batch.dlcs[row]])
+            self.add_message(
+                float(batch.timestamps[row]), message_type, decoder(data).values
+            )
+            self.decoded_count += 1
+
+    def add_cell_values(self, payloads: np.ndarray) -> None:
+        cell_numbers, voltages, temperatures = decode_cell_value_batch(payloads)
+        valid = (cell_numbers >= 1) & (cell_numbers <= self.layout.num_cells)
+        self.ignored_cell_count += int((~valid).sum())
+        self.decoded_count += int(valid.sum())
+        cells = cell_numbers[valid] - 1
+        voltages = voltages[valid]
+        temperatures = temperatures[valid]
+
+        num_cells = self.layout.num_cells
+        self.cell_samples += np.bincount(cells, minlength=num_cells)
+        self.voltage_sum += np.bincount(cells, weights=voltages, minlength=num_cells)
+        self.temperature_sum += np.bincount(
+            cells, weights=temperatures, minlength=num_cells
+        )
+        np.minimum.at(self.voltage_min, cells, voltages)
+        np.maximum.at(self.voltage_max, cells, voltages)
+        np.minimum.at(self.temperature_min, cells, temperatures)
+        np.maximum.at(self.temperature_max, cells, temperatures)
+
+    def add_message(self, timestamp: float, message_type: str, values: dict) -> None:
+        match message_type:
+            case "BMSSTAT":
+                self.update_faults(timestamp, "BMS", set(values["faults"]))
+            case "CHARGEROUT":
+                self.update_faults(timestamp, "Charger", set(values["status_errors"]))
+                self.pack_stats["charger_voltage"].add(values["charger_voltage"])
+                self.pack_stats["charger_current"].add(values["charger_current"])
+            case "PACKSTAT":
+                for name in ("pack_voltage", "pack_current", "pack_power"):
+                    self.pack_stats[name].add(values[name])
+
+    def update_faults(self, timestamp: float, source: str, faults: set) -> None:
+        """Record which faults of one source were raised or cleared since its last message"""
+        previous = {fault for fault in self.active_faults if fault[0] == source}
+        current = {(source, fault) for fault in faults}
+        for fault in sorted(current - previous):
+            self.fault_timeline.append((timestamp, fault[0], fault[1], "raised"))
+        for fault in sorted(previous - current):
+            self.fault_timeline.append((timestamp, fault[0], fault[1], "cleared"))
+        self.active_faults = (self.active_faults - previous) | current
+
+    def cell_table(self) -> list[dict]:
+        """Per-cell statistics, one dict per cell in cell number order"""
+        cells = []
+        for index in range(self.layout.num_cells):
+            samples = int(self.cell_samples[index])
+            if samples == 0:
+                cells.append({"cell": index + 1, "samples": 0})
+                continue
+            cells.append(
+                {
+                    "cell": index + 1,
+                    "samples": samples,
+                    "voltage_min": float(self.voltage_min[index]),
+                    "voltage_max": float(self.voltage_max[index]),
+                    "voltage_mean": float(self.voltage_sum[index] / samples),
+                    "temperature_min": float(self.temperature_min[index]),
+                    "temperature_max": float(self.temperature_max[index]),
+                    "temperature_mean": float(self.temperature_sum[index] / samples),
+                }
+            )
+        return cells
+
+    def as_dict(self) -> dict:
+        return {
+            "frames": self.frame_count,
+            "decoded": self.decoded_count,
+            "ignored_cell_frames": self.ignored_cell_count,
+            "start": self.first_timestamp,
+            "end": self.last_timestamp,
+            "cells": self.cell_table(),
+            "pack": {name: stats.as_dict() for name, stats in self.pack_stats.items()},
+            "faults": [
+                {"time": timestamp, "source": source, "fault": fault, "event": event}
+                for timestamp, source, fault, event in self.fault_timeline
+            ],
+        }
+
+
+def summarise_log(
+    can_data_file: str, layout: PackLayout = DEFAULT_LAYOUT
+) -> tuple[LogSummary, float]:
+    """Decode a whole log; returns the summary and the time it took in seconds"""
+    summary = LogSummary(layout)
+    start = time.perf_counter()
+    if is_capture_file(can_data_file):
+        batches = capture_batches(can_data_file)
+    else:
+        batches = read_log_batches(can_data_file)
+    for batch in batches:
+        summary.add_batch(batch)
+    return summary, time.perf_counter() - start
+
+
+def format_value(value, unit: str, digits: int) -> str:
+    return "None" if value is None else f"{value:.{digits}f}{unit}"
+
+
+def print_summary(summary: LogSummary, elapsed: float) -> None:
+    print(
+        f"{summary.frame_count} frames ({summary.decoded_count} decoded) in {elapsed:.2f}s: "
+        f"{summary.frame_count / elapsed if elapsed else 0:,.0f} frames/sec"
+    )
+    if summary.first_timestamp is not None:
+        print(
+            f"Log covers {summary.last_timestamp - summary.first_timestamp:.1f}s "
+            f"from {summary.first_timestamp:.6f}"
+        )
+    if summary.ignored_cell_count:
+        print(
+            f"{summary.ignored_cell_count} CELLVALUE frames outside the pack layout ignored"
+        )
+
+    print()
+    print(
+        f"{'Cell':<14}{'Samples':>8}{'V min':>9}{'V max':>9}{'V mean':>9}"
+        f"{'T min':>9}{'T max':>9}{'T mean':>9}"
+    )
+    for cell in summary.cell_table():
+        label = summary.layout.describe_cell(cell["cell"])
+        if cell["samples"] == 0:
+            print(f"{label:<14}{0:>8}{'no data':>9}")
+            continue
+        print(
+            f"{label:<14}{cell['samples']:>8}"
+            f"{cell['voltage_min']:>9.3f}{cell['voltage_max']:>9.3f}{cell['voltage_mean']:>9.3f}"
+            f"{cell['temperature_min']:>9.1f}{cell['temperature_max']:>9.1f}"
+            f"{cell['temperature_mean']:>9.1f}"
+        )
+
+    print()
+    print("Pack statistics")
+    units = {"voltage": "V", "current": "A", "power": "W"}
+    for name, stats in summary.pack_stats.items():
+        unit = units[name.split("_")[1]]
+        print(
+            f"  {name:<16} min {format_value(stats.minimum, unit, 3):>10}  "
+            f"max {format_value(stats.maximum, unit, 3):>10}  "
+            f"mean {format_value(stats.as_dict()['mean'], unit, 3):>10}  ({stats.count} samples)"
+        )
+
+    print()
+    print("Fault timeline")
+    if not summary.fault_timeline:
+        print("  no faults")
+    for timestamp, source, fault, event in summary.fault_timeline:
+        print(f"  ({timestamp:.6f}) {source:<8}{fault:<26}{event}")
+
+
+def print_state(state: PackState, first_timestamp: float, layout: PackLayout) -> None:
+    clock = datetime.datetime.fromtimestamp(state.timestamp).strftime("%H:%M:%S.%f")
+    print(
+        f"Pack state at {clock} ({state.timestamp - first_timestamp:.3f}s into the log)"
+    )
+    print()
+    print(f"{'Cell':<14}{'Voltage':>9}{'Temp':>8}{'Age':>10}")
+    voltages, temperatures, updated = state.cell_values(layout.num_cells)
+    for index in range(layout.num_cells):
+        label = layout.describe_cell(index + 1)
+        if np.isnan(updated[index]):
+            print(f"{label:<14}{'no data':>9}")
+            continue
+        print(
+            f"{label:<14}{voltages[index]:>9.3f}{temperatures[index]:>8.1f}"
+            f"{state.timestamp - updated[index]:>9.2f}s"
+        )
+
+    print()
+    for message_type, (timestamp, values) in state.decoded_messages().items():
+        print(f"{message_type:<12}({state.timestamp - timestamp:.2f}s ago) {values}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless BMS log analysis")
+    parser.add_argument(
+        "file",
+        metavar="CAN DATA FILE",
+        help="candump -L log or capture file to analyse",
+    )
+    parser.add_argument("--layout", metavar="PACK LAYOUT FILE")
+    parser.add_argument(
+        "--json", metavar="OUTPUT FILE", help="Also write the summary as JSON"
+    )
+    parser.add_argument(
+        "--at",
+        metavar="TIME",
+        help="Print the pack state at a local clock time (HH:MM:SS) or seconds into the log",
+    )
+    args = parser.parse_args()
+
+    layout = (
+        DEFAULT_LAYOUT if args.layout is None else PackLayout.from_file(args.layout)
+    )
+    if args.at is not None:
+        try:
+            index = StateIndex(args.file)
+        except OSError:
+            print(f"Error: Invalid path provided for supplied CAN data: {args.file}")
+            exit(-1)
+        try:
+            timestamp = parse_time(args.at, index.first_timestamp)
+        except ValueError:
+            print(f"Error: Invalid time provided for --at: {args.at}")
+            exit(-1)
+        if not index.first_timestamp <= timestamp <= index.last_timestamp:
+            print(
+                f"Error: --at {args.at} is out of range: the log runs from 0s to "
+                f"{index.last_timestamp - index.first_timestamp:.3f}s"
+            )
+            exit(-1)
+        state = index.state_at(timestamp)
+        print_state(state, index.first_timestamp, layout)
+        return
+    try:
+        summary, elapsed = summarise_log(args.file, layout)
+    except OSError:
+        print(f"Error: Invalid path provided for supplied CAN data: {args.file}")
+        exit(-1)
+
+    print_summary(summary, elapsed)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(summary.as_dict(), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
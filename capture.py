@@ -0,0 +1,152 @@
+"""
+Compact binary capture format for recorded CAN sessions.
+
+A capture file is a 16 byte header followed by fixed size 24 byte records,
+one per frame:
+
+    timestamp       float64, seconds (little endian)
+    arbitration_id  uint32
+    channel         uint8, the bus number (can0 -> 0, PCAN_USBBUS1 -> 1)
+    dlc             uint8
+    (2 bytes of padding)
+    payload         8 x uint8, zero padded past the DLC
+
+Because every record has the same size, a capture can be memory mapped and
+used as a NumPy structured array without parsing or copying anything, and
+record N always lives at HEADER_SIZE + N * CAPTURE_DTYPE.itemsize.
+Frames are appended in the order they were received, so timestamps are
+expected to be non-decreasing.
+
+Convert to and from candump -L logs and CSV files with convert.py.
+"""
+
+### IMPORTS ###
+import re
+
+import can
+import numpy as np
+
+from data_processing import CANBatch
+
+### CONSTANTS ###
+CAPTURE_MAGIC = b"BMSCAP\x00\x01"
+HEADER_SIZE = 16
+CAPTURE_SUFFIX = ".bmscap"
+CAPTURE_DTYPE = np.dtype(
+    [
+        ("timestamp", "<f8"),
+        ("arbitration_id", "<u4"),
+        ("channel", "u1"),
+        ("dlc", "u1"),
+        ("padding", "u1", (2,)),
+        ("payload", "u1", (8,)),
+    ]
+)
+WRITE_BUFFER_RECORDS = 4096
+CHANNEL_NUMBER = re.compile(r"(\d+)$")
+
+
+def channel_number(channel) -> int:
+    """Bus number of a python-can channel: its trailing digits ("can1", "PCAN_USBBUS1" -> 1), else 0."""
+    if isinstance(channel, int):
+        return channel
+    match = CHANNEL_NUMBER.search(str(channel or ""))
+    return int(match.group(1)) if match else 0
+
+
+def is_capture_file(path: str) -> bool:
+    """Check whether a file starts with the capture header"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(CAPTURE_MAGIC)) == CAPTURE_MAGIC
+    except OSError:
+        return False
+
+
+def read_capture(path: str) -> np.ndarray:
+    """
+    Memory map a capture file as a read-only CAPTURE_DTYPE array. Nothing is read
+    until it's accessed, so opening even very large captures is instant.
+    """
+    with open(path, "rb") as f:
+        if f.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a BMS capture file")
+    return np.memmap(path, dtype=CAPTURE_DTYPE, mode="r", offset=HEADER_SIZE)
+
+
+def capture_batches(path: str, batch_size=65536):
+    """Read a capture file as a sequence of CANBatch objects of batch_size frames each."""
+    records = read_capture(path)
+    for start in range(0, len(records), batch_size):
+        chunk = records[start : start + batch_size]
+        yield CANBatch(
+            chunk["arbitration_id"],
+            chunk["timestamp"],
+            chunk["dlc"],
+            chunk["payload"],
+        )
+
+
+class CaptureWriter(can.Listener):
+    """
+    Writes frames to a capture file. Frames are buffered in a preallocated
+    record array and written out WRITE_BUFFER_RECORDS at a time; call stop()
+    (or use it as a context manager) to flush the rest.
+    Usable as a can.Listener, or fed whole CANBatch objects with write_batch.
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.file = open(path, "ab" if append else "wb")
+        if self.file.tell() == 0:
+            self.file.write(CAPTURE_MAGIC.ljust(HEADER_SIZE, b"\x00"))
+        self.buffer = np.zeros(WRITE_BUFFER_RECORDS, dtype=CAPTURE_DTYPE)
+        self.buffered = 0
+        self.record_count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def write_frame(
+        self, timestamp: float, arbitration_id: int, data: bytes, channel: int = 0
+    ) -> None:
+        record = self.buffer[self.buffered]
+        record["timestamp"] = timestamp
+        record["arbitration_id"] = arbitration_id
+        record["channel"] = channel
+        record["dlc"] = len(data)
+        record["payload"] = np.frombuffer(bytes(data).ljust(8, b"\x00"), dtype=np.uint8)
+        self.buffered += 1
+        if self.buffered == WRITE_BUFFER_RECORDS:
+            self.flush()
+
+    def on_message_received(self, msg: can.Message) -> None:
+        self.write_frame(
+            msg.timestamp, msg.arbitration_id, msg.data[:8], channel_number(msg.channel)
+        )
+
+    def write_batch(self, batch: CANBatch, channel: int = 0) -> None:
+        """Write a whole batch of frames at once, bypassing the buffer"""
+        self.flush()
+        records = np.zeros(len(batch), dtype=CAPTURE_DTYPE)
+        records["timestamp"] = batch.timestamps
+        records["arbitration_id"] = batch.arbitration_ids
+        records["channel"] = channel
+        records["dlc"] = batch.dlcs
+        records["payload"] = batch.payloads
+        records.tofile(self.file)
+        self.record_count += len(records)
+
+    def flush(self) -> None:
+        if self.buffered:
+            self.buffer[: self.buffered].tofile(self.file)
+            self.record_count += self.buffered
+            self.buffered = 0
+        self.file.flush()
+
+    def stop(self) -> None:
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
@@ -0,0 +1,210 @@
+### IMPORTS ###
+import warnings
+from threading import Lock
+
+import numpy as np
+
+### CONSTANTS ###
+RAW_SAMPLES_PER_CELL = 512
+# (bucket width in seconds, number of buckets) of each level of the min/max pyramid
+PYRAMID_LEVELS = ((1.0, 300), (10.0, 360), (60.0, 720))
+MAX_TREND_POINTS = 600
+TREND_COLUMNS = (
+    "time",
+    "voltage_min",
+    "voltage_max",
+    "temperature_min",
+    "temperature_max",
+)
+
+
+class PyramidLevel:
+    """
+    One resolution of the min/max pyramid: a ring of fixed width time buckets
+    holding, for every cell, the min and max voltage and temperature seen in
+    each bucket (NaN if the cell had no samples in it). The ring is shared by
+    all cells, so a slot is reset for the whole pack when time moves into the
+    bucket it now represents.
+    """
+
+    def __init__(self, num_cells, width, buckets):
+        self.width = width
+        self.buckets = buckets
+        self.slot_bucket = np.full(buckets, -1, dtype=np.int64)
+        self.voltage_min = np.full((num_cells, buckets), np.nan, dtype=np.float32)
+        self.voltage_max = np.full((num_cells, buckets), np.nan, dtype=np.float32)
+        self.temperature_min = np.full((num_cells, buckets), np.nan, dtype=np.float32)
+        self.temperature_max = np.full((num_cells, buckets), np.nan, dtype=np.float32)
+
+    def add(self, cells, timestamps, voltages, temperatures) -> None:
+        bucket = np.floor(timestamps / self.width).astype(np.int64)
+        slot = bucket % self.buckets
+        stale = np.unique(slot[self.slot_bucket[slot] != bucket])
+        if len(stale):
+            # the last sample's bucket wins a slot claimed by several buckets at once
+            self.slot_bucket[slot] = bucket
+            for array in (
+                self.voltage_min,
+                self.voltage_max,
+                self.temperature_min,
+                self.temperature_max,
+            ):
+                array[:, stale] = np.nan
+            keep = self.slot_bucket[slot] == bucket
+            cells, slot = cells[keep], slot[keep]
+            voltages, temperatures = voltages[keep], temperatures[keep]
+
+        np.fmin.at(self.voltage_min, (cells, slot), voltages)
+        np.fmax.at(self.voltage_max, (cells, slot), voltages)
+        np.fmin.at(self.temperature_min, (cells, slot), temperatures)
+        np.fmax.at(self.temperature_max, (cells, slot), temperatures)
+
+    def span(self) -> float:
+        return self.width * self.buckets
+
+    def window(self, cell, start, end) -> dict:
+        """The buckets of one cell between two times, oldest first; missing buckets are dropped"""
+        buckets = np.arange(
+            int(np.floor(start / self.width)), int(np.floor(end / self.width)) + 1
+        )
+        slots = buckets % self.buckets
+        present = self.slot_bucket[slots] == buckets
+        buckets, slots = buckets[present], slots[present]
+        return {
+            "time": buckets * self.width,
+            "voltage_min": self.voltage_min[cell, slots],
+            "voltage_max": self.voltage_max[cell, slots],
+            "temperature_min": self.temperature_min[cell, slots],
+            "temperature_max": self.temperature_max[cell, slots],
+        }
+
+
+class CellHistory:
+    """
+    Bounded, preallocated voltage and temperature history of every cell.
+
+    The newest RAW_SAMPLES_PER_CELL samples of each cell are kept as they
+    arrived, in a per-cell ring. Older history lives in a pyramid of min/max
+    time buckets (PYRAMID_LEVELS: 1 s buckets for 5 minutes, 10 s for an hour,
+    1 minute for 12 hours). Memory depends only on the cell count.
+
+    trend() returns at most max_points min/max points for any window, picking
+    the finest resolution that covers it and folding buckets together as
+    needed, so drawing a trend costs the same however much history it spans.
+    Times are CAN frame timestamps; windows end at the newest sample.
+
+    add() runs on the ingestion thread and trend() on the GUI thread, so both
+    hold the history's lock; the windows they return are copies.
+    """
+
+    def __init__(
+        self, num_cells: int, raw_samples=RAW_SAMPLES_PER_CELL, levels=PYRAMID_LEVELS
+    ):
+        self.num_cells = num_cells
+        self.raw_samples = raw_samples
+        self.raw_times = np.full((num_cells, raw_samples), np.nan, dtype=np.float64)
+        self.raw_voltages = np.full((num_cells, raw_samples), np.nan, dtype=np.float32)
+        self.raw_temperatures = np.full(
+            (num_cells, raw_samples), np.nan, dtype=np.float32
+        )
+        self.raw_head = np.zeros(num_cells, dtype=np.int64)
+        self.levels = [
+            PyramidLevel(num_cells, width, buckets) for width, buckets in levels
+        ]
+        self.latest = None
+        self.lock = Lock()
+
+    def add(
+        self,
+        cells: np.ndarray,
+        timestamps: np.ndarray,
+        voltages: np.ndarray,
+        temperatures: np.ndarray,
+    ) -> None:
+        """Append samples, given as parallel arrays of cell index (cell number - 1), time and values"""
+        if len(cells) == 0:
+            return
+        cells = np.asarray(cells, dtype=np.int64)
+        with self.lock:
+            self.add_locked(cells, timestamps, voltages, temperatures)
+
+    def add_locked(self, cells, timestamps, voltages, temperatures) -> None:
+        # position of every sample among the samples of the same cell in this batch
+        order = np.argsort(cells, kind="stable")
+        sorted_cells = cells[order]
+        rank = np.arange(len(cells)) - np.searchsorted(sorted_cells, sorted_cells)
+        slots = (self.raw_head[sorted_cells] + rank) % self.raw_samples
+        self.raw_times[sorted_cells, slots] = timestamps[order]
+        self.raw_voltages[sorted_cells, slots] = voltages[order]
+        self.raw_temperatures[sorted_cells, slots] = temperatures[order]
+        self.raw_head += np.bincount(cells, minlength=self.num_cells)
+
+        for level in self.levels:
+            level.add(cells, timestamps, voltages, temperatures)
+        self.latest = float(timestamps[-1])
+
+    def raw_window(self, cell, start, end) -> dict | None:
+        """The raw samples of one cell between two times, or None if the ring doesn't reach back to start"""
+        with self.lock:
+            return self.raw_window_locked(cell, start, end)
+
+    def raw_window_locked(self, cell, start, end) -> dict | None:
+        times = self.raw_times[cell]
+        if self.raw_head[cell] >= self.raw_samples and np.nanmin(times) > start:
+            return None
+        present = np.flatnonzero((times >= start) & (times <= end))
+        present = present[np.argsort(times[present], kind="stable")]
+        voltages = self.raw_voltages[cell, present]
+        temperatures = self.raw_temperatures[cell, present]
+        return {
+            "time": times[present],
+            "voltage_min": voltages,
+            "voltage_max": voltages,
+            "temperature_min": temperatures,
+            "temperature_max": temperatures,
+        }
+
+    def trend(self, cell: int, seconds: float, max_points=MAX_TREND_POINTS) -> dict:
+        """
+        Min/max voltage and temperature of one cell (index) over the last given seconds,
+        as arrays keyed by TREND_COLUMNS, oldest first, at most max_points long.
+        """
+        with self.lock:
+            if self.latest is None:
+                return {name: np.empty(0) for name in TREND_COLUMNS}
+            end = self.latest
+            start = end - seconds
+
+            window = self.raw_window_locked(cell, start, end)
+            if window is None:
+                level = next(
+                    (level for level in self.levels if level.span() >= seconds),
+                    self.levels[-1],
+                )
+                window = level.window(cell, start, end)
+        return decimate(window, max_points)
+
+
+def decimate(window: dict, max_points: int) -> dict:
+    """Fold consecutive points together (min of mins, max of maxes) until at most max_points remain"""
+    length = len(window["time"])
+    if length <= max_points:
+        return window
+    group = -(-length // max_points)
+    padded = group * -(-length // group)
+
+    def fold(values, reduce):
+        column = np.full(padded, np.nan, dtype=np.float64)
+        column[:length] = values
+        return reduce(column.reshape(-1, group), axis=1)
+
+    with warnings.catch_warnings():
+        # all-NaN groups (a cell without data for a while) are expected
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return {
+            "time": window["time"][::group],
+            "voltage_min": fold(window["voltage_min"], np.nanmin),
+            "voltage_max": fold(window["voltage_max"], np.nanmax),
+            "temperature_min": fold(window["temperature_min"], np.nanmin),
+            "temperature_max": fold(window["temperature_max"], np.nanmax),
+        }
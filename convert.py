@@ -1,29 +1,100 @@
 """
-A script to convert from a .csv CAN format to
-candump -L format (.log)
-
-Columns:
-seconds,bus,id,data
+A script to convert recorded CAN data between formats:
+    .csv     columns: seconds,bus,id,data
+    .log     candump -L format
+    .bmscap  binary capture format (see capture.py)
+The formats are picked from the file extensions, e.g.
+    python convert.py candump_murphy_11-11-24.csv candump_murphy_11-11-24.bmscap
 """
 
+import argparse
+import os
+
 import can
 
+from capture import CaptureWriter, channel_number, read_capture
+from parse import parse_candump_line
+
 inf = "candump_murphy_11-11-24.csv"
 outf = "candump_murphy_11-11-24.log"
 
-if __name__ == "__main__":
-    with open(inf, "r") as f:
-        with can.CanutilsLogWriter(file=outf) as writer:
-            next(f)
-            for line in f:
-                timestamp, busnum, can_id, data = line.strip().split(",")
-
-                writer.on_message_received(
-                    can.Message(
-                        timestamp=float(timestamp),
-                        is_extended_id=int(can_id, 16) >= 0x800,
-                        arbitration_id=int(can_id, 16),
-                        channel=f"PCAN_USBBUS{int(busnum)}",
-                        data=bytes.fromhex(data),
-                    )
+
+def read_csv_frames(path):
+    """Yield (timestamp, arbitration id, payload, channel) for every row of a CSV capture"""
+    with open(path, "r") as f:
+        next(f)
+        for line in f:
+            timestamp, busnum, can_id, data = line.strip().split(",")
+            yield float(timestamp), int(can_id, 16), bytes.fromhex(data), int(busnum)
+
+
+def read_log_frames(path):
+    """Yield (timestamp, arbitration id, payload, channel) for every data frame of a candump -L log"""
+    with open(path, "r") as f:
+        for line in f:
+            frame = parse_candump_line(line)
+            if frame is not None:
+                timestamp, arbitration_id, data, _ = frame
+                yield timestamp, arbitration_id, data, channel_number(line.split()[1])
+
+
+def read_capture_frames(path):
+    """Yield (timestamp, arbitration id, payload, channel) for every record of a capture file"""
+    for record in read_capture(path):
+        yield (
+            float(record["timestamp"]),
+            int(record["arbitration_id"]),
+            record["payload"][: record["dlc"]].tobytes(),
+            int(record["channel"]),
+        )
+
+
+def write_csv(frames, path):
+    with open(path, "w") as f:
+        f.write("seconds,bus,id,data\n")
+        for timestamp, arbitration_id, data, channel in frames:
+            f.write(
+                f"{timestamp:.6f},{channel},{arbitration_id:X},{data.hex().upper()}\n"
+            )
+
+
+def write_log(frames, path):
+    with can.CanutilsLogWriter(file=path) as writer:
+        for timestamp, arbitration_id, data, channel in frames:
+            writer.on_message_received(
+                can.Message(
+                    timestamp=timestamp,
+                    is_extended_id=arbitration_id >= 0x800,
+                    arbitration_id=arbitration_id,
+                    channel=f"PCAN_USBBUS{channel}",
+                    data=data,
                 )
+            )
+
+
+def write_capture(frames, path):
+    with CaptureWriter(path) as writer:
+        for timestamp, arbitration_id, data, channel in frames:
+            writer.write_frame(timestamp, arbitration_id, data, channel)
+
+
+READERS = {
+    ".csv": read_csv_frames,
+    ".log": read_log_frames,
+    ".bmscap": read_capture_frames,
+}
+WRITERS = {".csv": write_csv, ".log": write_log, ".bmscap": write_capture}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert recorded CAN data")
+    parser.add_argument("input", nargs="?", default=inf)
+    parser.add_argument("output", nargs="?", default=outf)
+    args = parser.parse_args()
+
+    input_format = os.path.splitext(args.input)[1].lower()
+    output_format = os.path.splitext(args.output)[1].lower()
+    if input_format not in READERS or output_format not in WRITERS:
+        parser.error(f"supported formats are {', '.join(READERS)}")
+
+    WRITERS[output_format](READERS[input_format](args.input), args.output)
@@ -4,17 +4,48 @@ class CANMessage:
     stored and referenced throughout a program.
     """
 
+    __slots__ = ("arbitration_id", "data")
+
     def __init__(self, arbitration_id: int, data: bytearray | list[int]):
         self.arbitration_id = arbitration_id
         self.data = data
 
 
+class CANBatch:
+    """
+    This class holds a run of received CAN messages column by column:
+    arbitration IDs, timestamps, data lengths and zero padded 8-byte payloads,
+    each as a NumPy array with one row per message, oldest first.
+    """
+
+    __slots__ = ("arbitration_ids", "timestamps", "dlcs", "payloads")
+
+    def __init__(self, arbitration_ids, timestamps, dlcs, payloads):
+        self.arbitration_ids = arbitration_ids
+        self.timestamps = timestamps
+        self.dlcs = dlcs
+        self.payloads = payloads
+
+    def __len__(self) -> int:
+        return len(self.arbitration_ids)
+
+    def messages(self):
+        """Yield every message in the batch as a CANMessage, oldest first."""
+        payloads = self.payloads
+        for index, (arbitration_id, dlc) in enumerate(
+            zip(self.arbitration_ids.tolist(), self.dlcs.tolist())
+        ):
+            yield CANMessage(arbitration_id, bytearray(payloads[index, :dlc]))
+
+
 class ProcessedData:
     """
     This class provides a standard format for how the decoded values of a
     CANMessage can be stored and referenced throughout a program.
     """
 
+    __slots__ = ("message_type", "values")
+
     def __init__(self, message_type: str, values: dict):
         self.message_type = message_type
         self.values = values
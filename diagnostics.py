@@ -0,0 +1,98 @@
+### IMPORTS ###
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+from PyQt5.QtWidgets import *
+
+from metrics import PipelineMetrics, dump_report, format_report, report
+from parse import format_acceptance_counts
+from transmit import format_transmit_stats
+
+### CONSTANTS ###
+DIAGNOSTICS_REFRESH_INTERVAL_MS = 1000
+
+
+class PaintProbe(QObject):
+    """Event filter telling the metrics whenever a watched widget is painted"""
+
+    def __init__(self, metrics: PipelineMetrics, parent=None):
+        super().__init__(parent)
+        self.metrics = metrics
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.Paint:
+            self.metrics.record_paint()
+        return False
+
+
+class MetricsDumper(QObject):
+    """Appends a report of the last interval to a file every interval seconds"""
+
+    def __init__(
+        self, metrics: PipelineMetrics, path: str, interval: float, parent=None
+    ):
+        super().__init__(parent)
+        self.metrics = metrics
+        self.path = path
+        self.previous = metrics.snapshot()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.dump)
+        self.timer.start(int(interval * 1000))
+
+    def dump(self):
+        current = self.metrics.snapshot()
+        try:
+            dump_report(report(current, self.previous), self.path)
+        except OSError as error:
+            print(f"Error: Could not write metrics to {self.path}: {error}")
+            self.timer.stop()
+        self.previous = current
+
+
+class DiagnosticsDialog(QDialog):
+    """
+    A window showing the pipeline metrics of the last second (since metrics
+    started, when first opened): frame rates per arbitration ID, queue depth,
+    received, coalesced and dropped frames, decode cost per message type and
+    the latency percentiles of every stage. Given acceptance_counts (see CANMessageParser.get_acceptance_counts),
+    the per-ID accepted and rejected frame totals of the bus's acceptance filter
+    are listed below, and given transmit_stats (see TransmitScheduler.stats) the
+    lateness and missed deadlines of every periodic transmit job.
+    """
+
+    def __init__(
+        self,
+        metrics: PipelineMetrics,
+        parent=None,
+        acceptance_counts=None,
+        transmit_stats=None,
+    ):
+        super().__init__(parent)
+        self.metrics = metrics
+        self.acceptance_counts = acceptance_counts
+        self.transmit_stats = transmit_stats
+        self.previous = None
+        self.setWindowTitle("Diagnostics")
+
+        self.text = QPlainTextEdit(self)
+        self.text.setReadOnly(True)
+        self.text.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.text.setMinimumSize(640, 480)
+        layout = QVBoxLayout()
+        layout.addWidget(self.text)
+        self.setLayout(layout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(DIAGNOSTICS_REFRESH_INTERVAL_MS)
+        self.refresh()
+
+    def refresh(self):
+        current = self.metrics.snapshot()
+        text = format_report(report(current, self.previous))
+        counts = None if self.acceptance_counts is None else self.acceptance_counts()
+        if counts is not None:
+            text += "\n\n" + format_acceptance_counts(counts)
+        if self.transmit_stats is not None:
+            text += "\n\n" + format_transmit_stats(self.transmit_stats())
+        self.text.setPlainText(text)
+        self.previous = current
@@ -0,0 +1,82 @@
+"""
+Staleness of the pack state: which cells and messages stopped updating, and
+how often every tracked arbitration ID is actually received.
+
+BMSData stamps every frame into preallocated last-seen arrays as it decodes
+(see TRACKED_IDS in BMS_data_processing.py); this module only reads them from
+the published snapshots, so checking costs nothing on the decode path.
+Ages are measured against a clock in the same time base as the frame
+timestamps: the bus time when replaying a log, the wall clock otherwise.
+"""
+
+### IMPORTS ###
+import numpy as np
+
+from BMS_data_processing import TRACKED_IDS, PackSnapshot
+from BMS_dispatcher import BMSLOOKUP
+from pack_layout import PackLayout
+
+### CONSTANTS ###
+DEFAULT_STALE_AFTER = 5.0
+FRESHNESS_CHECK_INTERVAL_MS = 500
+# update rates are measured over at least this many seconds of bus time
+RATE_INTERVAL = 1.0
+MAX_LISTED_CELLS = 8
+
+
+class FreshnessMonitor:
+    """
+    Tracks staleness and update rates over successive snapshots.
+    Cells and messages not updated for more than stale_after seconds are
+    stale; cells and messages never received are not, they are simply missing.
+    """
+
+    def __init__(self, stale_after: float, clock):
+        self.stale_after = stale_after
+        self.clock = clock
+        self.now = clock()
+        self.rate_sample = None
+        self.rates = np.zeros(len(TRACKED_IDS), dtype=np.float64)
+
+    def check(self, snapshot: PackSnapshot) -> np.ndarray:
+        """Update the rates from a snapshot and return its mask of stale cells"""
+        self.now = self.clock()
+        counts = snapshot.get_message_counts()
+        if self.rate_sample is None or self.now < self.rate_sample[0]:
+            # first check, or the replay was moved back
+            self.rate_sample = (self.now, counts)
+        elif self.now - self.rate_sample[0] >= RATE_INTERVAL:
+            then, previous_counts = self.rate_sample
+            self.rates = (counts - previous_counts) / (self.now - then)
+            self.rate_sample = (self.now, counts)
+        return snapshot.stale_cells(self.now, self.stale_after)
+
+    def stale_messages(self, snapshot: PackSnapshot) -> np.ndarray:
+        """Mask over TRACKED_IDS of the messages received before but not recently"""
+        last_seen = snapshot.get_message_last_seen()
+        return (last_seen > 0) & (self.now - last_seen > self.stale_after)
+
+
+def format_summary(
+    stale_cells: np.ndarray,
+    stale_messages: np.ndarray,
+    rates: np.ndarray,
+    layout: PackLayout,
+) -> str:
+    """One line listing the stale cells and the update rate of every tracked message"""
+    cell_numbers = np.flatnonzero(stale_cells) + 1
+    if len(cell_numbers):
+        listed = ", ".join(
+            layout.describe_cell(number) for number in cell_numbers[:MAX_LISTED_CELLS]
+        )
+        if len(cell_numbers) > MAX_LISTED_CELLS:
+            listed += f", +{len(cell_numbers) - MAX_LISTED_CELLS} more"
+        parts = [f"Stale cells ({len(cell_numbers)}): {listed}"]
+    else:
+        parts = ["No stale cells"]
+    for slot, arbitration_id in enumerate(TRACKED_IDS.tolist()):
+        text = f"{BMSLOOKUP[arbitration_id][1]} {rates[slot]:.1f}/s"
+        if stale_messages[slot]:
+            text += " (stale)"
+        parts.append(text)
+    return "  |  ".join(parts)
@@ -1,12 +1,17 @@
 ### IMPORTS ###
+import numpy as np
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 
+from pack_layout import DEFAULT_LAYOUT, PackLayout
+
 ### CONSTANTS ###
 RED_COLOR = QColor(255, 0, 0)
 BLUE_COLOR = QColor(0, 0, 255)
 GRAY_COLOR = QColor(30, 31, 30)
+# cells whose last update is older than the staleness limit
+STALE_COLOR = QColor(160, 160, 160)
 BORDER_SELECTED_COLOR = Qt.black
 BORDER_UNSELECTED_COLOR = Qt.gray
 BORDER_SELECTED_WIDTH = 2
@@ -16,7 +21,14 @@ BORDER_ADJUSTMENT_LEFT = 1
 BORDER_ADJUSTMENT_TOP = 1
 BORDER_ADJUSTMENT_RIGHT = -1
 BORDER_ADJUSTMENT_BOTTOM = -1
-TABLE_SIZE = 12
+WHITE_COLOR = QColor(255, 255, 255)
+CHANGED_ROLES = [Qt.DisplayRole, Qt.BackgroundRole]
+# above this many changed cells the whole view is refreshed with one notification
+MAX_CELL_NOTIFICATIONS = 64
+# packs with more cells than this are painted as an image instead of a table
+PAINTED_GRID_THRESHOLD = 256
+MIN_GRID_LINE_CELL_SIZE = 6
+CELL_TEXT_SAMPLE = "0.000"
 
 
 class TableBorder(QStyledItemDelegate):
@@ -49,16 +61,233 @@ class TableBorder(QStyledItemDelegate):
         painter.drawRect(rect)
 
 
+class HeatmapModel(QAbstractTableModel):
+    """A table model over a NumPy array of heatmap values
+    Values are NaN until data for that cell arrives. The text and colour
+    of a cell are computed when the view asks for them, from a plain list
+    mirror of the array that is cheaper to index than NumPy scalars.
+    Grid positions the pack layout leaves empty have no text or colour.
+    Stale cells keep their last value but are greyed out.
+    Attributes:
+        values (np.ndarray): The values currently shown, one per grid position
+        stale (np.ndarray): Which grid positions hold a stale value
+        max_safe_value (float): Values above this are coloured red
+        min_safe_value (float): Values below this are coloured blue
+    """
+
+    def __init__(self, layout, min_safe, max_safe):
+        super().__init__()
+        self.values = np.full((layout.rows, layout.columns), np.nan, dtype=np.float32)
+        self.cells = self.values.tolist()
+        self.stale = np.zeros(self.values.shape, dtype=bool)
+        self.stale_cells = self.stale.tolist()
+        self.occupied = layout.occupied
+        self.max_safe_value = max_safe
+        self.min_safe_value = min_safe
+        self.image = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.values.shape[0]
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.values.shape[1]
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole:
+            if not self.occupied[index.row(), index.column()]:
+                return None
+            value = self.cells[index.row()][index.column()]
+            return "N/A" if value != value else f"{value:.3f}"
+        if role == Qt.BackgroundRole:
+            if not self.occupied[index.row(), index.column()]:
+                return None
+            value = self.cells[index.row()][index.column()]
+            if value != value:
+                return GRAY_COLOR
+            if self.stale_cells[index.row()][index.column()]:
+                return STALE_COLOR
+            if value > self.max_safe_value:
+                return RED_COLOR
+            if value < self.min_safe_value:
+                return BLUE_COLOR
+        return None
+
+    def update(self, new_values):
+        """
+        Copy new values into the model and notify the view about the cells
+        that changed only. Single cell notifications let the view repaint just
+        those cells rather than its whole viewport.
+        """
+        new_values = np.asarray(new_values, dtype=np.float32).reshape(self.values.shape)
+        changed = (new_values != self.values) & ~(
+            np.isnan(new_values) & np.isnan(self.values)
+        )
+        changed_count = int(changed.sum())
+        if not changed_count:
+            return
+        np.copyto(self.values, new_values)
+        self.cells = self.values.tolist()
+        self.notify_changed(changed, changed_count)
+
+    def set_stale(self, stale):
+        """Replace the stale cell mask, notifying the view about the cells that changed"""
+        stale = np.asarray(stale, dtype=bool).reshape(self.stale.shape)
+        changed = stale != self.stale
+        changed_count = int(changed.sum())
+        if not changed_count:
+            return
+        np.copyto(self.stale, stale)
+        self.stale_cells = self.stale.tolist()
+        self.notify_changed(changed, changed_count)
+
+    def notify_changed(self, changed, changed_count):
+        self.image = None
+        if changed_count > MAX_CELL_NOTIFICATIONS:
+            self.dataChanged.emit(
+                self.index(0, 0),
+                self.index(self.rowCount() - 1, self.columnCount() - 1),
+                CHANGED_ROLES,
+            )
+            return
+        for row, column in zip(*(axis.tolist() for axis in np.nonzero(changed))):
+            index = self.index(row, column)
+            self.dataChanged.emit(index, index, CHANGED_ROLES)
+
+    def colour_image(self) -> QImage:
+        """
+        Render the colour of every grid position into an image with one pixel
+        per position, using the same colours as data(). Cached until the next update.
+        """
+        if self.image is None:
+            colours = np.full(self.values.shape, WHITE_COLOR.rgba(), dtype=np.uint32)
+            colours[self.values > self.max_safe_value] = RED_COLOR.rgba()
+            colours[self.values < self.min_safe_value] = BLUE_COLOR.rgba()
+            colours[self.stale] = STALE_COLOR.rgba()
+            colours[np.isnan(self.values)] = GRAY_COLOR.rgba()
+            colours[~self.occupied] = 0
+            rows, columns = colours.shape
+            self.image = QImage(
+                colours.data, columns, rows, columns * 4, QImage.Format_ARGB32
+            ).copy()
+        return self.image
+
+
+class HeatmapCanvas(QWidget):
+    """
+    Paints a heatmap model as an image with one pixel per cell, scaled up to
+    the widget, instead of laying out and painting one table item per cell.
+    Values are drawn as text only once cells are large enough to fit them;
+    hovering a cell shows its number and value either way. Clicking a cell
+    highlights it and emits cell_clicked(row, column).
+    """
+
+    cell_clicked = pyqtSignal(int, int)
+
+    def __init__(self, model, pack_layout):
+        super().__init__()
+        self.model = model
+        self.pack_layout = pack_layout
+        self.selected = None
+        self.setMinimumSize(pack_layout.columns, pack_layout.rows)
+        self.model.dataChanged.connect(self.model_changed)
+
+    def model_changed(self, *args):
+        self.update()
+
+    def cell_size(self) -> tuple[float, float]:
+        return (
+            self.width() / self.model.columnCount(),
+            self.height() / self.model.rowCount(),
+        )
+
+    def cell_rect(self, row, column) -> QRectF:
+        width, height = self.cell_size()
+        return QRectF(column * width, row * height, width, height)
+
+    def cell_at(self, position) -> tuple[int, int] | None:
+        width, height = self.cell_size()
+        row, column = int(position.y() // height), int(position.x() // width)
+        if 0 <= row < self.model.rowCount() and 0 <= column < self.model.columnCount():
+            return row, column
+        return None
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.drawImage(QRectF(self.rect()), self.model.colour_image())
+        width, height = self.cell_size()
+        rows, columns = self.model.rowCount(), self.model.columnCount()
+
+        if min(width, height) >= MIN_GRID_LINE_CELL_SIZE:
+            painter.setPen(QPen(BORDER_UNSELECTED_COLOR, BORDER_UNSELECTED_WIDTH))
+            for column in range(columns + 1):
+                painter.drawLine(
+                    QPointF(column * width, 0), QPointF(column * width, self.height())
+                )
+            for row in range(rows + 1):
+                painter.drawLine(
+                    QPointF(0, row * height), QPointF(self.width(), row * height)
+                )
+
+        metrics = painter.fontMetrics()
+        if (
+            width >= metrics.horizontalAdvance(CELL_TEXT_SAMPLE)
+            and height >= metrics.height()
+        ):
+            painter.setPen(Qt.black)
+            for row in range(rows):
+                for column in range(columns):
+                    text = self.model.data(self.model.index(row, column))
+                    if text is not None:
+                        painter.drawText(
+                            self.cell_rect(row, column), Qt.AlignCenter, text
+                        )
+
+        if self.selected is not None:
+            painter.setPen(
+                QPen(BORDER_SELECTED_COLOR, BORDER_SELECTED_WIDTH, BORDER_STYLE)
+            )
+            painter.drawRect(self.cell_rect(*self.selected))
+
+    def mousePressEvent(self, event):
+        self.selected = self.cell_at(event.pos())
+        self.update()
+        if self.selected is not None:
+            self.cell_clicked.emit(*self.selected)
+
+    def event(self, event):
+        if event.type() == QEvent.ToolTip:
+            cell = self.cell_at(event.pos())
+            if cell is not None and self.model.occupied[cell]:
+                cell_number = self.pack_layout.cell_numbers[cell]
+                text = self.model.data(self.model.index(*cell))
+                QToolTip.showText(
+                    event.globalPos(),
+                    f"Cell {self.pack_layout.describe_cell(cell_number)}: {text}",
+                )
+            else:
+                QToolTip.hideText()
+            return True
+        return super().event(event)
+
+
 class Heatmap(QWidget):
     """A widget for displaying a heatmap
+    Small packs are shown as a table view; packs larger than
+    PAINTED_GRID_THRESHOLD cells are painted as an image.
+    Clicking a cell emits cell_selected with its cell number.
     Attributes:
         max_safe_value (float): The maximum safe value for the heatmap
         min_safe_value (float): The minimum safe value for the heatmap
         title (str): The title of the heatmap
     """
 
-    def __init__(self, min_safe, max_safe, title):
+    cell_selected = pyqtSignal(int)
+
+    def __init__(
+        self, min_safe, max_safe, title, pack_layout: PackLayout = DEFAULT_LAYOUT
+    ):
         super().__init__()
+        self.pack_layout = pack_layout
         self.max_safe_value = max_safe
         self.min_safe_value = min_safe
 
@@ -66,31 +295,34 @@ class Heatmap(QWidget):
         self.table_title = QLabel(self.title + " Heatmap")
         self.table_title.setStyleSheet("font-size: 13px; font-weight: bold;")
         self.table_title.setAlignment(Qt.AlignCenter)
-        self.table = QTableWidget(TABLE_SIZE, TABLE_SIZE)
-        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
-        self.table.verticalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.model = HeatmapModel(pack_layout, min_safe, max_safe)
+        if pack_layout.num_cells > PAINTED_GRID_THRESHOLD:
+            self.view = HeatmapCanvas(self.model, pack_layout)
+            self.view.cell_clicked.connect(self.cell_clicked)
+        else:
+            self.view = QTableView()
+            self.view.setModel(self.model)
+            self.view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+            self.view.verticalHeader().setSectionResizeMode(QHeaderView.Stretch)
+            border = TableBorder(self.view)
+            self.view.setItemDelegate(border)
+            self.view.clicked.connect(
+                lambda index: self.cell_clicked(index.row(), index.column())
+            )
 
-        border = TableBorder(self.table)
-        self.table.setItemDelegate(border)
         layout = QVBoxLayout()
         layout.addWidget(self.table_title)
-        layout.addWidget(self.table)
+        layout.addWidget(self.view)
         self.setLayout(layout)
 
+    def cell_clicked(self, row, column):
+        if self.pack_layout.occupied[row, column]:
+            self.cell_selected.emit(int(self.pack_layout.cell_numbers[row, column]))
+
     def plot(self, heatmapData):
-        """Update the table with new heatmap data."""
-        for i in range(TABLE_SIZE):
-            for j in range(TABLE_SIZE):
-                value = heatmapData[i][j]
-
-                if value is None:
-                    item = QTableWidgetItem("N/A")
-                    item.setBackground(GRAY_COLOR)
-                else:
-                    item = QTableWidgetItem(f"{value:.3f}")
-                    if value > self.max_safe_value:
-                        item.setBackground(RED_COLOR)
-                    elif value < self.min_safe_value:
-                        item.setBackground(BLUE_COLOR)
-
-                self.table.setItem(i, j, item)
+        """Update the heatmap with new data, arranged on the pack layout grid."""
+        self.model.update(heatmapData)
+
+    def mark_stale(self, stale_grid):
+        """Grey out the cells set in a boolean grid arranged on the pack layout."""
+        self.model.set_stale(stale_grid)
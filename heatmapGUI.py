@@ -8,11 +8,20 @@ from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 from PyQt5.QtWidgets import QCheckBox, QComboBox
 
-from BMS_data_processing import BMSData
-from BMS_dispatcher import BMSFILTERS, encode_manual_charge, encode_polling
+from diagnostics import DiagnosticsDialog, MetricsDumper, PaintProbe
+from freshness import (
+    DEFAULT_STALE_AFTER,
+    FRESHNESS_CHECK_INTERVAL_MS,
+    FreshnessMonitor,
+    format_summary,
+)
 from heatmap import Heatmap
-from parse import CANMessageParser
-from worker import TimedWorker, Worker
+from ingest import BusSource, IngestionCore
+from metrics import DEFAULT_DUMP_INTERVAL
+from pack_layout import DEFAULT_LAYOUT, PackLayout
+from parse import CANFakeBus
+from trend_plot import TrendDialog
+from worker import AsyncBridge, RefreshDispatcher, Worker
 
 ### CONSTANTS ###
 MIN_SAFE_VOLTAGE = 3.0
@@ -22,12 +31,16 @@ MAX_SAFE_TEMPERATURE = 60.0
 QUIT_BUTTON_WIDTH = 50
 BUTTON_WIDTH = 150
 BUTTON_HEIGHT = 50
-TABLE_SIZE = 12
+# the charger command carries the balancing cell count in 4 bits
+MAX_BALANCE_CELL_COUNT = 15
 BUTTON_BORDER_RADIUS = 5
 QUIT_BUTTON_STYLE = "grey"
 START_BUTTON_STYLE = "green"
 STOP_BUTTON_STYLE = "red"
-NUM_MESSAGES = 200
+DEFAULT_MAX_FPS = 10
+# playback speeds offered for replayed logs; None plays as fast as possible
+PLAYBACK_SPEEDS = [0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 25.0, 50.0, 100.0, None]
+PLAYBACK_POSITION_INTERVAL_MS = 250
 
 ### GLOBAL VARIABLES ###
 charge_voltage = 0
@@ -37,36 +50,52 @@ discharge_threshold = 0
 discharge_balance_value = 0
 
 
-class HeatmapGUI(QMainWindow):
-    """Top level code for BMS VIEWER"""
+class PackView(QWidget):
+    """
+    Everything shown for one BMS on one CAN bus: its heatmaps and tables,
+    and the playback controls when replaying a log. Draws the snapshots the
+    ingestion core publishes for the bus (see ingest.py). Only the visible
+    pack is redrawn; a pack coming into view catches up on everything that
+    changed while it was hidden from the latest snapshot.
+    """
 
     ####### PURE PyQT VISUALIZATION ELEMENTS / STRUCTURING APPEARANCE OF GUI #######
 
-    def __init__(self, can_bus):
-        ### INITIALIZES MAIN WINDOW + CHARGE STATE + NECESSARY CLASS INITIALIZATION ###
-        super().__init__()
-        self.setWindowTitle("BMS Viewer")
-        self.threadpool = QThreadPool()
-        self.bottomLayout = QHBoxLayout()
-        self.is_charging = False
-        self.charge_worker = None
-        self.poll_worker = Worker(self.poll_thread_function)
-        self.threadpool.start(self.poll_worker)
-        self.parser = CANMessageParser(filtering=BMSFILTERS, can_bus=can_bus)
-        self.data_retriever = BMSData()
-
-        ### INTIALIZE UI ###
-        widget = QWidget(self)
-        widget.setLayout(self.bottomLayout)
-        self.create_buttons()
-        self.create_inputs()
-        self.set_layout()
+    def __init__(
+        self,
+        source: BusSource,
+        max_fps=DEFAULT_MAX_FPS,
+        pack_layout: PackLayout = DEFAULT_LAYOUT,
+        metrics=None,
+        stale_after=DEFAULT_STALE_AFTER,
+        parent=None,
+    ):
+        super().__init__(parent)
+        self.source = source
+        self.name = source.name
+        can_bus = source.bus
+        self.max_fps = max_fps
+        self.pack_layout = pack_layout
+        self.metrics = metrics
+        self.visible = True
+        self.data_retriever = source.data
+        # the pack state last drawn, and the latest published
+        self.snapshot = self.data_retriever.get_snapshot()
+        self.latest = self.snapshot
 
         ### INITIALIZE HEATMAPS AND SIDE TABLES ###
-        self.voltage_heatmap = Heatmap(MIN_SAFE_VOLTAGE, MAX_SAFE_VOLTAGE, "Voltage")
+        self.voltage_heatmap = Heatmap(
+            MIN_SAFE_VOLTAGE, MAX_SAFE_VOLTAGE, "Voltage", pack_layout
+        )
         self.temperature_heatmap = Heatmap(
-            MIN_SAFE_TEMPERATURE, MAX_SAFE_TEMPERATURE, "Temperature"
+            MIN_SAFE_TEMPERATURE, MAX_SAFE_TEMPERATURE, "Temperature", pack_layout
         )
+        self.trend_dialogs = {}
+        self.voltage_heatmap.cell_selected.connect(self.show_cell_trend)
+        self.temperature_heatmap.cell_selected.connect(self.show_cell_trend)
+        # staleness is checked against the playback position when replaying a log
+        clock = can_bus.bus_time if isinstance(can_bus, CANFakeBus) else time.time
+        self.freshness = FreshnessMonitor(stale_after, clock)
         self.combined_voltage_temperature_table = self.create_table(
             [
                 (
@@ -113,145 +142,89 @@ class HeatmapGUI(QMainWindow):
             ]
         )
 
-        ### SET UP MAIN LAYOUT ###
+        ### SET UP PACK LAYOUT ###
         gridLayout = QGridLayout()
         gridLayout.addWidget(self.voltage_heatmap, 0, 0, 1, 3)
         gridLayout.addWidget(self.temperature_heatmap, 1, 0, 1, 3)
         gridLayout.addWidget(self.combined_voltage_temperature_table, 0, 3, 1, 2)
         gridLayout.addWidget(self.combined_faults_pack_data_table, 1, 3, 1, 2)
-        gridLayout.addWidget(widget, 2, 0, 1, 5)
+        if isinstance(can_bus, CANFakeBus):
+            gridLayout.addWidget(self.create_playback_controls(can_bus), 2, 0, 1, 5)
         gridLayout.setColumnStretch(0, 2)
         gridLayout.setColumnStretch(1, 2)
         gridLayout.setColumnStretch(2, 2)
         gridLayout.setColumnStretch(3, 2)
         gridLayout.setColumnStretch(4, 2)
-        central_widget = QWidget(self)
-        self.setCentralWidget(central_widget)
-        central_widget.setLayout(gridLayout)
+        gridLayout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(gridLayout)
 
-        ### START WORKERS AND MAXIMIZE WINDOW ###
-        QTimer.singleShot(0, self.start_workers)
-        self.showMaximized()
+    def heatmaps(self):
+        return (self.voltage_heatmap, self.temperature_heatmap)
 
-    def create_buttons(self):
+    def create_playback_controls(self, fake_bus: CANFakeBus):
         """
-        Make the main buttons (Quit, Start, Stop).
-        Sets how they look and what they do when clicked.
+        Make the playback row shown when replaying a log: pause/resume,
+        playback speed, seek to a time in the log and the current position.
         """
-        self.quitButton = QPushButton("Quit")
-        self.quitButton.setStyleSheet(
-            f"background-color: {QUIT_BUTTON_STYLE}; border-radius: {BUTTON_BORDER_RADIUS}px;"
-        )
-        self.quitButton.setFixedSize(QUIT_BUTTON_WIDTH, BUTTON_HEIGHT)
-        self.quitButton.clicked.connect(self.quit_button_clicked)
+        self.playback = fake_bus.playback
+        self.fake_bus = fake_bus
 
-        self.startButton = QPushButton("Start")
-        self.startButton.setStyleSheet(
-            f"background-color: {START_BUTTON_STYLE}; border-radius: {BUTTON_BORDER_RADIUS}px;"
-        )
-        self.startButton.setFixedSize(BUTTON_WIDTH, BUTTON_HEIGHT)
-        self.startButton.clicked.connect(self.start_button_clicked)
+        self.pauseButton = QPushButton("Pause")
+        self.pauseButton.setFixedSize(BUTTON_WIDTH, 30)
+        self.pauseButton.clicked.connect(self.pause_button_clicked)
 
-        self.stopButton = QPushButton("Stop")
-        self.stopButton.setStyleSheet(
-            f"background-color: {STOP_BUTTON_STYLE}; border-radius: {BUTTON_BORDER_RADIUS}px;"
-        )
-        self.stopButton.setFixedSize(BUTTON_WIDTH, BUTTON_HEIGHT)
-        self.stopButton.clicked.connect(self.stop_button_clicked)
-
-    def create_inputs(self):
-        """
-        Make input boxes for voltage, current, discharge balance, and threshold.
-        Adds text boxes, checkboxes, and dropdown menus.
-        """
-        self.textbox1 = QLineEdit(self)
-        self.textbox2 = QLineEdit(self)
-        self.balance_enable_checkbox = QCheckBox(self)
-        self.balance_cell_cnt_dropdown = QComboBox(self)
-        self.textbox4 = QLineEdit(self)
-
-        self.textbox1.setPlaceholderText("Enter voltage")
-        self.textbox2.setPlaceholderText("Enter current")
-        self.textbox4.setPlaceholderText("Enter discharge threshold")
-
-        self.balance_cell_cnt_dropdown.addItems(["1", "2", "3", "4", "6", "12"])
-        self.balance_cell_cnt_dropdown.setFixedSize(80, 30)
-
-        self.textbox1.textChanged.connect(
-            lambda: self.update_charge_voltage(self.textbox1, 1)
-        )
-        self.textbox2.textChanged.connect(
-            lambda: self.update_charge_current(self.textbox2, 2)
-        )
-        self.balance_enable_checkbox.stateChanged.connect(
-            self.update_discharge_balance
-        )
-        self.balance_cell_cnt_dropdown.currentTextChanged.connect(
-            self.update_discharge_balance_value
+        self.speed_dropdown = QComboBox(self)
+        for speed in PLAYBACK_SPEEDS:
+            self.speed_dropdown.addItem(
+                "Max" if speed is None else f"{speed:g}x", speed
+            )
+        self.speed_dropdown.setCurrentIndex(
+            PLAYBACK_SPEEDS.index(self.playback.speed)
+            if self.playback.speed in PLAYBACK_SPEEDS
+            else PLAYBACK_SPEEDS.index(1.0)
         )
-        self.textbox4.textChanged.connect(
-            lambda: self.update_discharge_voltage_limit(self.textbox4, 4)
+        self.speed_dropdown.currentIndexChanged.connect(self.update_playback_speed)
+
+        self.seek_input = QDoubleSpinBox(self)
+        self.seek_input.setDecimals(1)
+        self.seek_input.setMaximum(1e9)
+        self.seek_input.setSuffix(" s")
+        self.seekButton = QPushButton("Seek")
+        self.seekButton.setFixedSize(80, 30)
+        self.seekButton.clicked.connect(
+            lambda: self.fake_bus.seek(self.seek_input.value())
         )
 
-        self.style_inputs()
+        self.position_label = QLabel("0.0 s")
+        self.position_timer = QTimer(self)
+        self.position_timer.timeout.connect(self.update_playback_position)
+        self.position_timer.start(PLAYBACK_POSITION_INTERVAL_MS)
 
-    def style_inputs(self):
-        """
-        Make the input boxes look nice.
-        Sets colors, borders, and other visual details.
-        """
-        style = """
-        QLineEdit, QComboBox {
-            background-color: #f0f0f0;
-            border: 2px solid #c0c0c0;
-            border-radius: 5px;
-            padding: 5px;
-            font-size: 14px;
-        }
-        QLineEdit:focus, QComboBox:focus {
-            border-color: #a0a0a0;
-        }
-        """
-        for widget in [
-            self.textbox1,
-            self.textbox2,
-            self.textbox4,
-            self.balance_cell_cnt_dropdown,
-        ]:
-            widget.setStyleSheet(style)
-            if isinstance(widget, QLineEdit):
-                widget.setFixedSize(150, 30)
-
-    def set_layout(self):
-        """
-        Arrange all UI elements in the bottom layout of the main window.
-        Organizes labels, input fields, and buttons horizontally with proper spacing.
-        """
-        voltage_label = QLabel("Voltage:")
-        current_label = QLabel("Current:")
-        balance_enable_label = QLabel("Enable Balancing:")
-        balance_cell_cnt_label = QLabel("Max. Cells/Segment:")
-        discharge_threshold_label = QLabel("Discharge Threshold:")
-
-        for label in [
-            voltage_label,
-            current_label,
-            balance_enable_label,
-            balance_cell_cnt_label,
-            discharge_threshold_label,
-        ]:
+        playback_label = QLabel("Playback:")
+        speed_label = QLabel("Speed:")
+        seek_label = QLabel("Seek to:")
+        for label in [playback_label, speed_label, seek_label, self.position_label]:
             label.setStyleSheet("font-weight: bold; font-size: 14px;")
 
-        list_widgets = (self.quitButton, voltage_label, self.textbox1, current_label, 
-                        self.textbox2, balance_enable_label, self.balance_enable_checkbox, balance_cell_cnt_label,
-                        self.balance_cell_cnt_dropdown, discharge_threshold_label, self.textbox4, self.startButton,
-                        self.stopButton)
-        
-        for wid in list_widgets:
-            self.bottomLayout.addWidget(wid)
+        layout = QHBoxLayout()
+        for wid in (
+            playback_label,
+            self.pauseButton,
+            speed_label,
+            self.speed_dropdown,
+            seek_label,
+            self.seek_input,
+            self.seekButton,
+            self.position_label,
+        ):
+            layout.addWidget(wid)
+        layout.addStretch()
+        layout.setSpacing(10)
+        layout.setContentsMargins(10, 0, 10, 10)
 
-        self.bottomLayout.setSpacing(10)
-        self.bottomLayout.setContentsMargins(10, 10, 10, 10)
+        widget = QWidget(self)
+        widget.setLayout(layout)
+        return widget
 
     def create_table(self, sections):
         """
@@ -290,8 +263,7 @@ class HeatmapGUI(QMainWindow):
         """
         Apply custom styling to the table widgit.
         """
-        table.setStyleSheet(
-            """
+        table.setStyleSheet("""
             QTableWidget {
                 font-family: Arial, sans-serif;
                 font-size: 10pt;  /* Increased font size */
@@ -315,8 +287,7 @@ class HeatmapGUI(QMainWindow):
                 color: white;
                 font-weight: bold;
             }
-        """
-        )
+        """)
 
         header_font = QFont("Arial", 12, QFont.Bold)
         table.horizontalHeader().setFont(header_font)
@@ -333,92 +304,103 @@ class HeatmapGUI(QMainWindow):
 
     ####### WORKERS + CONNECTED FUNCTIONS/JOBS #######
 
-    def start_workers(self):
+    def start_dispatcher(self):
         """
-        Start all background tasks.
-        These tasks handle data processing and updating the display.
+        Start the pack's redraw dispatcher, which redraws only the widgets backed
+        by changed data groups, at most max_fps times a second.
         """
-        self.can_worker = TimedWorker(self.process_can_messages)
-        self.threadpool.start(self.can_worker)
-
-        self.voltage_worker = TimedWorker(self.refresh_voltage_data)
-        self.voltage_worker.signals.result.connect(self.voltage_heatmap.plot)
-        self.threadpool.start(self.voltage_worker)
-
-        self.temperature_worker = TimedWorker(self.refresh_temperature_data)
-        self.temperature_worker.signals.result.connect(self.temperature_heatmap.plot)
-        self.threadpool.start(self.temperature_worker)
-
-        self.system_voltage_worker = TimedWorker(self.refresh_system_voltage_data)
-        self.system_voltage_worker.signals.result.connect(
-            self.update_system_voltage_table
+        self.refresh_dispatcher = RefreshDispatcher(
+            self.take_dirty, self.redraw_dirty, self.max_fps
         )
-        self.threadpool.start(self.system_voltage_worker)
 
-        self.system_temperature_worker = TimedWorker(
-            self.refresh_system_temperature_data
-        )
-        self.system_temperature_worker.signals.result.connect(
-            self.update_system_temperature_table
+    def on_snapshot(self, snapshot, arrival):
+        """Take a snapshot published by the ingestion core and schedule a redraw"""
+        self.latest = snapshot
+        # a hidden pack catches up when it is shown
+        if not self.visible:
+            return
+        if self.metrics is not None:
+            self.metrics.mark_dirty(arrival)
+        self.refresh_dispatcher.data_changed.emit()
+
+    def take_dirty(self) -> set[str]:
+        """Data groups changed since the last redraw"""
+        return self.latest.changed_since(self.snapshot.version)
+
+    def set_visible(self, visible: bool):
+        """Start or stop redrawing the pack, bringing it up to date when it comes into view"""
+        self.visible = visible
+        if visible:
+            self.redraw_dirty(None)
+
+    def redraw_dirty(self, dirty):
+        """
+        Refresh the widgets backed by data groups changed since the last redraw.
+        Runs on the GUI thread, reading one published snapshot of the pack state
+        throughout, and does nothing if no new snapshot was published since or
+        the pack is hidden.
+        """
+        if not self.visible:
+            return
+        snapshot = self.latest
+        if snapshot.version == self.snapshot.version:
+            return
+        if self.metrics is not None:
+            started = time.monotonic()
+        changed = snapshot.changed_since(self.snapshot.version)
+        self.snapshot = snapshot
+        if "CELLVALUE" in changed:
+            self.voltage_heatmap.plot(self.refresh_voltage_data())
+            self.temperature_heatmap.plot(self.refresh_temperature_data())
+        if "BMSVINF" in changed:
+            self.update_system_voltage_table(self.refresh_system_voltage_data())
+        if "BMSTINF" in changed:
+            self.update_system_temperature_table(self.refresh_system_temperature_data())
+        if "BMSSTAT" in changed:
+            self.update_fault_table(self.refresh_fault_data())
+        if "PACKSTAT" in changed:
+            self.update_pack_data_table(self.refresh_pack_data())
+        if "CHARGEROUT" in changed:
+            self.update_charger_out_table(self.refresh_charger_out_data())
+        if self.metrics is not None:
+            self.metrics.record_redraw(started, time.monotonic())
+
+    def check_freshness(self) -> str:
+        """Grey out the stale cells and return the one line summary of the pack's freshness"""
+        snapshot = self.data_retriever.get_snapshot()
+        stale = self.freshness.check(snapshot)
+        # to_grid fills empty positions with NaN, which compares as not stale
+        stale_grid = self.pack_layout.to_grid(stale.astype(np.float32)) == 1
+        self.voltage_heatmap.mark_stale(stale_grid)
+        self.temperature_heatmap.mark_stale(stale_grid)
+        return format_summary(
+            stale,
+            self.freshness.stale_messages(snapshot),
+            self.freshness.rates,
+            self.pack_layout,
         )
-        self.threadpool.start(self.system_temperature_worker)
-
-        self.fault_worker = TimedWorker(self.refresh_fault_data)
-        self.fault_worker.signals.result.connect(self.update_fault_table)
-        self.threadpool.start(self.fault_worker)
-
-        self.pack_worker = TimedWorker(self.refresh_pack_data)
-        self.pack_worker.signals.result.connect(self.update_pack_data_table)
-        self.threadpool.start(self.pack_worker)
-
-        self.charger_out_worker = TimedWorker(self.refresh_charger_out_data)
-        self.charger_out_worker.signals.result.connect(self.update_charger_out_table)
-        self.threadpool.start(self.charger_out_worker)
-
-    def process_can_messages(self):
-        """
-        Deal with incoming messages from the BMS.
-        Gets messages and updates stored data.
-        """
-        messages = self.parser.get_messages(NUM_MESSAGES)
-        self.data_retriever.process_bms_messages(messages)
-        self.parser.empty_queue()
 
     def refresh_voltage_data(self):
         """
         Get the latest voltage readings for all cells.
-        Returns a grid of voltage values to show on the heatmap.
+        Returns a grid of voltage values to show on the heatmap, arranged by the
+        pack layout (NaN where no reading has arrived yet).
         """
-        cell_values = self.data_retriever.get_bms_cell_vals()
-        voltage_data = np.array(
-            [cell.values["cell_voltage"] if cell else None for cell in cell_values]
-        )
-        # if None not in voltage_data:
-        #     avg_voltage = np.sum(voltage_data) / 144
-        #     self.update_table_value(self.combined_voltage_temperature_table, "Average Voltage", f"{avg_voltage:.3f}V")
-        voltage_data = voltage_data.reshape(TABLE_SIZE, TABLE_SIZE)
-        return voltage_data
+        return self.pack_layout.to_grid(self.snapshot.get_cell_voltages())
 
     def refresh_temperature_data(self):
         """
         Get the latest temperature readings for all cells.
-        Returns a grid of temperature values to show on the heatmap.
+        Returns a grid of temperature values to show on the heatmap, arranged by the
+        pack layout (NaN where no reading has arrived yet).
         """
-        cell_values = self.data_retriever.get_bms_cell_vals()
-        temp_data = np.array(
-            [cell.values["cell_temperature"] if cell else None for cell in cell_values]
-        )
-        # if None not in temp_data:
-        #     avg_temp = np.sum(temp_data) / 144
-        #     self.update_table_value(self.combined_voltage_temperature_table, "Avg Temperature", f"{avg_temp:.1f}°C")
-        temp_data = temp_data.reshape(TABLE_SIZE, TABLE_SIZE)
-        return temp_data
+        return self.pack_layout.to_grid(self.snapshot.get_cell_temperatures())
 
     def refresh_system_voltage_data(self):
         """
         Get the latest overall voltage info.
         """
-        voltage_info = self.data_retriever.get_bms_system_voltage()
+        voltage_info = self.snapshot.get_bms_system_voltage()
         if voltage_info:
             max_voltage = voltage_info.values["max_voltage"]
             min_voltage = voltage_info.values["min_voltage"]
@@ -437,7 +419,7 @@ class HeatmapGUI(QMainWindow):
         """
         Get the latest overall temperature info.
         """
-        temp_info = self.data_retriever.get_bms_system_temp()
+        temp_info = self.snapshot.get_bms_system_temp()
         if temp_info:
             max_temp = temp_info.values["max_temp"]
             min_temp = temp_info.values["min_temp"]
@@ -456,7 +438,7 @@ class HeatmapGUI(QMainWindow):
         """
         Get the latest error report from the BMS.
         """
-        fault_info = self.data_retriever.get_bms_processed_faults()
+        fault_info = self.snapshot.get_bms_processed_faults()
         if fault_info:
             faults = fault_info.values["faults"]
         else:
@@ -467,8 +449,8 @@ class HeatmapGUI(QMainWindow):
         """
         Get the latest overall battery pack info.
         """
-        pack_info = self.data_retriever.get_bms_pack_status()
-        if pack_info.values:
+        pack_info = self.snapshot.get_bms_pack_status()
+        if pack_info:
             pack_voltage = pack_info.values["pack_voltage"]
             pack_current = pack_info.values["pack_current"]
             pack_power = pack_info.values["pack_power"]
@@ -482,8 +464,8 @@ class HeatmapGUI(QMainWindow):
         """
         Get the latest charger output information.
         """
-        charger_out_info = self.data_retriever.get_bms_charger_out()
-        if charger_out_info.values:
+        charger_out_info = self.snapshot.get_bms_charger_out()
+        if charger_out_info:
             charger_voltage = charger_out_info.values["charger_voltage"]
             charger_current = charger_out_info.values["charger_current"]
             status_errors = charger_out_info.values["status_errors"]
@@ -493,6 +475,20 @@ class HeatmapGUI(QMainWindow):
             status_errors = []
         return charger_voltage, charger_current, status_errors
 
+    def show_cell_trend(self, cell_number):
+        """Open (or bring back) the trend window of a clicked cell"""
+        dialog = self.trend_dialogs.get(cell_number)
+        if dialog is None:
+            dialog = TrendDialog(
+                self.data_retriever.get_cell_history(),
+                cell_number,
+                self.pack_layout.describe_cell(cell_number),
+                self,
+            )
+            self.trend_dialogs[cell_number] = dialog
+        dialog.show()
+        dialog.raise_()
+
     def update_table_value(self, table, row_name, value):
         """
         Modify a specific value in the given table.
@@ -509,8 +505,12 @@ class HeatmapGUI(QMainWindow):
         Refresh the system voltage section of the combined table with new data.
         """
         max_voltage, min_voltage, avg_voltage, max_voltage_cell, min_voltage_cell = data
-        
-        volt_delta = max_voltage - min_voltage if min_voltage is not None and max_voltage is not None else 0
+
+        volt_delta = (
+            max_voltage - min_voltage
+            if min_voltage is not None and max_voltage is not None
+            else 0
+        )
         self.update_table_value(
             self.combined_voltage_temperature_table,
             "Max Voltage",
@@ -529,12 +529,12 @@ class HeatmapGUI(QMainWindow):
         self.update_table_value(
             self.combined_voltage_temperature_table,
             "Max Voltage Cell",
-            str(max_voltage_cell) if max_voltage_cell is not None else "None",
+            self.pack_layout.describe_cell(max_voltage_cell),
         )
         self.update_table_value(
             self.combined_voltage_temperature_table,
             "Min Voltage Cell",
-            str(min_voltage_cell) if min_voltage_cell is not None else "None",
+            self.pack_layout.describe_cell(min_voltage_cell),
         )
 
     def update_system_temperature_table(self, data):
@@ -542,7 +542,9 @@ class HeatmapGUI(QMainWindow):
         Refresh the system temperature section of the combined table with new data.
         """
         max_temp, min_temp, avg_temp, max_temp_cell, min_temp_cell = data
-        temp_delta = max_temp - min_temp if max_temp is not None and min_temp is not None else 0
+        temp_delta = (
+            max_temp - min_temp if max_temp is not None and min_temp is not None else 0
+        )
         self.update_table_value(
             self.combined_voltage_temperature_table,
             "Max Temperature",
@@ -561,12 +563,12 @@ class HeatmapGUI(QMainWindow):
         self.update_table_value(
             self.combined_voltage_temperature_table,
             "Max Temperature Cell",
-            str(max_temp_cell) if max_temp_cell is not None else "None",
+            self.pack_layout.describe_cell(max_temp_cell),
         )
         self.update_table_value(
             self.combined_voltage_temperature_table,
             "Min Temperature Cell",
-            str(min_temp_cell) if min_temp_cell is not None else "None",
+            self.pack_layout.describe_cell(min_temp_cell),
         )
 
     def update_charger_out_table(self, data):
@@ -642,6 +644,318 @@ class HeatmapGUI(QMainWindow):
             f"{pack_power:.3f}W" if pack_power is not None else "None",
         )
 
+    ####### PLAYBACK CONTROLS #######
+
+    def pause_button_clicked(self):
+        """Pause or resume the replayed log"""
+        if self.playback.paused:
+            self.playback.resume()
+            self.pauseButton.setText("Pause")
+        else:
+            self.playback.pause()
+            self.pauseButton.setText("Resume")
+
+    def update_playback_speed(self, index):
+        self.playback.set_speed(self.speed_dropdown.itemData(index))
+
+    def update_playback_position(self):
+        """Show how far into the log playback is"""
+        position = self.playback.log_time() - self.fake_bus.bus_start_time
+        self.position_label.setText(f"{position:.1f} s")
+
+
+class HeatmapGUI(QMainWindow):
+    """
+    Top level code for BMS VIEWER.
+    Shows one PackView per CAN bus, in tabs when there are several, above the
+    charge controls. Ingestion, polling on every bus and charge commands to the
+    pack shown when charging was started all run in an IngestionCore, attached
+    through an AsyncBridge.
+    """
+
+    ####### PURE PyQT VISUALIZATION ELEMENTS / STRUCTURING APPEARANCE OF GUI #######
+
+    def __init__(
+        self,
+        can_buses: dict,
+        max_fps=DEFAULT_MAX_FPS,
+        pack_layout: PackLayout = DEFAULT_LAYOUT,
+        recorders=None,
+        metrics=None,
+        metrics_file=None,
+        metrics_interval=DEFAULT_DUMP_INTERVAL,
+        stale_after=DEFAULT_STALE_AFTER,
+    ):
+        """can_buses maps the name of every pack to its bus, recorders the names to their SessionRecorder"""
+        ### INITIALIZES MAIN WINDOW + CHARGE STATE + NECESSARY CLASS INITIALIZATION ###
+        super().__init__()
+        self.setWindowTitle("BMS Viewer")
+        self.threadpool = QThreadPool()
+        self.pack_layout = pack_layout
+        self.bottomLayout = QHBoxLayout()
+        self.is_charging = False
+        self.metrics = metrics
+        self.core = IngestionCore(can_buses, pack_layout, recorders, metrics)
+        self.bridge = AsyncBridge(self.core)
+        self.packs = [
+            PackView(source, max_fps, pack_layout, metrics, stale_after, self)
+            for source in self.core.sources.values()
+        ]
+        self.packs_by_name = {pack.name: pack for pack in self.packs}
+        self.bridge.snapshot_published.connect(self.deliver_snapshot)
+
+        ### INTIALIZE UI ###
+        widget = QWidget(self)
+        widget.setLayout(self.bottomLayout)
+        self.create_buttons()
+        self.create_inputs()
+        self.set_layout()
+        self.diagnostics_dialog = None
+        if metrics is not None:
+            self.set_up_metrics(metrics_file, metrics_interval)
+        self.set_up_freshness()
+
+        ### SET UP MAIN LAYOUT ###
+        mainLayout = QVBoxLayout()
+        if len(self.packs) > 1:
+            self.pack_tabs = QTabWidget(self)
+            for pack in self.packs:
+                self.pack_tabs.addTab(pack, pack.name)
+                pack.visible = False
+            self.packs[0].visible = True
+            self.pack_tabs.currentChanged.connect(self.show_pack)
+            mainLayout.addWidget(self.pack_tabs)
+        else:
+            self.pack_tabs = None
+            mainLayout.addWidget(self.packs[0])
+        mainLayout.addWidget(widget)
+        central_widget = QWidget(self)
+        self.setCentralWidget(central_widget)
+        central_widget.setLayout(mainLayout)
+
+        ### START WORKERS AND MAXIMIZE WINDOW ###
+        QTimer.singleShot(0, self.start_workers)
+        self.showMaximized()
+
+    def set_up_metrics(self, metrics_file, metrics_interval):
+        """
+        Watch the heatmaps of every pack being painted for the frame-to-pixel
+        latency, add a Diagnostics button and, if asked to, dump the metrics periodically.
+        """
+        self.paint_probe = PaintProbe(self.metrics, self)
+        for pack in self.packs:
+            for heatmap in pack.heatmaps():
+                view = heatmap.view
+                target = (
+                    view.viewport() if isinstance(view, QAbstractScrollArea) else view
+                )
+                target.installEventFilter(self.paint_probe)
+
+        self.diagnosticsButton = QPushButton("Diagnostics")
+        self.diagnosticsButton.setFixedSize(BUTTON_WIDTH, BUTTON_HEIGHT)
+        self.diagnosticsButton.clicked.connect(self.show_diagnostics)
+        self.bottomLayout.addWidget(self.diagnosticsButton)
+
+        self.metrics_dumper = None
+        if metrics_file:
+            self.metrics_dumper = MetricsDumper(
+                self.metrics, metrics_file, metrics_interval, self
+            )
+
+    def set_up_freshness(self):
+        """
+        Periodically grey out the cells of the visible pack not updated for
+        stale_after seconds and summarise its stale cells and message rates in
+        the status bar. Staleness has to be checked on a timer, as a cell goes
+        stale precisely when no new data arrives for it.
+        """
+        self.freshness_timer = QTimer(self)
+        self.freshness_timer.timeout.connect(self.check_freshness)
+        self.freshness_timer.start(FRESHNESS_CHECK_INTERVAL_MS)
+
+    def check_freshness(self):
+        pack = self.current_pack()
+        summary = pack.check_freshness()
+        if len(self.packs) > 1:
+            summary = f"{pack.name}  |  {summary}"
+        self.statusBar().showMessage(summary)
+
+    def create_buttons(self):
+        """
+        Make the main buttons (Quit, Start, Stop).
+        Sets how they look and what they do when clicked.
+        """
+        self.quitButton = QPushButton("Quit")
+        self.quitButton.setStyleSheet(
+            f"background-color: {QUIT_BUTTON_STYLE}; border-radius: {BUTTON_BORDER_RADIUS}px;"
+        )
+        self.quitButton.setFixedSize(QUIT_BUTTON_WIDTH, BUTTON_HEIGHT)
+        self.quitButton.clicked.connect(self.quit_button_clicked)
+
+        self.startButton = QPushButton("Start")
+        self.startButton.setStyleSheet(
+            f"background-color: {START_BUTTON_STYLE}; border-radius: {BUTTON_BORDER_RADIUS}px;"
+        )
+        self.startButton.setFixedSize(BUTTON_WIDTH, BUTTON_HEIGHT)
+        self.startButton.clicked.connect(self.start_button_clicked)
+
+        self.stopButton = QPushButton("Stop")
+        self.stopButton.setStyleSheet(
+            f"background-color: {STOP_BUTTON_STYLE}; border-radius: {BUTTON_BORDER_RADIUS}px;"
+        )
+        self.stopButton.setFixedSize(BUTTON_WIDTH, BUTTON_HEIGHT)
+        self.stopButton.clicked.connect(self.stop_button_clicked)
+
+    def create_inputs(self):
+        """
+        Make input boxes for voltage, current, discharge balance, and threshold.
+        Adds text boxes, checkboxes, and dropdown menus.
+        """
+        self.textbox1 = QLineEdit(self)
+        self.textbox2 = QLineEdit(self)
+        self.balance_enable_checkbox = QCheckBox(self)
+        self.balance_cell_cnt_dropdown = QComboBox(self)
+        self.textbox4 = QLineEdit(self)
+
+        self.textbox1.setPlaceholderText("Enter voltage")
+        self.textbox2.setPlaceholderText("Enter current")
+        self.textbox4.setPlaceholderText("Enter discharge threshold")
+
+        cells_per_module = self.pack_layout.cells_per_module
+        self.balance_cell_cnt_dropdown.addItems(
+            [
+                str(count)
+                for count in range(1, min(cells_per_module, MAX_BALANCE_CELL_COUNT) + 1)
+                if cells_per_module % count == 0
+            ]
+        )
+        self.balance_cell_cnt_dropdown.setFixedSize(80, 30)
+
+        self.textbox1.textChanged.connect(
+            lambda: self.update_charge_voltage(self.textbox1, 1)
+        )
+        self.textbox2.textChanged.connect(
+            lambda: self.update_charge_current(self.textbox2, 2)
+        )
+        self.balance_enable_checkbox.stateChanged.connect(self.update_discharge_balance)
+        self.balance_cell_cnt_dropdown.currentTextChanged.connect(
+            self.update_discharge_balance_value
+        )
+        self.textbox4.textChanged.connect(
+            lambda: self.update_discharge_voltage_limit(self.textbox4, 4)
+        )
+
+        self.style_inputs()
+
+    def style_inputs(self):
+        """
+        Make the input boxes look nice.
+        Sets colors, borders, and other visual details.
+        """
+        style = """
+        QLineEdit, QComboBox {
+            background-color: #f0f0f0;
+            border: 2px solid #c0c0c0;
+            border-radius: 5px;
+            padding: 5px;
+            font-size: 14px;
+        }
+        QLineEdit:focus, QComboBox:focus {
+            border-color: #a0a0a0;
+        }
+        """
+        for widget in [
+            self.textbox1,
+            self.textbox2,
+            self.textbox4,
+            self.balance_cell_cnt_dropdown,
+        ]:
+            widget.setStyleSheet(style)
+            if isinstance(widget, QLineEdit):
+                widget.setFixedSize(150, 30)
+
+    def set_layout(self):
+        """
+        Arrange all UI elements in the bottom layout of the main window.
+        Organizes labels, input fields, and buttons horizontally with proper spacing.
+        """
+        voltage_label = QLabel("Voltage:")
+        current_label = QLabel("Current:")
+        balance_enable_label = QLabel("Enable Balancing:")
+        balance_cell_cnt_label = QLabel("Max. Cells/Segment:")
+        discharge_threshold_label = QLabel("Discharge Threshold:")
+
+        for label in [
+            voltage_label,
+            current_label,
+            balance_enable_label,
+            balance_cell_cnt_label,
+            discharge_threshold_label,
+        ]:
+            label.setStyleSheet("font-weight: bold; font-size: 14px;")
+
+        list_widgets = (
+            self.quitButton,
+            voltage_label,
+            self.textbox1,
+            current_label,
+            self.textbox2,
+            balance_enable_label,
+            self.balance_enable_checkbox,
+            balance_cell_cnt_label,
+            self.balance_cell_cnt_dropdown,
+            discharge_threshold_label,
+            self.textbox4,
+            self.startButton,
+            self.stopButton,
+        )
+
+        for wid in list_widgets:
+            self.bottomLayout.addWidget(wid)
+
+        self.bottomLayout.setSpacing(10)
+        self.bottomLayout.setContentsMargins(10, 10, 10, 10)
+
+    ####### WORKERS + CONNECTED FUNCTIONS/JOBS #######
+
+    def start_workers(self):
+        """Start the redraw dispatcher of every pack, then the ingestion core"""
+        for pack in self.packs:
+            pack.start_dispatcher()
+        self.bridge.start()
+
+    def deliver_snapshot(self, name, snapshot, arrival):
+        """Hand a snapshot published by the ingestion core to its pack"""
+        self.packs_by_name[name].on_snapshot(snapshot, arrival)
+
+    def current_pack(self) -> PackView:
+        """The pack currently shown"""
+        if self.pack_tabs is None:
+            return self.packs[0]
+        return self.packs[self.pack_tabs.currentIndex()]
+
+    def show_pack(self, index):
+        """Redraw only the pack of the selected tab"""
+        for pack_index, pack in enumerate(self.packs):
+            if pack_index != index:
+                pack.set_visible(False)
+        self.packs[index].set_visible(True)
+        self.check_freshness()
+
+    def show_diagnostics(self):
+        """Open (or bring back) the pipeline diagnostics window"""
+        if self.diagnostics_dialog is None:
+            self.diagnostics_dialog = DiagnosticsDialog(
+                self.metrics,
+                self,
+                lambda: self.current_pack().source.get_acceptance_counts(),
+                self.core.get_transmit_stats,
+            )
+        self.diagnostics_dialog.show()
+        self.diagnostics_dialog.raise_()
+
+    ####### CHARGE SETTINGS #######
+
     def update_charge_voltage(self, textbox, box_number):
         """
         Modify the global charge voltage based on user input.
@@ -654,6 +968,7 @@ class HeatmapGUI(QMainWindow):
         except:
             charge_voltage = float(0)
         print(f"Updated global_value{box_number}: {value}")
+        self.charge_settings_changed()
 
     def update_charge_current(self, textbox, box_number):
         """
@@ -667,14 +982,16 @@ class HeatmapGUI(QMainWindow):
         except:
             charge_current = float(0)
         print(f"Updated global_value{box_number}: {value}")
+        self.charge_settings_changed()
 
     def update_discharge_balance(self, state):
         """
         Modify the global discharge balance flag based on checkbox state.
         """
         global discharge_balance
-        discharge_balance = 0xff if state == Qt.Checked else 0
+        discharge_balance = 0xFF if state == Qt.Checked else 0
         print(f"Updated discharge_balance: {discharge_balance}")
+        self.charge_settings_changed()
 
     def update_discharge_balance_value(self):
         """
@@ -688,6 +1005,12 @@ class HeatmapGUI(QMainWindow):
         else:
             discharge_balance_value = 0x00
         print(f"Updated discharge_balance_value: {discharge_balance_value:#04x}")
+        self.charge_settings_changed()
+
+    def charge_settings_changed(self):
+        """Have the charge commands being sent follow the charge inputs"""
+        if self.is_charging:
+            self.core.update_charging(self.charge_settings())
 
     def update_discharge_voltage_limit(self, textbox, box_number):
         """
@@ -700,45 +1023,33 @@ class HeatmapGUI(QMainWindow):
         except:
             discharge_threshold = float(0)
         print(f"Updated global_value{box_number}: {value}")
+        self.charge_settings_changed()
 
     ####### FUNCTION FOR CHARGING FUNCTINOALITY #######
 
-    def charge_thread_function(self):
-        """
-        Continuously transmits charge commands while charging is active.
-        """
-        while self.is_charging:
-            message_to_send = encode_manual_charge(
-                {
-                    "charge_enable": 0xFF if discharge_balance == 0 else 0x00,
-                    "voltage": charge_voltage,
-                    "current": charge_current,
-                    "discharge_balance": discharge_balance_value,
-                    "discharge_threshold": discharge_threshold,
-                }
-            )
-            self.parser.send_can_messages(message_to_send, is_extended_id=False)
-            time.sleep(1)
-
-    def poll_thread_function(self):
+    def charge_settings(self):
         """
-        Continuously transmits polling messages while BMS viewer is connected
+        The charger command values from the charge inputs.
         """
-        while True:
-            message_to_send = encode_polling()
-            self.parser.send_can_messages(message_to_send, is_extended_id=False)
-            time.sleep(1)
+        return {
+            "charge_enable": 0xFF if discharge_balance == 0 else 0x00,
+            "voltage": charge_voltage,
+            "current": charge_current,
+            "discharge_balance": discharge_balance_value,
+            "discharge_threshold": discharge_threshold,
+        }
 
     def start_button_clicked(self):
         """
         Event handler for the Start button click.
-        Starts charging process and updates button states.
+        Starts charging the pack currently shown and updates button states.
         """
         self.update_discharge_balance_value()
         if not self.is_charging:
             self.is_charging = True
-            self.charge_worker = Worker(self.charge_thread_function)
-            self.threadpool.start(self.charge_worker)
+            charge_pack = self.current_pack()
+            print(f"Charging {charge_pack.name}")
+            self.core.start_charging(charge_pack.name, self.charge_settings())
             self.startButton.setEnabled(False)
             self.stopButton.setEnabled(True)
 
@@ -749,8 +1060,7 @@ class HeatmapGUI(QMainWindow):
         """
         if self.is_charging:
             self.is_charging = False
-            if self.charge_worker:
-                self.charge_worker.stop()
+            self.core.stop_charging()
             self.startButton.setEnabled(True)
             self.stopButton.setEnabled(False)
 
@@ -759,28 +1069,10 @@ class HeatmapGUI(QMainWindow):
     def quit_thread_function(self):
         """
         Cleanup function when exiting the application.
-        Halts all worker threads and deactivates charging.
-        """
-        if self.can_worker:
-            self.can_worker.stop()
-        if self.voltage_worker:
-            self.voltage_worker.stop()
-        if self.temperature_worker:
-            self.temperature_worker.stop()
-        if self.system_voltage_worker:
-            self.system_voltage_worker.stop()
-        if self.system_temperature_worker:
-            self.system_temperature_worker.stop()
-        if self.fault_worker:
-            self.fault_worker.stop()
-        if self.pack_worker:
-            self.pack_worker.stop()
-        if self.charger_out_worker:
-            self.charger_out_worker.stop()
-        if self.is_charging:
-            self.is_charging = False
-        if self.charge_worker:
-            self.charge_worker.stop()
+        Stops the ingestion core, which stops charging and closes the buses.
+        """
+        self.bridge.stop()
+        self.is_charging = False
         print("Quit button clicked")
         QApplication.quit()
 
@@ -796,9 +1088,7 @@ class HeatmapGUI(QMainWindow):
         """Handle the window close event."""
         self.quit_thread_function()
         self.threadpool.waitForDone()
-        self.parser.stop()
         event.accept()
 
     def __del__(self):
-        sys.exit(0)\
-            
+        sys.exit(0)
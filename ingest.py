@@ -0,0 +1,478 @@
+"""
+Asyncio ingestion core of the BMS viewer, usable with or without Qt.
+
+IngestionCore owns a CANMessageParser (acceptance filters and ring listener)
+and a BMSData for every CAN bus. One task per bus waits for its listener to
+signal new frames, drains them as a batch, decodes the batch in the decode
+executor shared by all buses and publishes the resulting pack-state snapshot
+to every subscriber. A TransmitScheduler task (see transmit.py) sends the
+polling message on every bus and, while charging, the charger command on one
+of them.
+
+Buses with a file descriptor (SocketCAN) are read by the event loop itself
+through python-can's Notifier; other buses keep the Notifier's reader thread,
+which only wakes the loop for the first frame after every drain.
+
+Headless tools run the core directly with asyncio.run(core.run()); the GUI
+runs it on a thread of its own through worker.AsyncBridge. Printing a summary
+of every pack once a second:
+
+    python ingest.py --interface socketcan --channel can0 [--interface ... --channel ...]
+"""
+
+### IMPORTS ###
+import argparse
+import asyncio
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import can
+import numpy as np
+
+from BMS_data_processing import BMSData
+from BMS_dispatcher import BMSFILTERS, encode_manual_charge, encode_polling
+from pack_layout import DEFAULT_LAYOUT, PackLayout
+from parse import MAX_PLAYBACK_SPEED, MIN_PLAYBACK_SPEED, CANFakeBus, CANMessageParser
+from state_index import StateIndex
+from traffic_generator import (
+    DEFAULT_CELL_RATE,
+    FAULT_PATTERNS,
+    SyntheticBus,
+    TrafficGenerator,
+)
+from transmit import TransmitScheduler, format_transmit_stats, to_can_message
+
+### CONSTANTS ###
+INTERFACES = ["fake", "synthetic", "socketcan", "pcan", "virtual"]
+DEFAULT_INTERFACE = "pcan"
+# channels used when none is given; the fake interface defaults to --file
+DEFAULT_CHANNELS = {
+    "synthetic": "synthetic",
+    "socketcan": "can0",
+    "pcan": "PCAN_USBBUS1",
+    "virtual": "PCAN_USBBUS1",
+}
+# let a few messages accumulate rather than waking up for every frame
+INGEST_MIN_INTERVAL = 0.005
+POLL_INTERVAL = 1.0
+CHARGE_INTERVAL = 1.0
+CHARGE_JOB = "charge"
+SUMMARY_INTERVAL = 1.0
+
+
+class BusSource:
+    """One CAN bus of the core: its pack state, and its parser once the core runs"""
+
+    def __init__(self, name: str, bus: can.BusABC, data: BMSData):
+        self.name = name
+        self.bus = bus
+        self.data = data
+        self.parser = None
+
+    def get_acceptance_counts(self) -> dict[int, tuple[int, int]] | None:
+        """See CANMessageParser.get_acceptance_counts; None before the core runs"""
+        return None if self.parser is None else self.parser.get_acceptance_counts()
+
+
+class IngestionCore:
+    """
+    Drains, decodes and publishes every bus, and transmits polling and charger
+    commands, all on one asyncio loop. run() is the only coroutine; the other
+    public methods may be called from any thread.
+
+    Subscribers are called on the loop as callback(name, snapshot, arrival)
+    whenever a batch changed the pack state of a bus, arrival being the
+    monotonic time the oldest frame of the batch reached the listener.
+    """
+
+    def __init__(
+        self,
+        can_buses: dict,
+        pack_layout: PackLayout = DEFAULT_LAYOUT,
+        recorders=None,
+        metrics=None,
+    ):
+        """can_buses maps the name of every pack to its bus, recorders the names to their SessionRecorder"""
+        recorders = recorders or {}
+        self.sources = {
+            name: BusSource(
+                name, bus, BMSData(pack_layout, recorders.get(name), metrics)
+            )
+            for name, bus in can_buses.items()
+        }
+        self.metrics = metrics
+        self.subscribers = []
+        self.loop = None
+        self.stopping = None
+        self.stop_requested = False
+        self.scheduler = TransmitScheduler()
+        # (pack name, settings) of the charger command being sent
+        self.charging = None
+
+    def subscribe(self, callback):
+        """Have callback(name, snapshot, arrival) called with every new snapshot"""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    ### LOOP SIDE ###
+
+    async def run(self):
+        """Ingest and transmit until stop() is called, then close every bus"""
+        self.loop = asyncio.get_running_loop()
+        self.stopping = asyncio.Event()
+        if self.stop_requested:
+            self.stopping.set()
+        executor = ThreadPoolExecutor(len(self.sources), thread_name_prefix="decode")
+        for source in self.sources.values():
+            source.parser = CANMessageParser(
+                filtering=BMSFILTERS, can_bus=source.bus, loop=self.loop
+            )
+        tasks = [
+            asyncio.create_task(
+                self.ingest(source, executor), name=f"{source.name} ingest"
+            )
+            for source in self.sources.values()
+        ]
+        # the polling message never changes, so every bus shares one
+        poll_message = to_can_message(encode_polling())
+        for source in self.sources.values():
+            self.scheduler.add(
+                f"{source.name} poll", source.parser, poll_message, POLL_INTERVAL
+            )
+        # charging may have been started before the loop ran
+        charging, self.charging = self.charging, None
+        if charging is not None:
+            self.set_charging(*charging)
+        tasks.append(asyncio.create_task(self.scheduler.run(), name="transmit"))
+        for task in tasks:
+            task.add_done_callback(self.task_done)
+        try:
+            await self.stopping.wait()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            executor.shutdown()
+            for source in self.sources.values():
+                source.parser.stop()
+                if source.data.recorder is not None:
+                    source.data.recorder.stop()
+
+    async def ingest(self, source: BusSource, executor: ThreadPoolExecutor):
+        """
+        Deal with incoming messages from one BMS.
+        Waits for messages, drains everything received since the last pass,
+        decodes it off the loop and publishes the new pack state if anything changed.
+        """
+        loop = self.loop
+        parser = source.parser
+        metrics = self.metrics
+        # set to begin with, for the messages received before the callback was in place
+        data_ready = asyncio.Event()
+        data_ready.set()
+        parser.set_data_ready_callback(
+            lambda: loop.call_soon_threadsafe(data_ready.set)
+        )
+        while True:
+            await data_ready.wait()
+            data_ready.clear()
+            if metrics is not None:
+                queue_depth = parser.get_queue_depth()
+            batch = parser.drain_batch()
+            if len(batch) == 0:
+                continue
+            arrival = parser.get_batch_arrival()
+            if metrics is not None:
+                metrics.record_batch(
+                    batch.arbitration_ids,
+                    queue_depth,
+                    parser.get_overflow_count(),
+                    arrival,
+                    source=source.name,
+                )
+            # one bad batch or subscriber must not freeze the pack for good
+            try:
+                await loop.run_in_executor(
+                    executor, source.data.process_bms_batch, batch
+                )
+                if source.data.take_dirty():
+                    snapshot = source.data.get_snapshot()
+                    for callback in self.subscribers:
+                        callback(source.name, snapshot, arrival)
+            except Exception:
+                print(f"ERROR: Cannot process a batch of {source.name}, skipping it")
+                traceback.print_exc()
+            await asyncio.sleep(INGEST_MIN_INTERVAL)
+
+    def task_done(self, task: asyncio.Task):
+        """Report a task that died of an exception and stop the core rather than run without it"""
+        if task.cancelled() or task.exception() is None:
+            return
+        print(f"ERROR: {task.get_name()} stopped")
+        traceback.print_exception(task.exception())
+        self.stopping.set()
+
+    def set_charging(self, name: str | None, settings: dict | None):
+        """
+        Send charger commands with the given encode_manual_charge values on the
+        bus of the named pack, or stop sending them given None. The command is
+        only re-encoded when the pack or settings change.
+        """
+        previous = self.charging
+        self.charging = None if name is None else (name, dict(settings))
+        if self.loop is None or self.charging == previous:
+            return
+        if name is None:
+            self.scheduler.remove(CHARGE_JOB)
+            return
+        message = to_can_message(encode_manual_charge(settings))
+        if previous is not None and previous[0] == name:
+            self.scheduler.update(CHARGE_JOB, message)
+        else:
+            self.scheduler.add(
+                CHARGE_JOB, self.sources[name].parser, message, CHARGE_INTERVAL
+            )
+
+    ### ANY THREAD ###
+
+    def start_charging(self, name: str, settings: dict):
+        """
+        Start sending charge commands with the given encode_manual_charge values
+        on the bus of the named pack, replacing any charging already under way.
+        """
+        self.call_soon(self.set_charging, name, dict(settings))
+
+    def update_charging(self, settings: dict):
+        """Change the values of the charge commands being sent, if charging"""
+        self.call_soon(self.update_charge_settings, dict(settings))
+
+    def update_charge_settings(self, settings: dict):
+        if self.charging is not None:
+            self.set_charging(self.charging[0], settings)
+
+    def stop_charging(self):
+        self.call_soon(self.set_charging, None, None)
+
+    def call_soon(self, function, *args):
+        """Call function(*args) on the loop, or right away before the loop runs"""
+        if self.loop is None:
+            function(*args)
+        else:
+            self.loop.call_soon_threadsafe(function, *args)
+
+    def get_transmit_stats(self) -> dict[str, dict]:
+        """See TransmitScheduler.stats"""
+        return self.scheduler.stats()
+
+    def stop(self):
+        """Make run() return, closing every bus"""
+        self.stop_requested = True
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopping.set)
+
+
+def playback_speed(value: str) -> float | None:
+    """Parse --speed: a multiplier of real time, or "max" for as fast as possible"""
+    if value.lower() == "max":
+        return None
+    speed = float(value)
+    if not MIN_PLAYBACK_SPEED <= speed <= MAX_PLAYBACK_SPEED:
+        raise argparse.ArgumentTypeError(
+            f"speed must be between {MIN_PLAYBACK_SPEED:g} and {MAX_PLAYBACK_SPEED:g}, or max"
+        )
+    return speed
+
+
+def add_bus_arguments(parser: argparse.ArgumentParser):
+    """Add the options selecting the buses and configuring the fake and synthetic ones"""
+    parser.add_argument(
+        "--interface",
+        help="Specify interface such as pcan, fake, socketcan, or synthetic for generated traffic; "
+        "repeat with --channel for several packs, one per bus",
+        choices=INTERFACES,
+        action="append",
+    )
+    parser.add_argument(
+        "--channel",
+        help="Specify channel such as PCAN_USBBUS1, vcan0, can0; the log file for the fake "
+        "interface and a name for the synthetic one. Give one per --interface",
+        action="append",
+    )
+    parser.add_argument(
+        "--file", metavar="CAN DATA SOURCE FILE", default="can_data.log"
+    )
+    parser.add_argument(
+        "--speed",
+        help=f"Fake interface playback speed ({MIN_PLAYBACK_SPEED:g} to {MAX_PLAYBACK_SPEED:g}, or max)",
+        type=playback_speed,
+        default=1.0,
+    )
+    parser.add_argument(
+        "--start",
+        help="Fake interface: seconds into the log to start playback from",
+        type=float,
+    )
+    parser.add_argument(
+        "--end",
+        help="Fake interface: seconds into the log to loop back at",
+        type=float,
+    )
+    parser.add_argument(
+        "--replay-index",
+        help="Fake interface: build/use <file>.idx and <file>.state.npz indexes so seeking "
+        "doesn't rescan the log and shows the complete pack state at the new position",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--rate",
+        help="Synthetic interface: CELLVALUE frames per second",
+        type=float,
+        default=DEFAULT_CELL_RATE,
+    )
+    parser.add_argument(
+        "--fault",
+        help="Synthetic interface: fault pattern to simulate",
+        choices=FAULT_PATTERNS,
+        default="none",
+    )
+
+
+def bus_pairs(parser: argparse.ArgumentParser, args) -> dict[str, tuple[str, str]]:
+    """Pair up --interface and --channel, mapping the name of every pack to its pair"""
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
+    interfaces = args.interface or [DEFAULT_INTERFACE]
+    channels = args.channel or []
+    if len(interfaces) > 1 and len(channels) != len(interfaces):
+        parser.error("give one --channel per --interface for several packs")
+    if len(channels) > len(interfaces):
+        parser.error("more --channel than --interface options")
+    pairs = {}
+    for index, interface in enumerate(interfaces):
+        if index < len(channels):
+            channel = channels[index]
+        else:
+            channel = DEFAULT_CHANNELS.get(interface, args.file)
+        pairs[f"{interface}:{channel}"] = (interface, channel)
+    if len(pairs) < len(interfaces):
+        parser.error("every --interface/--channel pair must be different")
+    return pairs
+
+
+def create_bus(interface: str, channel: str, args, pack_layout: PackLayout):
+    """
+    Create the CAN bus of one --interface/--channel pair.
+    For the fake interface the channel is the log file to replay.
+    """
+    if interface == "fake":
+        if channel is None:
+            print(
+                'ERROR: Provide CAN data file with "--file FILE" to use fake interface.'
+            )
+            exit(-1)
+
+        state_index = None
+        if args.replay_index:
+            try:
+                state_index = StateIndex(channel)
+            except (OSError, ValueError) as e:
+                print(f"ERROR: Cannot index {channel}: {e}")
+                exit(-1)
+
+        return CANFakeBus(
+            channel,
+            speed=args.speed,
+            start=args.start,
+            end=args.end,
+            use_index=args.replay_index,
+            state_index=state_index,
+        )
+    if interface == "synthetic":
+        return SyntheticBus(
+            TrafficGenerator(
+                pack_layout.num_cells, cell_rate=args.rate, fault=args.fault
+            )
+        )
+    try:
+        return can.Bus(
+            channel=channel,
+            interface=interface,
+            receive_own_messages=False,
+        )
+    except can.interfaces.pcan.pcan.PcanCanInitializationError:
+        print(f"ERROR: Invalid interface/channel specified: {interface} {channel}")
+        exit(-1)
+
+
+def format_pack_summary(name: str, snapshot, frames: int) -> str:
+    """One line of the headless summary: frames received and the pack's extremes"""
+    voltages = snapshot.get_cell_voltages()
+    temperatures = snapshot.get_cell_temperatures()
+    parts = [f"{name}: {frames} frames"]
+    if not np.all(np.isnan(voltages)):
+        parts.append(f"cells {np.nanmin(voltages):.3f}-{np.nanmax(voltages):.3f}V")
+    if not np.all(np.isnan(temperatures)):
+        parts.append(f"{np.nanmin(temperatures):.1f}-{np.nanmax(temperatures):.1f}°C")
+    pack_status = snapshot.get_bms_pack_status()
+    if pack_status:
+        parts.append(
+            f"pack {pack_status.values['pack_voltage']:.1f}V {pack_status.values['pack_current']:.1f}A"
+        )
+    return "  ".join(parts)
+
+
+async def print_summaries(core: IngestionCore, seconds: float | None):
+    """Print one line per pack every SUMMARY_INTERVAL, for the given seconds or forever"""
+    started = time.monotonic()
+    while seconds is None or time.monotonic() - started < seconds:
+        await asyncio.sleep(SUMMARY_INTERVAL)
+        for name, source in core.sources.items():
+            snapshot = source.data.get_snapshot()
+            frames = int(snapshot.get_message_counts().sum())
+            print(format_pack_summary(name, snapshot, frames))
+    print(format_transmit_stats(core.get_transmit_stats()))
+    core.stop()
+
+
+async def run_headless(core: IngestionCore, seconds: float | None):
+    await asyncio.gather(core.run(), print_summaries(core, seconds))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Headless BMS ingestion, printing a summary of every pack"
+    )
+    add_bus_arguments(parser)
+    parser.add_argument(
+        "--layout",
+        metavar="PACK LAYOUT FILE",
+        help="JSON pack layout (cells per module, module count, grid); defaults to 144 cells in 12x12",
+    )
+    parser.add_argument(
+        "--seconds",
+        help="Stop after this many seconds (default: run until interrupted)",
+        type=float,
+    )
+    args = parser.parse_args()
+    pack_layout = (
+        DEFAULT_LAYOUT if args.layout is None else PackLayout.from_file(args.layout)
+    )
+    pairs = bus_pairs(parser, args)
+    core = IngestionCore(
+        {
+            name: create_bus(interface, channel, args, pack_layout)
+            for name, (interface, channel) in pairs.items()
+        },
+        pack_layout,
+    )
+    try:
+        asyncio.run(run_headless(core, args.seconds))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,61 +1,142 @@
 import argparse
+import os
+import re
 
-import can
 from PyQt5.QtCore import *
 from PyQt5.QtGui import *
 from PyQt5.QtWidgets import *
 
-from heatmapGUI import HeatmapGUI
-from parse import CANFakeBus
+from freshness import DEFAULT_STALE_AFTER
+from heatmapGUI import DEFAULT_MAX_FPS, HeatmapGUI
+from ingest import add_bus_arguments, bus_pairs, create_bus
+from metrics import DEFAULT_DUMP_INTERVAL, PipelineMetrics
+from pack_layout import DEFAULT_LAYOUT, PackLayout
+from recorder import DEFAULT_MAX_FILE_BYTES, DEFAULT_MAX_FILE_SECONDS, SessionRecorder
+
+
+def safe_name(name: str) -> str:
+    """A pack name usable as a directory name"""
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
 
 
 def main():
     """
     1. Parse arguments
     2. Create the QApplication instance
-    3. Create the CAN bus instance
+    3. Create a CAN bus instance per --interface/--channel pair
     4. Create the HeatmapGUI instance
     5. Start the application event loop
     """
     parser = argparse.ArgumentParser(description="BMS Data Viewer")
+    add_bus_arguments(parser)
+    parser.add_argument(
+        "--max-fps",
+        help="Maximum number of display refreshes per second",
+        type=float,
+        default=DEFAULT_MAX_FPS,
+    )
+    parser.add_argument(
+        "--layout",
+        metavar="PACK LAYOUT FILE",
+        help="JSON pack layout (cells per module, module count, grid); defaults to 144 cells in 12x12",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="DIRECTORY",
+        help="Record the decoded BMS data to compressed files in this directory",
+    )
+    parser.add_argument(
+        "--record-max-mb",
+        help="Start a new recording file after this many megabytes",
+        type=float,
+        default=DEFAULT_MAX_FILE_BYTES / (1024 * 1024),
+    )
+    parser.add_argument(
+        "--record-max-minutes",
+        help="Start a new recording file after this many minutes",
+        type=float,
+        default=DEFAULT_MAX_FILE_SECONDS / 60,
+    )
     parser.add_argument(
-        "--interface",
-        help="Specify interface such as pcan, fake, socketcan",
-        choices=["fake", "socketcan", "pcan", "virtual"],
-        default="pcan",
+        "--metrics",
+        help="Measure per-stage throughput and latency, shown in a Diagnostics window",
+        action="store_true",
     )
     parser.add_argument(
-        "--channel",
-        help="Specify channel such as PCAN_USBBUS1, vcan0, can0",
-        default="PCAN_USBBUS1",
+        "--metrics-file",
+        metavar="FILE",
+        help="Append the metrics to this file periodically (JSON lines for .json/.jsonl, "
+        "text otherwise); implies --metrics",
     )
     parser.add_argument(
-        "--file", metavar="CAN DATA SOURCE FILE", default="can_data.log"
+        "--metrics-interval",
+        help="Seconds between metrics dumps",
+        type=float,
+        default=DEFAULT_DUMP_INTERVAL,
+    )
+    parser.add_argument(
+        "--stale-after",
+        help="Grey out cells not updated for this many seconds",
+        type=float,
+        default=DEFAULT_STALE_AFTER,
     )
     args = parser.parse_args()
+    if args.max_fps <= 0:
+        parser.error("--max-fps must be positive")
+    if args.metrics_interval <= 0:
+        parser.error("--metrics-interval must be positive")
+    if args.stale_after <= 0:
+        parser.error("--stale-after must be positive")
 
-    # Create CAN bus
-    if args.interface == "fake":
-        if args.file is None:
-            print(
-                'ERROR: Provide CAN data file with "--file FILE" to use fake interface.'
-            )
+    pack_layout = DEFAULT_LAYOUT
+    if args.layout is not None:
+        try:
+            pack_layout = PackLayout.from_file(args.layout)
+        except (OSError, ValueError, TypeError) as e:
+            print(f"ERROR: Invalid pack layout {args.layout}: {e}")
             exit(-1)
 
-        bus = CANFakeBus(args.file)
-    else:
-        try:
-            bus = can.Bus(
-                channel=args.channel,
-                interface=args.interface,
-                receive_own_messages=False,
+    pairs = bus_pairs(parser, args)
+    names = list(pairs)
+
+    # Create CAN buses
+    can_buses = {
+        name: create_bus(interface, channel, args, pack_layout)
+        for name, (interface, channel) in pairs.items()
+    }
+
+    metrics = None
+    if args.metrics or args.metrics_file is not None:
+        metrics = PipelineMetrics()
+
+    recorders = None
+    if args.record is not None:
+        recorders = {}
+        for name in names:
+            # one subdirectory per bus when recording several
+            directory = (
+                args.record
+                if len(names) == 1
+                else os.path.join(args.record, safe_name(name))
+            )
+            recorders[name] = SessionRecorder(
+                directory,
+                max_file_bytes=int(args.record_max_mb * 1024 * 1024),
+                max_file_seconds=args.record_max_minutes * 60,
+                metrics=metrics,
             )
-        except can.interfaces.pcan.pcan.PcanCanInitializationError:
-            print("ERROR: Invalid interface/channel specified!")
-            exit(-1)
 
     app = QApplication([])
-    heatmapGUI = HeatmapGUI(bus)
+    heatmapGUI = HeatmapGUI(
+        can_buses,
+        max_fps=args.max_fps,
+        pack_layout=pack_layout,
+        recorders=recorders,
+        metrics=metrics,
+        metrics_file=args.metrics_file,
+        metrics_interval=args.metrics_interval,
+        stale_after=args.stale_after,
+    )
     app.exec_()
 
 
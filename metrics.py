@@ -0,0 +1,328 @@
+"""
+Pipeline instrumentation for the BMS viewer.
+
+Follows every batch of frames from the CAN listener through decoding in
+BMSData to the GUI redraw and the next paint of a heatmap:
+
+    queue           first frame of a batch reaching the listener -> batch drained
+    decode          time spent decoding, per message type
+    dispatch        data marked dirty -> redraw started on the GUI thread
+    redraw          redraw of the dirty widgets
+    frame_to_pixel  first frame of the data shown reaching the listener -> heatmap painted
+
+plus frames/sec per arbitration ID, queue depth, frames received, frames
+coalesced (superseded by a newer frame of the same cell or ID before being
+stored), frames dropped by the listener on overflow and recorded rows
+dropped because the session recorder's writer fell behind. Counters are plain
+attributes updated in place; latency histograms have fixed log-spaced buckets.
+Metrics are off unless a PipelineMetrics is handed to the pipeline, and every
+instrumented call site only tests for None when they are off.
+
+snapshot() takes a copy of the cumulative counters; report() turns two
+snapshots into rates and percentiles, and format_report() into text.
+"""
+
+### IMPORTS ###
+import json
+import threading
+from time import monotonic
+
+import numpy as np
+
+### CONSTANTS ###
+# histogram bucket upper bounds, 0.1 ms to 10 s, 10 buckets per decade
+LATENCY_BUCKETS = np.logspace(-4, 1, 51)
+LATENCY_STAGES = ("queue", "decode", "dispatch", "redraw", "frame_to_pixel")
+PERCENTILES = (50, 90, 99)
+DEFAULT_DUMP_INTERVAL = 10.0
+
+
+class LatencyHistogram:
+    """Counts of latencies in log-spaced buckets, with the total for the mean."""
+
+    def __init__(self):
+        self.counts = np.zeros(len(LATENCY_BUCKETS) + 1, dtype=np.int64)
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, seconds: float) -> None:
+        self.counts[np.searchsorted(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.maximum = max(self.maximum, seconds)
+
+    def copy(self) -> "LatencyHistogram":
+        histogram = LatencyHistogram()
+        histogram.counts = self.counts.copy()
+        histogram.total = self.total
+        histogram.maximum = self.maximum
+        return histogram
+
+
+def summarise_histogram(
+    current: LatencyHistogram, previous: LatencyHistogram | None
+) -> dict:
+    """Count, mean and percentiles (bucket upper bounds, in ms) of the samples between two copies"""
+    counts = current.counts - (previous.counts if previous else 0)
+    total = current.total - (previous.total if previous else 0.0)
+    count = int(counts.sum())
+    summary = {"count": count, "mean_ms": total / count * 1e3 if count else None}
+    cumulative = np.cumsum(counts)
+    bounds = np.append(LATENCY_BUCKETS, np.inf)
+    for percentile in PERCENTILES:
+        if count:
+            bucket = int(np.searchsorted(cumulative, count * percentile / 100))
+            summary[f"p{percentile}_ms"] = float(
+                min(bounds[bucket], current.maximum) * 1e3
+            )
+        else:
+            summary[f"p{percentile}_ms"] = None
+    summary["max_ms"] = current.maximum * 1e3 if count else None
+    return summary
+
+
+class PipelineMetrics:
+    """
+    Counters and latency histograms of the ingestion and display pipeline.
+    Updated from the ingestion threads (batches, decoding), one per bus, and
+    the GUI thread (redraws, paints); read with snapshot() from either. Queue
+    depth and drops are summed over the buses, each reporting as a source.
+    """
+
+    def __init__(self):
+        self.started = monotonic()
+        self.frames_by_id = {}
+        self.frame_count = 0
+        self.batch_count = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.overflow_count = 0
+        self.coalesced_count = 0
+        self.recording_dropped_chunks = 0
+        self.recording_dropped_rows = 0
+        self.queue_depths = {}
+        self.overflow_counts = {}
+        self.decode_seconds = {}
+        self.decode_frames = {}
+        self.redraw_count = 0
+        self.paint_count = 0
+        self.histograms = {stage: LatencyHistogram() for stage in LATENCY_STAGES}
+        # oldest listener arrival / dirty marking not yet shown on screen
+        self.pending_arrival = None
+        self.pending_dirty = None
+        # only taken by the ingestion threads, which may run side by side
+        self.ingest_lock = threading.Lock()
+
+    ### INGESTION THREAD ###
+
+    def record_batch(
+        self,
+        arbitration_ids: np.ndarray,
+        queue_depth: int,
+        overflow_count: int,
+        arrival: float | None,
+        source=None,
+    ) -> None:
+        """
+        Account for a drained batch; arrival is when its first frame reached the listener.
+        queue_depth and overflow_count are the source listener's current values.
+        """
+        now = monotonic()
+        ids, counts = np.unique(arbitration_ids, return_counts=True)
+        with self.ingest_lock:
+            self.batch_count += 1
+            self.frame_count += len(arbitration_ids)
+            for arbitration_id, count in zip(ids.tolist(), counts.tolist()):
+                self.frames_by_id[arbitration_id] = (
+                    self.frames_by_id.get(arbitration_id, 0) + count
+                )
+            self.queue_depths[source] = queue_depth
+            self.overflow_counts[source] = overflow_count
+            self.queue_depth = sum(self.queue_depths.values())
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+            self.overflow_count = sum(self.overflow_counts.values())
+            if arrival is not None:
+                self.histograms["queue"].add(now - arrival)
+
+    def record_coalesced(self, frames: int) -> None:
+        """Account for frames of a batch that a newer frame of the same cell or ID superseded"""
+        with self.ingest_lock:
+            self.coalesced_count += frames
+
+    def record_recording_drop(self, rows: int) -> None:
+        """A chunk of rows was not recorded, as the recorder's writer fell behind"""
+        with self.ingest_lock:
+            self.recording_dropped_chunks += 1
+            self.recording_dropped_rows += rows
+
+    def record_decode(self, message_type: str, seconds: float, frames: int = 1) -> None:
+        with self.ingest_lock:
+            self.decode_seconds[message_type] = (
+                self.decode_seconds.get(message_type, 0.0) + seconds
+            )
+            self.decode_frames[message_type] = (
+                self.decode_frames.get(message_type, 0) + frames
+            )
+            self.histograms["decode"].add(seconds)
+
+    def mark_dirty(self, arrival: float | None) -> None:
+        """New data is waiting to be drawn; remember the oldest frame behind it"""
+        with self.ingest_lock:
+            if self.pending_dirty is None:
+                self.pending_dirty = monotonic()
+            if arrival is not None and (
+                self.pending_arrival is None or arrival < self.pending_arrival
+            ):
+                self.pending_arrival = arrival
+
+    ### GUI THREAD ###
+
+    def record_redraw(self, started: float, finished: float) -> None:
+        self.redraw_count += 1
+        if self.pending_dirty is not None:
+            self.histograms["dispatch"].add(started - self.pending_dirty)
+            self.pending_dirty = None
+        self.histograms["redraw"].add(finished - started)
+
+    def record_paint(self) -> None:
+        """A heatmap is being painted: everything ingested so far is now on screen"""
+        self.paint_count += 1
+        if self.pending_arrival is not None:
+            self.histograms["frame_to_pixel"].add(monotonic() - self.pending_arrival)
+            self.pending_arrival = None
+
+    ### REPORTING ###
+
+    def snapshot(self) -> dict:
+        """A copy of the cumulative counters, to diff against a later one with report()"""
+        return {
+            "started": self.started,
+            "time": monotonic(),
+            "frames_by_id": dict(self.frames_by_id),
+            "frame_count": self.frame_count,
+            "batch_count": self.batch_count,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "overflow_count": self.overflow_count,
+            "coalesced_count": self.coalesced_count,
+            "recording_dropped_chunks": self.recording_dropped_chunks,
+            "recording_dropped_rows": self.recording_dropped_rows,
+            "decode_seconds": dict(self.decode_seconds),
+            "decode_frames": dict(self.decode_frames),
+            "redraw_count": self.redraw_count,
+            "paint_count": self.paint_count,
+            "histograms": {
+                stage: histogram.copy() for stage, histogram in self.histograms.items()
+            },
+        }
+
+
+def report(current: dict, previous: dict | None = None) -> dict:
+    """
+    Rates, decode costs and latency percentiles over the interval between two
+    snapshots (since metrics started if previous is None), as plain JSON types.
+    """
+    previous_time = previous["time"] if previous else current["started"]
+    interval = max(current["time"] - previous_time, 1e-9)
+
+    def delta(name, key=None):
+        if key is None:
+            return current[name] - (previous[name] if previous else 0)
+        return current[name].get(key, 0) - (
+            previous[name].get(key, 0) if previous else 0
+        )
+
+    decode = {}
+    for message_type in sorted(current["decode_seconds"]):
+        frames = delta("decode_frames", message_type)
+        seconds = delta("decode_seconds", message_type)
+        decode[message_type] = {
+            "frames": frames,
+            "us_per_frame": seconds / frames * 1e6 if frames else None,
+            "cpu_percent": seconds / interval * 100,
+        }
+
+    return {
+        "interval_s": interval,
+        "frames_per_s": delta("frame_count") / interval,
+        "frames_per_s_by_id": {
+            f"{arbitration_id:#x}": delta("frames_by_id", arbitration_id) / interval
+            for arbitration_id in sorted(current["frames_by_id"])
+        },
+        "batches_per_s": delta("batch_count") / interval,
+        "queue_depth": current["queue_depth"],
+        "max_queue_depth": current["max_queue_depth"],
+        "received": delta("frame_count"),
+        "total_received": current["frame_count"],
+        "coalesced": delta("coalesced_count"),
+        "total_coalesced": current["coalesced_count"],
+        "drops": delta("overflow_count"),
+        "total_drops": current["overflow_count"],
+        "recording_drops": delta("recording_dropped_rows"),
+        "total_recording_drops": current["recording_dropped_rows"],
+        "total_recording_dropped_chunks": current["recording_dropped_chunks"],
+        "redraws_per_s": delta("redraw_count") / interval,
+        "paints_per_s": delta("paint_count") / interval,
+        "decode": decode,
+        "latency": {
+            stage: summarise_histogram(
+                histogram, previous["histograms"][stage] if previous else None
+            )
+            for stage, histogram in current["histograms"].items()
+        },
+    }
+
+
+def format_report(metrics_report: dict) -> str:
+    """Render a report() as a fixed-width text block"""
+
+    def ms(value):
+        return "-" if value is None else f"{value:.2f}"
+
+    lines = [
+        f"Interval {metrics_report['interval_s']:.1f}s: {metrics_report['frames_per_s']:,.0f} frames/s "
+        f"in {metrics_report['batches_per_s']:.1f} batches/s, "
+        f"{metrics_report['redraws_per_s']:.1f} redraws/s, {metrics_report['paints_per_s']:.1f} paints/s",
+        f"Queue depth {metrics_report['queue_depth']} (max {metrics_report['max_queue_depth']}), "
+        f"drops {metrics_report['drops']} (total {metrics_report['total_drops']})",
+        f"Received {metrics_report['received']} (total {metrics_report['total_received']}), "
+        f"coalesced {metrics_report['coalesced']} (total {metrics_report['total_coalesced']})",
+        f"Recording drops {metrics_report['recording_drops']} rows "
+        f"(total {metrics_report['total_recording_drops']} rows "
+        f"in {metrics_report['total_recording_dropped_chunks']} chunks)",
+        "",
+        f"{'ID':<10}{'frames/s':>12}",
+    ]
+    for arbitration_id, rate in metrics_report["frames_per_s_by_id"].items():
+        lines.append(f"{arbitration_id:<10}{rate:>12,.1f}")
+
+    lines += ["", f"{'Decode':<12}{'frames':>10}{'us/frame':>10}{'CPU %':>8}"]
+    for message_type, decode in metrics_report["decode"].items():
+        lines.append(
+            f"{message_type:<12}{decode['frames']:>10}{ms(decode['us_per_frame']):>10}"
+            f"{decode['cpu_percent']:>8.2f}"
+        )
+
+    lines += [
+        "",
+        f"{'Latency ms':<16}{'count':>8}{'mean':>9}"
+        + "".join(f"{f'p{percentile}':>9}" for percentile in PERCENTILES)
+        + f"{'max':>9}",
+    ]
+    for stage, summary in metrics_report["latency"].items():
+        lines.append(
+            f"{stage:<16}{summary['count']:>8}{ms(summary['mean_ms']):>9}"
+            + "".join(
+                f"{ms(summary[f'p{percentile}_ms']):>9}" for percentile in PERCENTILES
+            )
+            + f"{ms(summary['max_ms']):>9}"
+        )
+    return "\n".join(lines)
+
+
+def dump_report(metrics_report: dict, path: str) -> None:
+    """Append a report to a dump file: one JSON object per line for .json/.jsonl, text otherwise"""
+    with open(path, "a") as f:
+        if path.endswith((".json", ".jsonl")):
+            f.write(json.dumps(metrics_report) + "\n")
+        else:
+            f.write(format_report(metrics_report) + "\n\n")
@@ -0,0 +1,111 @@
+### IMPORTS ###
+import json
+
+import numpy as np
+
+### CONSTANTS ###
+DEFAULT_CELLS_PER_MODULE = 12
+DEFAULT_MODULE_COUNT = 12
+
+
+class PackLayout:
+    """
+    Describes the geometry of a battery pack: how many cells it has, how they
+    are grouped into modules, and where each cell is drawn on the heatmap grid.
+
+    By default modules are laid out one per grid row (modules_per_row=1), which
+    for 12 modules of 12 cells gives the classic 12x12 grid. Wider packs can put
+    several modules side by side, and any other arrangement can be given as an
+    explicit (row, column) position per cell.
+    Attributes:
+        cells_per_module (int): Number of cells in each module
+        module_count (int): Number of modules in the pack
+        num_cells (int): Total number of cells
+        rows (int): Number of rows of the heatmap grid
+        columns (int): Number of columns of the heatmap grid
+        flat_positions (np.ndarray): Flat grid index of every cell, by cell number - 1
+    """
+
+    def __init__(
+        self,
+        cells_per_module=DEFAULT_CELLS_PER_MODULE,
+        module_count=DEFAULT_MODULE_COUNT,
+        modules_per_row=1,
+        rows=None,
+        columns=None,
+        positions=None,
+    ):
+        self.cells_per_module = cells_per_module
+        self.module_count = module_count
+        self.num_cells = cells_per_module * module_count
+
+        if positions is None:
+            cell = np.arange(self.num_cells)
+            module = cell // cells_per_module
+            position_rows = module // modules_per_row
+            position_columns = (module % modules_per_row) * cells_per_module + (
+                cell % cells_per_module
+            )
+        else:
+            if len(positions) != self.num_cells:
+                raise ValueError(
+                    f"Pack layout lists {len(positions)} positions for {self.num_cells} cells"
+                )
+            position_rows, position_columns = np.asarray(positions, dtype=np.int64).T
+
+        self.rows = rows if rows is not None else int(position_rows.max()) + 1
+        self.columns = (
+            columns if columns is not None else int(position_columns.max()) + 1
+        )
+        if position_rows.max() >= self.rows or position_columns.max() >= self.columns:
+            raise ValueError("Pack layout places cells outside of its grid")
+
+        self.flat_positions = position_rows * self.columns + position_columns
+        if len(np.unique(self.flat_positions)) != self.num_cells:
+            raise ValueError(
+                "Pack layout places several cells on the same grid position"
+            )
+        self.is_row_major = self.rows * self.columns == self.num_cells and bool(
+            np.all(self.flat_positions == np.arange(self.num_cells))
+        )
+
+        self.occupied = np.zeros((self.rows, self.columns), dtype=bool)
+        self.occupied.flat[self.flat_positions] = True
+        self.cell_numbers = np.zeros((self.rows, self.columns), dtype=np.int64)
+        self.cell_numbers.flat[self.flat_positions] = np.arange(1, self.num_cells + 1)
+
+    @classmethod
+    def from_file(cls, path: str) -> "PackLayout":
+        """
+        Load a pack layout from a JSON file, e.g.
+        {"cells_per_module": 12, "module_count": 40, "modules_per_row": 2}
+        Every key is optional and matches the constructor arguments;
+        "positions" is a list of [row, column] pairs in cell number order.
+        """
+        with open(path, "r") as f:
+            return cls(**json.load(f))
+
+    def to_grid(self, cell_values: np.ndarray) -> np.ndarray:
+        """
+        Arrange per-cell values (indexed by cell number - 1) on the heatmap grid.
+        A zero-copy reshape for row-major layouts; otherwise positions without a
+        cell are NaN.
+        """
+        if self.is_row_major:
+            return cell_values.reshape(self.rows, self.columns)
+        grid = np.full((self.rows, self.columns), np.nan, dtype=cell_values.dtype)
+        grid.flat[self.flat_positions] = cell_values
+        return grid
+
+    def describe_cell(self, cell_number) -> str:
+        """Label a cell number with the module it belongs to, e.g. "37 (M4 #1)"."""
+        if cell_number is None:
+            return "None"
+        cell_number = int(cell_number)
+        if not 1 <= cell_number <= self.num_cells or self.module_count == 1:
+            return str(cell_number)
+        module, position = divmod(cell_number - 1, self.cells_per_module)
+        return f"{cell_number} (M{module + 1} #{position + 1})"
+
+
+DEFAULT_LAYOUT = PackLayout()
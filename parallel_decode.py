@@ -0,0 +1,239 @@
+"""
+Parallel offline decoding of large recordings.
+
+The recording is split into contiguous, time-ordered chunks (at line
+boundaries for candump -L logs, at record boundaries for capture files) and
+every chunk is decoded in a separate process. Workers return plain NumPy
+columns per stream, in the same layout the recorder writes (see STREAMS in
+recorder.py), rather than ProcessedData objects, so sending results back
+costs one buffer copy per column. Chunks are merged in file order and then
+stably sorted by timestamp, so the output doesn't depend on worker count or
+scheduling.
+
+    python parallel_decode.py can_data.log [--workers N] [--output decoded.npz]
+"""
+
+### IMPORTS ###
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from BMS_dispatcher import BMSLOOKUP, CELLVALUE_HEX, decode_cell_value_batch
+from capture import is_capture_file, read_capture
+from data_processing import CANBatch
+from parse import PAYLOAD_SIZE, parse_candump_line
+from recorder import STREAMS, column_value
+
+### CONSTANTS ###
+CHUNKS_PER_WORKER = 4
+MIN_CHUNK_BYTES = 1024 * 1024
+
+
+def split_log(can_data_file: str, chunks: int) -> list[tuple[int, int]]:
+    """
+    Split a log into (start, end) byte ranges of roughly equal size that
+    start and end on line boundaries.
+    """
+    size = os.path.getsize(can_data_file)
+    chunks = max(1, min(chunks, size // MIN_CHUNK_BYTES))
+    boundaries = [0]
+    with open(can_data_file, "rb") as f:
+        for chunk in range(1, chunks):
+            f.seek(max(size * chunk // chunks, boundaries[-1]))
+            f.readline()
+            boundaries.append(min(f.tell(), size))
+    boundaries.append(size)
+    return [
+        (start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start
+    ]
+
+
+def split_capture(can_data_file: str, chunks: int) -> list[tuple[int, int]]:
+    """Split a capture file into (start, end) record ranges of roughly equal size."""
+    records = len(read_capture(can_data_file))
+    boundaries = np.linspace(0, records, max(1, chunks) + 1).astype(np.int64)
+    return [
+        (int(start), int(end))
+        for start, end in zip(boundaries, boundaries[1:])
+        if end > start
+    ]
+
+
+def read_chunk(can_data_file: str, start: int, end: int, is_capture: bool) -> CANBatch:
+    """Read one chunk of a recording as a single batch."""
+    if is_capture:
+        records = read_capture(can_data_file)[start:end]
+        return CANBatch(
+            np.array(records["arbitration_id"]),
+            np.array(records["timestamp"]),
+            np.array(records["dlc"]),
+            np.array(records["payload"]),
+        )
+
+    with open(can_data_file, "rb") as f:
+        f.seek(start)
+        lines = f.read(end - start).decode("ascii", "replace").splitlines()
+    arbitration_ids, timestamps, dlcs, payloads = [], [], [], []
+    for line in lines:
+        frame = parse_candump_line(line)
+        if frame is None:
+            continue
+        timestamp, arbitration_id, data, _ = frame
+        timestamps.append(timestamp)
+        arbitration_ids.append(arbitration_id)
+        dlcs.append(len(data))
+        payloads.append(data.ljust(PAYLOAD_SIZE, b"\x00"))
+    return CANBatch(
+        np.array(arbitration_ids, dtype=np.uint32),
+        np.array(timestamps, dtype=np.float64),
+        np.array(dlcs, dtype=np.uint8),
+        np.frombuffer(b"".join(payloads), dtype=np.uint8).reshape(-1, PAYLOAD_SIZE),
+    )
+
+
+def decode_batch(batch: CANBatch) -> dict:
+    """
+    Decode a batch into {stream: {column: array}}, in arrival order. CELLVALUE is
+    decoded with the vectorised decoder; the other streams frame by frame with
+    the BMSLOOKUP decoders.
+    """
+    results = {}
+    is_cell_value = batch.arbitration_ids == CELLVALUE_HEX
+    cell_numbers, voltages, temperatures = decode_cell_value_batch(
+        batch.payloads[is_cell_value]
+    )
+    results["CELLVALUE"] = {
+        "timestamp": batch.timestamps[is_cell_value],
+        "cell_number": cell_numbers.astype(STREAMS["CELLVALUE"][1][1]),
+        "cell_voltage": voltages.astype(STREAMS["CELLVALUE"][2][1]),
+        "cell_temperature": temperatures.astype(STREAMS["CELLVALUE"][3][1]),
+    }
+
+    rows = {stream: [] for stream in STREAMS if stream != "CELLVALUE"}
+    for row in np.flatnonzero(~is_cell_value).tolist():
+        arbitration_id = int(batch.arbitration_ids[row])
+        if arbitration_id not in BMSLOOKUP:
+            continue
+        decoder, message_type = BMSLOOKUP[arbitration_id]
+        if message_type not in rows:
+            continue
+        values = decoder(bytearray(batch.payloads[row, : batch.dlcs[row]])).values
+        rows[message_type].append((float(batch.timestamps[row]), values))
+
+    for stream, samples in rows.items():
+        results[stream] = {
+            name: np.array(
+                [
+                    timestamp if name == "timestamp" else column_value(name, values)
+                    for timestamp, values in samples
+                ],
+                dtype=dtype,
+            )
+            for name, dtype in STREAMS[stream]
+        }
+    return results
+
+
+def decode_chunk(
+    can_data_file: str, start: int, end: int, is_capture: bool
+) -> tuple[int, dict]:
+    """Worker entry point: decode one chunk; returns its frame count and columns"""
+    batch = read_chunk(can_data_file, start, end, is_capture)
+    return len(batch), decode_batch(batch)
+
+
+def merge_results(chunk_results: list[dict]) -> dict:
+    """Concatenate per-chunk columns in chunk order, then stably sort every stream by timestamp."""
+    merged = {}
+    for stream, columns in STREAMS.items():
+        # an empty recording has no chunks, but still gets every column
+        concatenated = {
+            name: np.concatenate(
+                [result[stream][name] for result in chunk_results]
+                or [np.empty(0, dtype)]
+            )
+            for name, dtype in columns
+        }
+        order = np.argsort(concatenated["timestamp"], kind="stable")
+        merged[stream] = {name: column[order] for name, column in concatenated.items()}
+    return merged
+
+
+def decode_parallel(can_data_file: str, workers: int | None = None) -> tuple[dict, int]:
+    """
+    Decode a whole log or capture file with a pool of worker processes (one per CPU by
+    default; 1 decodes in this process). Returns the merged columns and the frame count.
+    """
+    workers = workers or os.cpu_count() or 1
+    is_capture = is_capture_file(can_data_file)
+    split = split_capture if is_capture else split_log
+    chunks = split(can_data_file, workers * CHUNKS_PER_WORKER)
+
+    if workers == 1:
+        results = [
+            decode_chunk(can_data_file, start, end, is_capture) for start, end in chunks
+        ]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map returns results in submission order, whatever order chunks finish in
+            results = list(
+                pool.map(
+                    decode_chunk,
+                    [can_data_file] * len(chunks),
+                    [start for start, _ in chunks],
+                    [end for _, end in chunks],
+                    [is_capture] * len(chunks),
+                )
+            )
+    frames = sum(count for count, _ in results)
+    return merge_results([columns for _, columns in results]), frames
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Parallel offline decoding of BMS recordings"
+    )
+    parser.add_argument(
+        "file", metavar="CAN DATA FILE", help="candump -L log or capture file"
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Worker processes (default: one per CPU)"
+    )
+    parser.add_argument(
+        "--output",
+        metavar="OUTPUT FILE",
+        help="Save the decoded columns to a .npz file",
+    )
+    args = parser.parse_args()
+    if args.workers is not None and args.workers <= 0:
+        parser.error("--workers must be positive")
+
+    start = time.perf_counter()
+    try:
+        decoded, frames = decode_parallel(args.file, args.workers)
+    except OSError:
+        print(f"Error: Invalid path provided for supplied CAN data: {args.file}")
+        exit(-1)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{frames} frames in {elapsed:.2f}s: {frames / elapsed if elapsed else 0:,.0f} frames/sec"
+    )
+    for stream, columns in decoded.items():
+        print(f"  {stream:<12}{len(columns['timestamp']):>10} samples")
+    if args.output:
+        np.savez(
+            args.output,
+            **{
+                f"{stream}.{name}": column
+                for stream, columns in decoded.items()
+                for name, column in columns.items()
+            },
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,43 +1,491 @@
 ### IMPORTS ###
-from queue import Queue
-from time import time
+import os
+from array import array
+from collections import deque
+from threading import Condition, Event
+from time import monotonic, sleep
 
 import can
+import numpy as np
+
+from capture import is_capture_file, read_capture
+from data_processing import CANBatch, CANMessage
+
+### CONSTANTS ###
+PAYLOAD_SIZE = 8
+PADDING = [bytes(PAYLOAD_SIZE - dlc) for dlc in range(PAYLOAD_SIZE + 1)]
+MIN_PLAYBACK_SPEED = 0.1
+MAX_PLAYBACK_SPEED = 100.0
+# replay index: one (timestamp, file offset) record every REPLAY_INDEX_STRIDE frames
+REPLAY_INDEX_DTYPE = np.dtype([("timestamp", "<f8"), ("offset", "<u8")])
+REPLAY_INDEX_STRIDE = 1024
+REPLAY_INDEX_SUFFIX = ".idx"
+# acceptance decisions for extended IDs are cached apart from standard IDs with the same number
+EXTENDED_KEY_FLAG = 1 << 31
+# how often a replay whose frames are all rejected by the filters is read again
+REJECTED_LOG_RETRY_INTERVAL = 1.0
+
+
+def parse_candump_line(line: str) -> tuple[float, int, bytes, bool] | None:
+    """
+    Parse one line of a candump -L log, e.g. "(1700000000.000200) can0 620#01A1781F".
+    Returns (timestamp, arbitration id, payload, extended?), or None for lines that
+    aren't data frames (blank lines, comments, remote frames, malformed lines).
+    Extended IDs are the ones written with 8 hex digits, whatever their value.
+    CAN FD payloads are cut to the first 8 bytes.
+    """
+    parts = line.split()
+    if len(parts) < 3 or not parts[0].startswith("("):
+        return None
+    can_id, separator, data = parts[2].partition("#")
+    if not separator or data.startswith("R"):
+        return None
+    if data.startswith("#"):
+        # CAN FD frames carry a flags nibble between "##" and the data
+        data = data[2:]
+    try:
+        return (
+            float(parts[0][1:-1]),
+            int(can_id, 16),
+            bytes.fromhex(data)[:PAYLOAD_SIZE],
+            len(can_id) > 3,
+        )
+    except ValueError:
+        return None
+
+
+def read_log_batches(can_data_file: str, batch_size=65536, with_offsets=False):
+    """
+    Read a candump -L log as a sequence of CANBatch objects of roughly batch_size
+    messages each, without building a can.Message per frame.
+    With with_offsets, yields (offsets, batch) pairs instead, where offsets holds
+    the file offset of the line of every frame in the batch.
+    """
+    with open(can_data_file, "rb") as f:
+        position = 0
+        while True:
+            lines = f.readlines(batch_size * 40)
+            if not lines:
+                return
+            arbitration_ids = []
+            timestamps = []
+            dlcs = []
+            payloads = []
+            offsets = []
+            for line in lines:
+                frame = parse_candump_line(line.decode("ascii", "replace"))
+                if frame is not None:
+                    timestamp, arbitration_id, data, _ = frame
+                    timestamps.append(timestamp)
+                    arbitration_ids.append(arbitration_id)
+                    dlcs.append(len(data))
+                    payloads.append(data.ljust(PAYLOAD_SIZE, b"\x00"))
+                    offsets.append(position)
+                position += len(line)
+            if arbitration_ids:
+                batch = CANBatch(
+                    np.array(arbitration_ids, dtype=np.uint32),
+                    np.array(timestamps, dtype=np.float64),
+                    np.array(dlcs, dtype=np.uint8),
+                    np.frombuffer(b"".join(payloads), dtype=np.uint8).reshape(
+                        -1, PAYLOAD_SIZE
+                    ),
+                )
+                if with_offsets:
+                    yield np.array(offsets, dtype=np.int64), batch
+                else:
+                    yield batch
+
+
+def read_log_frames(log_file):
+    """
+    Yield (file offset, timestamp, arbitration id, payload, extended?) for every data
+    frame of an open candump -L log, starting from its current position. The log must be opened
+    in binary mode so offsets can be passed back to seek().
+    """
+    while True:
+        offset = log_file.tell()
+        line = log_file.readline()
+        if not line:
+            return
+        frame = parse_candump_line(line.decode("ascii", "replace"))
+        if frame is not None:
+            yield (offset, *frame)
+
+
+def read_capture_records(records: np.ndarray, start=0):
+    """
+    Yield (record number, timestamp, arbitration id, payload, extended?) for the records
+    of a memory mapped capture file from the given record number on, in the same shape
+    as read_log_frames. Capture records don't keep the extended flag, so only IDs that
+    don't fit in 11 bits come back as extended.
+    """
+    for position in range(start, len(records)):
+        record = records[position]
+        arbitration_id = int(record["arbitration_id"])
+        yield (
+            position,
+            float(record["timestamp"]),
+            arbitration_id,
+            record["payload"][: record["dlc"]].tobytes(),
+            arbitration_id > 0x7FF,
+        )
+
+
+def build_replay_index(can_data_file: str, stride=REPLAY_INDEX_STRIDE) -> np.ndarray:
+    """
+    Write a replay index next to a candump -L log (<log>.idx): the timestamp and
+    file offset of every stride-th frame, as raw REPLAY_INDEX_DTYPE records.
+    Returns the index.
+    """
+    records = []
+    with open(can_data_file, "rb") as f:
+        for count, (offset, timestamp, _, _, _) in enumerate(read_log_frames(f)):
+            if count % stride == 0:
+                records.append((timestamp, offset))
+    index = np.array(records, dtype=REPLAY_INDEX_DTYPE)
+    index.tofile(can_data_file + REPLAY_INDEX_SUFFIX)
+    return index
+
+
+def load_replay_index(can_data_file: str) -> np.ndarray:
+    """Load the replay index of a log, building it first if it is missing or older than the log."""
+    index_file = can_data_file + REPLAY_INDEX_SUFFIX
+    try:
+        if os.path.getmtime(index_file) >= os.path.getmtime(can_data_file):
+            return np.fromfile(index_file, dtype=REPLAY_INDEX_DTYPE)
+    except OSError:
+        pass
+    return build_replay_index(can_data_file)
+
+
+class AcceptanceFilter:
+    """
+    Acceptance filtering for the buses implemented here, which have no
+    controller to do it: python-can filters ({"can_id", "can_mask", "extended"}
+    dictionaries, see BusABC.set_filters) are enforced on the arbitration ID of
+    every frame before a can.Message is made for it. A frame matching any filter
+    is accepted; without filters every frame is. Every ID is matched against
+    the filters once, after which it is a single dictionary lookup. Accepted and
+    rejected frames are counted per arbitration ID.
+    """
+
+    def __init__(self, filters=None):
+        self.filters = filters or None
+        self.decisions = {}
+        self.accepted_counts = {}
+        self.rejected_counts = {}
+
+    def matches(self, arbitration_id: int, is_extended_id: bool) -> bool:
+        if self.filters is None:
+            return True
+        for can_filter in self.filters:
+            if "extended" in can_filter and can_filter["extended"] != is_extended_id:
+                continue
+            if (can_filter["can_id"] ^ arbitration_id) & can_filter["can_mask"] == 0:
+                return True
+        return False
+
+    def accept(self, arbitration_id: int, is_extended_id: bool = False) -> bool:
+        """Decide on one frame and count it"""
+        key = arbitration_id | EXTENDED_KEY_FLAG if is_extended_id else arbitration_id
+        accepted = self.decisions.get(key)
+        if accepted is None:
+            accepted = self.decisions[key] = self.matches(
+                arbitration_id, is_extended_id
+            )
+        counts = self.accepted_counts if accepted else self.rejected_counts
+        counts[arbitration_id] = counts.get(arbitration_id, 0) + 1
+        return accepted
+
+    def counts(self) -> dict[int, tuple[int, int]]:
+        """(accepted, rejected) frame counts of every arbitration ID seen, by ID"""
+        return {
+            arbitration_id: (
+                self.accepted_counts.get(arbitration_id, 0),
+                self.rejected_counts.get(arbitration_id, 0),
+            )
+            for arbitration_id in sorted(
+                self.accepted_counts.keys() | self.rejected_counts.keys()
+            )
+        }
+
 
-from data_processing import CANMessage
+def format_acceptance_counts(counts: dict[int, tuple[int, int]]) -> str:
+    """Render AcceptanceFilter.counts() as a table"""
+    lines = ["Acceptance filter", f"  {'id':>10}{'accepted':>12}{'rejected':>12}"]
+    for arbitration_id, (accepted, rejected) in counts.items():
+        lines.append(f"  {arbitration_id:>#10x}{accepted:>12}{rejected:>12}")
+    if not counts:
+        lines.append("  no frames yet")
+    return "\n".join(lines)
 
 
 class CANMessageListener(can.Listener):
-    def __init__(self, max_queue_size=1000):
-        """Set up a queue for storing CAN messages, capped at a specified size"""
-        self.messages = Queue(maxsize=max_queue_size)
+    """
+    Fixed capacity single-producer/single-consumer ring buffer of CAN messages.
+
+    The python-can Notifier thread is the only producer: it writes a message into
+    the slot under the head and then advances the head. The thread draining the
+    listener is the only consumer and only ever advances the tail. Neither side
+    takes a lock. When the producer laps the consumer the oldest messages are
+    overwritten, and the consumer accounts for them as overflow on its next read.
+
+    The storage has one slot more than the queue size: the slot the producer may
+    be writing into is never one of the max_queue_size newest messages, so a
+    full ring can be read whole while the producer is busy.
+    """
+
+    def __init__(self, max_queue_size=16384):
+        """Preallocate the ring storage, capped at a specified size"""
+        self.capacity = max_queue_size
+        self.slots = max_queue_size + 1
+        self.arbitration_ids = array("I", bytes(4 * self.slots))
+        self.timestamps = array("d", bytes(8 * self.slots))
+        self.dlcs = bytearray(self.slots)
+        self.payloads = bytearray(PAYLOAD_SIZE * self.slots)
+
+        # NumPy views over the same memory, used by the consumer to copy slices out
+        self.arbitration_id_view = np.frombuffer(self.arbitration_ids, dtype=np.uint32)
+        self.timestamp_view = np.frombuffer(self.timestamps, dtype=np.float64)
+        self.dlc_view = np.frombuffer(self.dlcs, dtype=np.uint8)
+        self.payload_view = np.frombuffer(self.payloads, dtype=np.uint8).reshape(
+            self.slots, PAYLOAD_SIZE
+        )
+
+        self.head = 0  # total messages ever written, only advanced by the producer
+        self.tail = (
+            0  # total messages read or overwritten, only advanced by the consumer
+        )
         self.overflow_count = 0
+        self.data_ready = Event()
+        # monotonic time the first message after the last drain arrived, for latency metrics
+        self.first_arrival = None
+        self.batch_arrival = None
+        # called by the producer along with data_ready being set, e.g. to wake an event loop
+        self.on_data_ready = None
 
     def on_message_received(self, msg: can.Message):
-        """Transform the incoming CAN message into our custom CANMessage format"""
-        can_message = CANMessage(msg.arbitration_id, msg.data)
-        if not self.messages.full():
-            self.messages.put_nowait(can_message)
+        """Copy the incoming CAN message into the next slot of the ring"""
+        slot = self.head % self.slots
+        data = msg.data
+        dlc = len(data)
+        if dlc > PAYLOAD_SIZE:
+            data = data[:PAYLOAD_SIZE]
+            dlc = PAYLOAD_SIZE
+
+        self.arbitration_ids[slot] = msg.arbitration_id
+        self.timestamps[slot] = msg.timestamp
+        self.dlcs[slot] = dlc
+        offset = slot * PAYLOAD_SIZE
+        self.payloads[offset : offset + dlc] = data
+        if dlc < PAYLOAD_SIZE:
+            self.payloads[offset + dlc : offset + PAYLOAD_SIZE] = PADDING[dlc]
+
+        # publish the slot only once it is completely written
+        self.head += 1
+        if not self.data_ready.is_set():
+            self.first_arrival = monotonic()
+            self.data_ready.set()
+            if self.on_data_ready is not None:
+                self.on_data_ready()
+
+    def wait_for_messages(self, timeout=None) -> bool:
+        """
+        Block until at least one unread message is in the ring, or the timeout
+        elapses. Returns whether messages are available.
+        """
+        if self.head > self.tail:
+            return True
+        self.data_ready.wait(timeout)
+        return self.head > self.tail
+
+    def read(self, max_messages: int | None = None) -> CANBatch:
+        """
+        Copy up to max_messages of the oldest unread messages out of the ring
+        (all of them if not given) and release their slots.
+        """
+        head = self.head
+        start = max(self.tail, head - self.capacity)
+        end = head if max_messages is None else min(head, start + max_messages)
+
+        first = start % self.slots
+        count = end - start
+        if first + count <= self.slots:
+            rows = slice(first, first + count)
         else:
-            self.overflow_count += 1
-            self.messages.get_nowait()
-            self.messages.put_nowait(can_message)
-
-    def get_message(self, timeout=0.5) -> can.Message | None:
-        """Extract a message from the queue if available, blocks for given timeout or until a message is received (whichever is shorter)."""
-        if not self.messages.empty():
-            return self.messages.get(timeout=timeout)
-        return None
+            rows = np.r_[first : self.slots, 0 : first + count - self.slots]
+        batch = CANBatch(
+            self.arbitration_id_view[rows].copy(),
+            self.timestamp_view[rows].copy(),
+            self.dlc_view[rows].copy(),
+            self.payload_view[rows].copy(),
+        )
+
+        # anything the producer overwrote while we were copying is lost as well,
+        # including the slot it may be half way through writing right now
+        overwritten = self.head + 1 - self.slots - start
+        if overwritten > 0:
+            batch = CANBatch(
+                batch.arbitration_ids[overwritten:],
+                batch.timestamps[overwritten:],
+                batch.dlcs[overwritten:],
+                batch.payloads[overwritten:],
+            )
+            start += min(overwritten, count)
+
+        self.overflow_count += start - self.tail
+        self.tail = end
+        return batch
+
+    def drain(self) -> CANBatch:
+        """Take every unread message in the ring, oldest first"""
+        # clear before reading, so a message arriving mid-read sets it again
+        self.batch_arrival = self.first_arrival
+        self.data_ready.clear()
+        return self.read()
+
+    def get_message(self, timeout=0.5) -> CANMessage | None:
+        """Extract the oldest unread message from the ring, waiting up to timeout seconds for one"""
+        if self.head <= self.tail:
+            # read() leaves data_ready set when it empties the ring
+            self.data_ready.clear()
+        if not self.wait_for_messages(timeout):
+            return None
+        batch = self.read(1)
+        if len(batch) == 0:
+            return None
+        return next(batch.messages())
+
+    def get_queue_depth(self) -> int:
+        """Report how many unread messages are waiting in the ring"""
+        return min(self.head - self.tail, self.capacity)
 
     def get_overflow_count(self) -> int:
         """Report the total number of messages that exceeded queue capacity"""
         return self.overflow_count
 
 
+class PlaybackController:
+    """
+    The playback clock of a CANFakeBus: maps log time onto real time at a given
+    speed, and lets the replay be paused, resumed, sped up or slowed down and
+    moved to another point in the log while it is running.
+
+    The clock is anchored at a (log time, real time) pair that is moved on every
+    change, so log time always advances continuously. Threads waiting for the log
+    time of their next message sleep on a condition that every change notifies,
+    instead of spinning. A speed of None plays back as fast as possible.
+    """
+
+    def __init__(self, log_time: float, speed: float | None = 1.0):
+        self.condition = Condition()
+        self.speed = speed
+        self.paused = False
+        self.anchor_log_time = log_time
+        self.anchor_real_time = monotonic()
+        self.seek_count = 0
+
+    def log_time(self) -> float:
+        """The log time playback has currently reached"""
+        if self.paused or self.speed is None:
+            return self.anchor_log_time
+        return self.anchor_log_time + (monotonic() - self.anchor_real_time) * self.speed
+
+    def reanchor(self, log_time: float) -> None:
+        self.anchor_log_time = log_time
+        self.anchor_real_time = monotonic()
+
+    def set_speed(self, speed: float | None) -> None:
+        """Change the playback speed multiplier (None for as fast as possible)"""
+        with self.condition:
+            self.reanchor(self.log_time())
+            self.speed = speed
+            self.condition.notify_all()
+
+    def pause(self) -> None:
+        with self.condition:
+            self.reanchor(self.log_time())
+            self.paused = True
+            self.condition.notify_all()
+
+    def resume(self) -> None:
+        with self.condition:
+            self.reanchor(self.anchor_log_time)
+            self.paused = False
+            self.condition.notify_all()
+
+    def seek(self, log_time: float) -> None:
+        """Move the clock to another log time, waking up anyone waiting on the old one"""
+        with self.condition:
+            self.reanchor(log_time)
+            self.seek_count += 1
+            self.condition.notify_all()
+
+    def wait_until(self, log_time: float, timeout: float | None = None) -> bool:
+        """
+        Block until playback reaches the given log time. Returns False if the timeout
+        elapsed or the clock was moved by a seek in the meantime.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        with self.condition:
+            seek_count = self.seek_count
+            while True:
+                if self.seek_count != seek_count:
+                    return False
+                if self.speed is None and not self.paused:
+                    return True
+                wait = None
+                if not self.paused:
+                    wait = (log_time - self.log_time()) / self.speed
+                    if wait <= 0:
+                        return True
+                if deadline is not None:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        return False
+                    wait = remaining if wait is None else min(wait, remaining)
+                self.condition.wait(wait)
+
+
 class CANFakeBus(can.BusABC):
-    def __init__(self, can_data_file: str):
+    """
+    Replays a candump -L log or a binary capture file as if it were a live bus, in a loop.
+    start and end (seconds from the first message of the log) limit the
+    replayed section; the playback attribute controls speed, pausing and seeking.
+
+    Filters set with set_filters are enforced while reading the log, so rejected
+    frames are skipped before a can.Message is made for them (see AcceptanceFilter).
+
+    The log is streamed from disk, so memory use doesn't grow with its length.
+    Looping seeks back to the file offset of the first replayed message. With
+    use_index, a replay index (see build_replay_index) makes seeking to any
+    time a binary search plus a short scan; without it, seeking backwards
+    rescans the log from its beginning. Capture files are memory mapped and
+    their timestamp column already is an index, so use_index is ignored for them.
+    Given a StateIndex (see state_index.py), every seek first replays the last
+    frame of every cell and BMS message before the new position, so the
+    complete pack state is shown straight away.
+    """
+
+    def __init__(
+        self,
+        can_data_file: str,
+        speed: float | None = 1.0,
+        start: float | None = None,
+        end: float | None = None,
+        use_index: bool = False,
+        state_index=None,
+    ):
         try:
-            self.reader = can.CanutilsLogReader(can_data_file)
+            self.log_file = None
+            self.capture = None
+            self.index = None
+            if is_capture_file(can_data_file):
+                self.capture = read_capture(can_data_file)
+            else:
+                self.log_file = open(can_data_file, "rb")
+                self.index = load_replay_index(can_data_file) if use_index else None
         except OSError:
             print(
                 f"Error: Invalid path provided for supplied CAN data: {can_data_file}"
@@ -46,83 +494,198 @@ class CANFakeBus(can.BusABC):
 
         self.set_filters(None)
 
-        self.message_index = 0
-        self.messages = [next(iter(self.reader))]
-        self.bus_start_time = self.messages[0].timestamp
-        self.real_start_time = time()
+        self.rewind(0)
+        if self.lookahead is None:
+            print(f"Error: No CAN frames in {can_data_file}")
+            exit(-1)
+        self.bus_start_time = self.lookahead[1]
+        self.start_time = self.bus_start_time + (start or 0.0)
+        self.end_time = None if end is None else self.bus_start_time + end
+        self.start_offset = None
+        self.pending = None
+        self.state_index = state_index
+        self.state_frames = deque()
+
+        self.playback = PlaybackController(self.start_time, speed)
+        if start:
+            self.seek(start)
+            if self.lookahead is None:
+                print(f"Error: Start time {start}s is past the end of {can_data_file}")
+                exit(-1)
+        self.start_offset = self.lookahead[0]
 
     def bus_time(self):
-        return self.bus_start_time + (time() - self.real_start_time)
-
-    def next_msg(self):
-        # file is done reading (or array is filled up to target index), read from array
-        if self.reader is None or self.message_index < len(self.messages):
-            msg = self.messages[self.message_index % len(self.messages)]
-
-            self.message_index += 1
-            if self.reader is None:
-                self.message_index %= len(self.messages)
-
-            return msg
+        return self.playback.log_time()
 
+    def rewind(self, offset):
+        """Continue reading the log from the given file offset (record number for captures)"""
+        if self.capture is not None:
+            self.frames = read_capture_records(self.capture, offset)
         else:
-            # attempt to read from file
-            msg = next(iter(self.reader), None)
-
-            # reached end of file, close reader, set to None
-            if msg is None:
-                self.reader.stop()
-                self.reader = None
-                return self.next_msg()
+            self.log_file.seek(offset)
+            self.frames = read_log_frames(self.log_file)
+        self.lookahead = next(self.frames, None)
+
+    def locate(self, log_time):
+        """Position the reader on the first message at or after the given log time"""
+        if self.capture is not None:
+            self.rewind(int(np.searchsorted(self.capture["timestamp"], log_time)))
+        elif self.index is not None:
+            position = max(
+                int(np.searchsorted(self.index["timestamp"], log_time, side="right"))
+                - 1,
+                0,
+            )
+            self.rewind(int(self.index["offset"][position]))
+        elif self.lookahead is None or self.lookahead[1] > log_time:
+            self.rewind(0)
 
-            self.messages.append(msg)
-            self.message_index += 1
+        while self.lookahead is not None and self.lookahead[1] < log_time:
+            self.lookahead = next(self.frames, None)
 
-            return msg
+    def next_msg(self):
+        """
+        Return the next message the filters accept, looping back to the start time
+        at the end of the replayed section. Returns None if a whole pass over the
+        replayed section finds no accepted message.
+        """
+        accept = self.acceptance.accept
+        looped = False
+        while True:
+            if self.lookahead is None or (
+                self.end_time is not None and self.lookahead[1] > self.end_time
+            ):
+                if looped:
+                    return None
+                self.rewind(self.start_offset)
+                self.playback.seek(self.start_time)
+                looped = True
+
+            _, timestamp, arbitration_id, data, is_extended_id = self.lookahead
+            self.lookahead = next(self.frames, None)
+            if accept(arbitration_id, is_extended_id):
+                return can.Message(
+                    timestamp=timestamp,
+                    arbitration_id=arbitration_id,
+                    is_extended_id=is_extended_id,
+                    dlc=len(data),
+                    data=data,
+                )
+
+    def seek(self, offset: float):
+        """Continue playback from the given number of seconds after the first message of the log"""
+        log_time = self.bus_start_time + offset
+        # replaying the state reads the log, so do it before holding up the receive thread;
+        # the state only holds BMS messages, which all have standard IDs
+        state_frames = None
+        if self.state_index is not None:
+            state_frames = deque(
+                can.Message(
+                    timestamp=timestamp,
+                    arbitration_id=arbitration_id,
+                    is_extended_id=False,
+                    dlc=len(data),
+                    data=data,
+                )
+                for timestamp, arbitration_id, data in self.state_index.state_at(
+                    log_time
+                ).frames()
+                # these frames never came off the bus, so they are not counted
+                if self.acceptance.matches(arbitration_id, False)
+            )
+        with self.playback.condition:
+            self.locate(log_time)
+            self.pending = None
+            if state_frames is not None:
+                self.state_frames = state_frames
+            self.playback.seek(log_time)
+
+    def shutdown(self):
+        super().shutdown()
+        if self.log_file is not None:
+            self.log_file.close()
 
     # cannot send messages
     def send(msg, timeout=None): ...
 
     def _recv_internal(self, timeout=None):
-        # checking for timeout
-        recv_start_time = time()
+        with self.playback.condition:
+            if self.state_frames:
+                return (self.state_frames.popleft(), False)
+            if self.pending is None:
+                self.pending = self.next_msg()
+            msg = self.pending
+        if msg is None:
+            # nothing in the replayed section passes the filters
+            sleep(REJECTED_LOG_RETRY_INTERVAL if timeout is None else timeout)
+            return (None, False)
+
+        # wait until playback reaches the message (or the timeout elapses / a seek moves it)
+        if not self.playback.wait_until(msg.timestamp, timeout):
+            return (None, False)
+
+        with self.playback.condition:
+            if self.pending is not msg:
+                return (None, False)
+            self.pending = None
+            # as fast as possible playback has no clock to follow, so it tracks the messages
+            if self.playback.speed is None:
+                self.playback.reanchor(msg.timestamp)
 
-        # get message
-        msg = self.next_msg()
-
-        # wait until real time has elapsed
-        while msg.timestamp > self.bus_time():
-            # or, until timeout has elapsed
-            if timeout is not None and time() - recv_start_time > timeout:
-                break
+        # (message, filtered?)
+        return (msg, True)
 
-        # reset timer if looping back to start of log
-        if self.message_index == 0:
-            self.real_start_time = time()
+    def _apply_filters(self, filters):
+        self.acceptance = AcceptanceFilter(filters)
 
-        # (message, filtered?)
-        return (msg, False)
 
-    def _apply_filters(self, filters): ...
+def has_fileno(bus: can.BusABC) -> bool:
+    """Whether the bus exposes a file descriptor an event loop can watch"""
+    try:
+        return bus.fileno() >= 0
+    except NotImplementedError:
+        return False
 
 
 class CANMessageParser:
-    def __init__(self, filtering, can_bus, max_queue_size=1000):
-        """Establish a connection to the CAN bus along with setting the max queue size."""
+    def __init__(self, filtering, can_bus, max_queue_size=16384, loop=None):
+        """
+        Establish a connection to the CAN bus along with setting the max queue size.
+        Given an asyncio loop, buses with a file descriptor are read by the loop
+        itself; others keep the Notifier's reader thread, as handing the loop
+        every message separately would cost more than reading it.
+        """
         self.bus = can_bus
         self.bus.set_filters(filtering)
         self.listener = CANMessageListener(max_queue_size)
-        self.notifier = can.Notifier(self.bus, [self.listener])
+        notifier_loop = loop if loop is not None and has_fileno(can_bus) else None
+        self.notifier = can.Notifier(self.bus, [self.listener], loop=notifier_loop)
 
     def get_messages(self, num_messages: int, timeout=0.5) -> list[can.Message]:
-        """Collect a specified number of messages from the listener"""
+        """
+        Collect a specified number of messages from the listener, stopping early
+        when none arrives within the timeout
+        """
         messages = []
         for i in range(num_messages):
             message = self.listener.get_message(timeout)
-            if message is not None:
-                messages.append(message)
+            if message is None:
+                break
+            messages.append(message)
         return messages
 
+    def wait_for_messages(self, timeout=0.5) -> bool:
+        """Block until the listener has unread messages, or the timeout elapses"""
+        return self.listener.wait_for_messages(timeout)
+
+    def set_data_ready_callback(self, callback):
+        """Call callback (from the receiving thread) whenever messages arrive after a drain"""
+        self.listener.on_data_ready = callback
+
+    def drain_batch(self) -> CANBatch:
+        """Collect every message the listener has buffered since the last drain, as columns"""
+        return self.listener.drain()
+
     def send_can_messages(self, msg: CANMessage, is_extended_id=False):
         """Construct a CAN message from the provided CANMessage object"""
         message = can.Message(
@@ -130,6 +693,10 @@ class CANMessageParser:
             data=msg.data,
             is_extended_id=is_extended_id,
         )
+        self.send(message)
+
+    def send(self, message: can.Message):
+        """Send an already constructed CAN message"""
         try:
             self.bus.send(message)
         except can.CanError:
@@ -139,10 +706,25 @@ class CANMessageParser:
         """Retrieve the total count of messages that exceeded queue capacity"""
         return self.listener.get_overflow_count()
 
+    def get_queue_depth(self) -> int:
+        """Retrieve how many messages are waiting in the listener"""
+        return self.listener.get_queue_depth()
+
+    def get_batch_arrival(self) -> float | None:
+        """Retrieve the monotonic time the oldest message of the last drained batch arrived"""
+        return self.listener.batch_arrival
+
+    def get_acceptance_counts(self) -> dict[int, tuple[int, int]] | None:
+        """
+        Retrieve the per-ID (accepted, rejected) frame counts of the bus's acceptance
+        filter, or None for buses filtering in hardware (or python-can) instead.
+        """
+        acceptance = getattr(self.bus, "acceptance", None)
+        return None if acceptance is None else acceptance.counts()
+
     def empty_queue(self):
         """Clear all messages from the queue"""
-        while not self.listener.messages.empty():
-            self.listener.messages.get_nowait()
+        self.listener.drain()
 
     def stop(self):
         """Stop notifier and close CAN bus connection"""
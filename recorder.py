@@ -0,0 +1,310 @@
+"""
+Live recording of the decoded BMS stream.
+
+The ingestion thread hands every decoded cell value and BMSVINF, BMSTINF,
+PACKSTAT and CHARGEROUT sample to a SessionRecorder, which appends it to a
+preallocated column buffer per stream. Full buffers (or partial ones older
+than FLUSH_INTERVAL) are passed to a background writer thread through a
+bounded queue; if the writer falls behind, whole chunks are dropped and
+counted rather than blocking ingestion. The drops are reported to the
+pipeline metrics as they happen and printed when recording stops.
+
+Recordings are append-only .bmsrec files, rotated by size and age:
+
+    magic                  8 bytes, RECORDING_MAGIC
+    chunk, chunk, ...      each one:
+        header length      uint32, little endian
+        header             JSON: {"stream": ..., "rows": ..., "columns": [[name, dtype, bytes], ...]}
+        columns            every column zlib compressed separately, in header order
+
+Read them back with read_recording / load_recording.
+"""
+
+### IMPORTS ###
+import json
+import os
+import queue
+import struct
+import threading
+import zlib
+from time import monotonic, strftime
+
+import numpy as np
+
+from BMS_dispatcher import CHARGER_STATUS_ERRORS
+
+### CONSTANTS ###
+RECORDING_MAGIC = b"BMSREC\x00\x01"
+RECORDING_SUFFIX = ".bmsrec"
+CHUNK_ROWS = 8192
+MAX_QUEUED_CHUNKS = 32
+FLUSH_INTERVAL = 5.0
+DEFAULT_MAX_FILE_BYTES = 64 * 1024 * 1024
+DEFAULT_MAX_FILE_SECONDS = 3600.0
+COMPRESSION_LEVEL = 1
+STREAMS = {
+    "CELLVALUE": [
+        ("timestamp", "<f8"),
+        ("cell_number", "<u2"),
+        ("cell_voltage", "<f4"),
+        ("cell_temperature", "<f4"),
+    ],
+    "BMSVINF": [
+        ("timestamp", "<f8"),
+        ("max_voltage", "<f4"),
+        ("min_voltage", "<f4"),
+        ("max_voltage_cell", "<u2"),
+        ("min_voltage_cell", "<u2"),
+    ],
+    "BMSTINF": [
+        ("timestamp", "<f8"),
+        ("max_temp", "<f4"),
+        ("min_temp", "<f4"),
+        ("max_temp_cell", "<u2"),
+        ("min_temp_cell", "<u2"),
+    ],
+    "PACKSTAT": [
+        ("timestamp", "<f8"),
+        ("pack_voltage", "<f4"),
+        ("pack_current", "<f4"),
+        ("pack_power", "<f4"),
+    ],
+    "CHARGEROUT": [
+        ("timestamp", "<f8"),
+        ("charger_voltage", "<f4"),
+        ("charger_current", "<f4"),
+        # bit n set for CHARGER_STATUS_ERRORS[n]
+        ("status_errors", "u1"),
+    ],
+}
+
+
+def column_value(name: str, values: dict):
+    """The value a decoded message's values dict stores in a stream column"""
+    if name == "status_errors":
+        return sum(
+            1 << bit
+            for bit, error in enumerate(CHARGER_STATUS_ERRORS)
+            if error in values[name]
+        )
+    return values[name]
+
+
+class ColumnBuffer:
+    """A preallocated chunk of one stream's columns, filled row by row or slice by slice."""
+
+    def __init__(self, columns, rows=CHUNK_ROWS):
+        self.columns = {name: np.empty(rows, dtype=dtype) for name, dtype in columns}
+        self.capacity = rows
+        self.size = 0
+        # when the first row was added
+        self.started = 0.0
+
+    def space(self) -> int:
+        return self.capacity - self.size
+
+
+class SessionRecorder:
+    """
+    Records the decoded BMS stream to rotating, compressed columnar files in a directory.
+    record_cells and record are called from the ingestion thread and never wait on disk.
+    Memory is bounded by one open buffer per stream plus MAX_QUEUED_CHUNKS queued chunks.
+    Given a PipelineMetrics, chunks dropped because the writer fell behind are counted there too.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        max_file_bytes=DEFAULT_MAX_FILE_BYTES,
+        max_file_seconds=DEFAULT_MAX_FILE_SECONDS,
+        metrics=None,
+    ):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_file_bytes = max_file_bytes
+        self.max_file_seconds = max_file_seconds
+        self.metrics = metrics
+        self.buffers = {
+            stream: ColumnBuffer(columns) for stream, columns in STREAMS.items()
+        }
+        self.buffer_lock = threading.Lock()
+        self.chunks = queue.Queue(maxsize=MAX_QUEUED_CHUNKS)
+        self.dropped_chunks = 0
+        self.dropped_rows = 0
+        self.written_chunks = 0
+        self.files = []
+        self.file = None
+        self.file_opened = 0.0
+        self.closed = False
+        self.writer = threading.Thread(target=self.write_chunks, daemon=True)
+        self.writer.start()
+
+    ### INGESTION SIDE ###
+
+    def record_cells(
+        self,
+        timestamps: np.ndarray,
+        cell_numbers: np.ndarray,
+        voltages: np.ndarray,
+        temperatures: np.ndarray,
+    ) -> None:
+        """Append a batch of decoded CELLVALUE samples"""
+        with self.buffer_lock:
+            if self.closed:
+                return
+            start = 0
+            while start < len(timestamps):
+                buffer = self.buffers["CELLVALUE"]
+                if buffer.size == 0:
+                    buffer.started = monotonic()
+                end = start + min(buffer.space(), len(timestamps) - start)
+                rows = slice(buffer.size, buffer.size + end - start)
+                buffer.columns["timestamp"][rows] = timestamps[start:end]
+                buffer.columns["cell_number"][rows] = cell_numbers[start:end]
+                buffer.columns["cell_voltage"][rows] = voltages[start:end]
+                buffer.columns["cell_temperature"][rows] = temperatures[start:end]
+                buffer.size += end - start
+                start = end
+                self.submit_due()
+
+    def record(self, message_type: str, timestamp: float, values: dict) -> None:
+        """Append one decoded sample of a recorded message type; other types are ignored"""
+        if message_type not in STREAMS or message_type == "CELLVALUE":
+            return
+        with self.buffer_lock:
+            if self.closed:
+                return
+            buffer = self.buffers[message_type]
+            if buffer.size == 0:
+                buffer.started = monotonic()
+            for name, column in buffer.columns.items():
+                if name == "timestamp":
+                    column[buffer.size] = timestamp
+                else:
+                    column[buffer.size] = column_value(name, values)
+            buffer.size += 1
+            self.submit_due()
+
+    def submit_due(self) -> None:
+        """Queue every buffer that is full or has held data for FLUSH_INTERVAL for writing"""
+        now = monotonic()
+        for stream, buffer in self.buffers.items():
+            if buffer.space() == 0 or (
+                buffer.size and now - buffer.started >= FLUSH_INTERVAL
+            ):
+                self.submit(stream)
+
+    def submit(self, stream: str) -> None:
+        buffer = self.buffers[stream]
+        try:
+            self.chunks.put_nowait((stream, buffer))
+        except queue.Full:
+            self.dropped_chunks += 1
+            self.dropped_rows += buffer.size
+            if self.metrics is not None:
+                self.metrics.record_recording_drop(buffer.size)
+        self.buffers[stream] = ColumnBuffer(STREAMS[stream])
+
+    def stop(self) -> None:
+        """Queue whatever is buffered, wait for the writer to finish, close the file and print the totals"""
+        with self.buffer_lock:
+            if self.closed:
+                return
+            self.closed = True
+            for stream, buffer in self.buffers.items():
+                if buffer.size:
+                    self.submit(stream)
+        self.chunks.put(None)
+        self.writer.join()
+        print(
+            f"Recording {self.directory}: {self.written_chunks} chunks written, "
+            f"{self.dropped_chunks} chunks ({self.dropped_rows} rows) dropped as the writer fell behind"
+        )
+
+    ### WRITER SIDE ###
+
+    def write_chunks(self) -> None:
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                break
+            stream, buffer = chunk
+            self.write_chunk(stream, buffer)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def write_chunk(self, stream: str, buffer: ColumnBuffer) -> None:
+        if self.file is None:
+            self.open_file()
+
+        columns = []
+        data = []
+        for name, column in buffer.columns.items():
+            compressed = zlib.compress(
+                column[: buffer.size].tobytes(), COMPRESSION_LEVEL
+            )
+            columns.append([name, column.dtype.str, len(compressed)])
+            data.append(compressed)
+        header = json.dumps(
+            {"stream": stream, "rows": buffer.size, "columns": columns}
+        ).encode()
+        self.file.write(struct.pack("<I", len(header)) + header + b"".join(data))
+        self.file.flush()
+        self.written_chunks += 1
+
+        if (
+            self.file.tell() >= self.max_file_bytes
+            or monotonic() - self.file_opened >= self.max_file_seconds
+        ):
+            self.file.close()
+            self.file = None
+
+    def open_file(self) -> None:
+        path = os.path.join(
+            self.directory,
+            f"bms_{strftime('%Y%m%d_%H%M%S')}_{len(self.files):04d}{RECORDING_SUFFIX}",
+        )
+        self.file = open(path, "wb")
+        self.file.write(RECORDING_MAGIC)
+        self.file_opened = monotonic()
+        self.files.append(path)
+
+
+def read_recording(path: str):
+    """Yield (stream, {column name: array}) for every chunk of a recording file"""
+    with open(path, "rb") as f:
+        if f.read(len(RECORDING_MAGIC)) != RECORDING_MAGIC:
+            raise ValueError(f"{path} is not a BMS recording")
+        while True:
+            length = f.read(4)
+            if len(length) < 4:
+                return
+            header = json.loads(f.read(struct.unpack("<I", length)[0]))
+            columns = {}
+            for name, dtype, size in header["columns"]:
+                columns[name] = np.frombuffer(
+                    zlib.decompress(f.read(size)), dtype=dtype
+                )
+            yield header["stream"], columns
+
+
+def load_recording(paths) -> dict:
+    """
+    Load one or more recording files (e.g. the rotated files of one session, in order)
+    into one set of concatenated columns per stream.
+    """
+    if isinstance(paths, str):
+        paths = [paths]
+    chunks = {stream: [] for stream in STREAMS}
+    for path in paths:
+        for stream, columns in read_recording(path):
+            chunks.setdefault(stream, []).append(columns)
+    return {
+        stream: {
+            name: np.concatenate([chunk[name] for chunk in stream_chunks])
+            for name in stream_chunks[0]
+        }
+        for stream, stream_chunks in chunks.items()
+        if stream_chunks
+    }
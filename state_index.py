@@ -0,0 +1,362 @@
+"""
+Time-indexed random access over recorded CAN logs and capture files.
+
+build_state_index scans a candump -L log or binary capture once and writes a
+sidecar index (<file>.state.npz) that divides the recording into fixed time
+buckets. For every bucket it stores:
+    - the file offset of its first frame (record number for captures)
+    - the offset of the first frame of each BMS arbitration ID in it
+    - a snapshot of the complete pack state at its start: the last frame seen
+      for every cell (CELLVALUE, by cell number) and for every other BMS ID
+
+The pack state at any time is then the snapshot of the bucket containing it,
+found by binary search, plus a forward scan of at most one bucket of frames.
+
+    python bms_cli.py can_data.log --at 14:03:12
+"""
+
+### IMPORTS ###
+import datetime
+import os
+
+import numpy as np
+
+from BMS_dispatcher import BMSLOOKUP, CELLVALUE_HEX, decode_cell_value_batch
+from capture import is_capture_file, read_capture
+from data_processing import CANBatch, CANMessage, CANMessageHandler
+from parse import PAYLOAD_SIZE, read_capture_records, read_log_batches, read_log_frames
+
+### CONSTANTS ###
+STATE_BUCKET_SECONDS = 10.0
+STATE_INDEX_SUFFIX = ".state.npz"
+INDEXED_IDS = tuple(key for key in BMSLOOKUP if isinstance(key, int))
+OTHER_IDS = tuple(key for key in INDEXED_IDS if key != CELLVALUE_HEX)
+OTHER_IDS_SORTED = np.sort(np.array(OTHER_IDS, dtype=np.uint32))
+OTHER_IDS_ORDER = np.argsort(OTHER_IDS)
+NO_OFFSET = -1
+
+
+class FrameTable:
+    """
+    The last frame seen for a set of keys (cell numbers, or arbitration IDs):
+    its timestamp (NaN if none yet), DLC and zero padded payload.
+    """
+
+    def __init__(self, size):
+        self.timestamps = np.full(size, np.nan, dtype=np.float64)
+        self.dlcs = np.zeros(size, dtype=np.uint8)
+        self.payloads = np.zeros((size, PAYLOAD_SIZE), dtype=np.uint8)
+
+    def grow(self, size) -> None:
+        extra = size - len(self.timestamps)
+        if extra > 0:
+            self.timestamps = np.concatenate([self.timestamps, np.full(extra, np.nan)])
+            self.dlcs = np.concatenate([self.dlcs, np.zeros(extra, dtype=np.uint8)])
+            self.payloads = np.concatenate(
+                [self.payloads, np.zeros((extra, PAYLOAD_SIZE), dtype=np.uint8)]
+            )
+
+    def store(self, keys, timestamps, dlcs, payloads) -> None:
+        """Store frames in arrival order; when a key repeats the last frame wins"""
+        _, last_reversed = np.unique(keys[::-1], return_index=True)
+        newest = len(keys) - 1 - last_reversed
+        self.timestamps[keys[newest]] = timestamps[newest]
+        self.dlcs[keys[newest]] = dlcs[newest]
+        self.payloads[keys[newest]] = payloads[newest]
+
+    def copy(self) -> "FrameTable":
+        table = FrameTable(0)
+        table.timestamps = self.timestamps.copy()
+        table.dlcs = self.dlcs.copy()
+        table.payloads = self.payloads.copy()
+        return table
+
+
+class PackState:
+    """
+    The complete pack state at one moment, as the last frame received for
+    every cell and every other BMS arbitration ID before it.
+    Cell frames are kept by cell number, other frames by position in OTHER_IDS.
+    """
+
+    def __init__(self, timestamp, cells: FrameTable, messages: FrameTable):
+        self.timestamp = timestamp
+        self.cells = cells
+        self.messages = messages
+
+    def apply(self, batch: CANBatch) -> None:
+        """Update the state with a batch of frames, in arrival order"""
+        is_cell_value = batch.arbitration_ids == CELLVALUE_HEX
+        if is_cell_value.any():
+            payloads = batch.payloads[is_cell_value]
+            cell_numbers = decode_cell_value_batch(payloads)[0].astype(np.int64)
+            self.cells.grow(int(cell_numbers.max()) + 1)
+            self.cells.store(
+                cell_numbers,
+                batch.timestamps[is_cell_value],
+                batch.dlcs[is_cell_value],
+                payloads,
+            )
+
+        rows = np.flatnonzero(np.isin(batch.arbitration_ids, OTHER_IDS))
+        if len(rows):
+            keys = np.searchsorted(OTHER_IDS_SORTED, batch.arbitration_ids[rows])
+            self.messages.store(
+                OTHER_IDS_ORDER[keys],
+                batch.timestamps[rows],
+                batch.dlcs[rows],
+                batch.payloads[rows],
+            )
+
+    def cell_values(self, num_cells) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Voltage, temperature and last update time of cells 1..num_cells (NaN if never seen)"""
+        voltages = np.full(num_cells, np.nan)
+        temperatures = np.full(num_cells, np.nan)
+        updated = np.full(num_cells, np.nan)
+        seen = np.flatnonzero(~np.isnan(self.cells.timestamps[1 : num_cells + 1])) + 1
+        if len(seen):
+            _, cell_voltages, cell_temperatures = decode_cell_value_batch(
+                self.cells.payloads[seen]
+            )
+            voltages[seen - 1] = cell_voltages
+            temperatures[seen - 1] = cell_temperatures
+            updated[seen - 1] = self.cells.timestamps[seen]
+        return voltages, temperatures, updated
+
+    def decoded_messages(self) -> dict:
+        """Decoded values of the last frame of every other BMS message, by message type"""
+        handler = CANMessageHandler(BMSLOOKUP)
+        decoded = {}
+        for key, arbitration_id in enumerate(OTHER_IDS):
+            if np.isnan(self.messages.timestamps[key]):
+                continue
+            data = bytearray(self.messages.payloads[key, : self.messages.dlcs[key]])
+            message = handler.decode_message(CANMessage(arbitration_id, data))
+            decoded[message.message_type] = (
+                float(self.messages.timestamps[key]),
+                message.values,
+            )
+        return decoded
+
+    def frames(self) -> list[tuple[float, int, bytes]]:
+        """The state as (timestamp, arbitration id, payload) frames in time order, e.g. to replay it"""
+        frames = []
+        for table, arbitration_ids in (
+            (self.cells, [CELLVALUE_HEX] * len(self.cells.timestamps)),
+            (self.messages, OTHER_IDS),
+        ):
+            for key in np.flatnonzero(~np.isnan(table.timestamps)).tolist():
+                frames.append(
+                    (
+                        float(table.timestamps[key]),
+                        arbitration_ids[key],
+                        table.payloads[key, : table.dlcs[key]].tobytes(),
+                    )
+                )
+        return sorted(frames, key=lambda frame: frame[0])
+
+
+def indexed_batches(can_data_file: str):
+    """Yield (offsets, CANBatch) over a log (offsets are file offsets) or capture (record numbers)"""
+    if is_capture_file(can_data_file):
+        records = read_capture(can_data_file)
+        for start in range(0, len(records), 65536):
+            chunk = records[start : start + 65536]
+            yield np.arange(start, start + len(chunk)), CANBatch(
+                chunk["arbitration_id"],
+                chunk["timestamp"],
+                chunk["dlc"],
+                chunk["payload"],
+            )
+    else:
+        yield from read_log_batches(can_data_file, with_offsets=True)
+
+
+def build_state_index(can_data_file: str, bucket_seconds=STATE_BUCKET_SECONDS) -> dict:
+    """Scan a recording once and write its state index next to it. Returns the index."""
+    state = PackState(None, FrameTable(0), FrameTable(len(OTHER_IDS)))
+    bucket_times = []
+    bucket_offsets = []
+    id_offsets = []
+    snapshots = []
+    first_timestamp = None
+    last_timestamp = None
+
+    for offsets, batch in indexed_batches(can_data_file):
+        if first_timestamp is None:
+            first_timestamp = float(batch.timestamps[0])
+        last_timestamp = float(batch.timestamps[-1])
+        buckets = np.floor(
+            (batch.timestamps - first_timestamp) / bucket_seconds
+        ).astype(np.int64)
+        # split the batch where it crosses into a new bucket
+        boundaries = np.flatnonzero(np.diff(buckets) > 0) + 1
+        for start, end in zip(
+            np.concatenate([[0], boundaries]),
+            np.concatenate([boundaries, [len(batch)]]),
+        ):
+            bucket = int(buckets[start])
+            if not bucket_times or bucket > bucket_times[-1]:
+                bucket_times.append(bucket)
+                bucket_offsets.append(int(offsets[start]))
+                id_offsets.append(np.full(len(INDEXED_IDS), NO_OFFSET, dtype=np.int64))
+                snapshots.append((state.cells.copy(), state.messages.copy()))
+            part = CANBatch(
+                batch.arbitration_ids[start:end],
+                batch.timestamps[start:end],
+                batch.dlcs[start:end],
+                batch.payloads[start:end],
+            )
+            for key, arbitration_id in enumerate(INDEXED_IDS):
+                if id_offsets[-1][key] == NO_OFFSET:
+                    rows = np.flatnonzero(part.arbitration_ids == arbitration_id)
+                    if len(rows):
+                        id_offsets[-1][key] = offsets[start + rows[0]]
+            state.apply(part)
+
+    if first_timestamp is None:
+        raise ValueError(f"No CAN frames in {can_data_file}")
+
+    num_cells = len(state.cells.timestamps)
+    for cells, _ in snapshots:
+        cells.grow(num_cells)
+    index = {
+        "bucket_seconds": np.float64(bucket_seconds),
+        "first_timestamp": np.float64(first_timestamp),
+        "last_timestamp": np.float64(last_timestamp),
+        "bucket_times": first_timestamp
+        + np.array(bucket_times, dtype=np.float64) * bucket_seconds,
+        "bucket_offsets": np.array(bucket_offsets, dtype=np.int64),
+        "indexed_ids": np.array(INDEXED_IDS, dtype=np.uint32),
+        "id_offsets": np.array(id_offsets, dtype=np.int64).reshape(
+            -1, len(INDEXED_IDS)
+        ),
+        "cell_timestamps": np.stack([cells.timestamps for cells, _ in snapshots]),
+        "cell_dlcs": np.stack([cells.dlcs for cells, _ in snapshots]),
+        "cell_payloads": np.stack([cells.payloads for cells, _ in snapshots]),
+        "message_timestamps": np.stack(
+            [messages.timestamps for _, messages in snapshots]
+        ),
+        "message_dlcs": np.stack([messages.dlcs for _, messages in snapshots]),
+        "message_payloads": np.stack([messages.payloads for _, messages in snapshots]),
+    }
+    with open(can_data_file + STATE_INDEX_SUFFIX, "wb") as f:
+        np.savez_compressed(f, **index)
+    return index
+
+
+class StateIndex:
+    """Random access to the pack state of a recording through its state index."""
+
+    def __init__(self, can_data_file: str, rebuild=False):
+        self.can_data_file = can_data_file
+        self.is_capture = is_capture_file(can_data_file)
+        index_file = can_data_file + STATE_INDEX_SUFFIX
+        self.index = None
+        if (
+            not rebuild
+            and os.path.exists(index_file)
+            and os.path.getmtime(index_file) >= os.path.getmtime(can_data_file)
+        ):
+            with np.load(index_file) as saved:
+                self.index = {name: saved[name] for name in saved.files}
+        if self.index is None or "last_timestamp" not in self.index:
+            # indexes written before the last timestamp was kept are rebuilt too
+            self.index = build_state_index(can_data_file)
+        self.first_timestamp = float(self.index["first_timestamp"])
+        self.last_timestamp = float(self.index["last_timestamp"])
+        self.bucket_times = self.index["bucket_times"]
+
+    def bucket_at(self, timestamp: float) -> int:
+        return max(
+            int(np.searchsorted(self.bucket_times, timestamp, side="right")) - 1, 0
+        )
+
+    def snapshot(self, bucket: int) -> PackState:
+        cells = FrameTable(0)
+        cells.timestamps = self.index["cell_timestamps"][bucket].copy()
+        cells.dlcs = self.index["cell_dlcs"][bucket].copy()
+        cells.payloads = self.index["cell_payloads"][bucket].copy()
+        messages = FrameTable(0)
+        messages.timestamps = self.index["message_timestamps"][bucket].copy()
+        messages.dlcs = self.index["message_dlcs"][bucket].copy()
+        messages.payloads = self.index["message_payloads"][bucket].copy()
+        return PackState(float(self.bucket_times[bucket]), cells, messages)
+
+    def frames_from(self, offset: int):
+        """Yield (offset, timestamp, arbitration id, payload, extended?) from a file offset (record number for captures) on"""
+        if self.is_capture:
+            yield from read_capture_records(read_capture(self.can_data_file), offset)
+        else:
+            with open(self.can_data_file, "rb") as f:
+                f.seek(offset)
+                yield from read_log_frames(f)
+
+    def state_at(self, timestamp: float) -> PackState:
+        """The pack state right after the last frame at or before the given timestamp"""
+        bucket = self.bucket_at(timestamp)
+        state = self.snapshot(bucket)
+        start = int(self.index["bucket_offsets"][bucket])
+        if self.is_capture:
+            records = read_capture(self.can_data_file)
+            end = int(np.searchsorted(records["timestamp"], timestamp, side="right"))
+            chunk = records[start : max(start, end)]
+            batch = CANBatch(
+                chunk["arbitration_id"],
+                chunk["timestamp"],
+                chunk["dlc"],
+                chunk["payload"],
+            )
+        else:
+            arbitration_ids, timestamps, dlcs, payloads = [], [], [], []
+            for _, frame_timestamp, arbitration_id, data, _ in self.frames_from(start):
+                if frame_timestamp > timestamp:
+                    break
+                arbitration_ids.append(arbitration_id)
+                timestamps.append(frame_timestamp)
+                dlcs.append(len(data))
+                payloads.append(data.ljust(PAYLOAD_SIZE, b"\x00"))
+            batch = CANBatch(
+                np.array(arbitration_ids, dtype=np.uint32),
+                np.array(timestamps, dtype=np.float64),
+                np.array(dlcs, dtype=np.uint8),
+                np.frombuffer(b"".join(payloads), dtype=np.uint8).reshape(
+                    -1, PAYLOAD_SIZE
+                ),
+            )
+        if len(batch):
+            state.apply(batch)
+        state.timestamp = timestamp
+        return state
+
+    def find_frame(self, arbitration_id: int, timestamp: float) -> int | None:
+        """Offset of the first frame of an arbitration ID at or after a timestamp, or None"""
+        key = list(self.index["indexed_ids"]).index(arbitration_id)
+        for bucket in range(self.bucket_at(timestamp), len(self.bucket_times)):
+            offset = int(self.index["id_offsets"][bucket, key])
+            if offset == NO_OFFSET:
+                continue
+            for frame_offset, frame_timestamp, frame_id, _, _ in self.frames_from(
+                offset
+            ):
+                if frame_id == arbitration_id and frame_timestamp >= timestamp:
+                    return frame_offset
+                if frame_timestamp >= self.bucket_end(bucket):
+                    break
+        return None
+
+    def bucket_end(self, bucket: int) -> float:
+        return float(self.bucket_times[bucket] + self.index["bucket_seconds"])
+
+
+def parse_time(value: str, first_timestamp: float) -> float:
+    """
+    Turn a time given on the command line into a timestamp: HH:MM:SS[.ffffff] is a
+    local clock time on the day the recording started, anything else is a number
+    of seconds from its first frame.
+    """
+    if ":" not in value:
+        return first_timestamp + float(value)
+    day = datetime.datetime.fromtimestamp(first_timestamp).date()
+    clock = datetime.time.fromisoformat(value)
+    return datetime.datetime.combine(day, clock).timestamp()
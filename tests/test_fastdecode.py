@@ -0,0 +1,133 @@
+"""
+Checks the decoders generated by BMS_fastdecode against cantools, so a DBC
+change the generator gets wrong fails here rather than silently corrupting
+the decoded values.
+
+Every supported message of the DBC is decoded from random payloads of its
+full length and from random short payloads (which the generated decoders read
+as they are, and cantools gets zero padded). The generator is tested on
+tests/bms.dbc, a minimal copy of the BMS and charger message set; the
+decoders BMS_dispatcher builds from the viewer's DBC are tested only when it
+is in the working directory, as the viewer reads it from there:
+
+    python -m unittest discover -s tests -t .
+"""
+
+import os
+import unittest
+
+import numpy as np
+
+FIXTURE_DBC = os.path.join(os.path.dirname(__file__), "bms.dbc")
+VIEWER_DBC = "can_1.dbc"
+PAYLOADS_PER_LENGTH = 500
+SEED = 1
+
+
+def payloads(message):
+    """(payload, the payload zero padded to the message length) pairs of every length up to it"""
+    rng = np.random.default_rng(SEED + message.frame_id)
+    for length in range(message.length + 1):
+        for row in rng.integers(0, 256, (PAYLOADS_PER_LENGTH, length), dtype=np.uint8):
+            data = bytearray(row.tobytes())
+            yield data, bytes(data).ljust(message.length, b"\x00")
+
+
+class FastDecodeTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        import cantools
+
+        from BMS_fastdecode import is_supported
+
+        cls.database = cantools.database.load_file(FIXTURE_DBC)
+        cls.messages = [
+            message for message in cls.database.messages if is_supported(message)
+        ]
+
+    def test_messages_supported(self):
+        self.assertTrue(self.messages, "the generator supports no message of the DBC")
+
+    def test_decoders(self):
+        from BMS_fastdecode import build_fast_decoders
+
+        decoders = build_fast_decoders(
+            self.database, [message.frame_id for message in self.messages]
+        )
+        for message in self.messages:
+            decoder = decoders[message.frame_id]
+            for data, padded in payloads(message):
+                with self.subTest(message=message.name, data=data.hex()):
+                    original = bytes(data)
+                    expected = self.database.decode_message(message.frame_id, padded)
+                    self.assertEqual(decoder(data), expected)
+                    self.assertEqual(data, original, "the decoder modified the payload")
+
+    def test_unpackers(self):
+        from BMS_fastdecode import build_fast_unpacker
+
+        for message in self.messages:
+            fields = [signal.name for signal in message.signals]
+            unpacker = build_fast_unpacker(message, fields)
+            for data, padded in payloads(message):
+                with self.subTest(message=message.name, data=data.hex()):
+                    expected = self.database.decode_message(message.frame_id, padded)
+                    self.assertEqual(
+                        unpacker(data), tuple(expected[name] for name in fields)
+                    )
+
+    def test_batch_decoders(self):
+        from BMS_fastdecode import MAX_PAYLOAD_BYTES, build_batch_decoder
+
+        for message in self.messages:
+            decoder = build_batch_decoder(message)
+            padded = [
+                padded.ljust(MAX_PAYLOAD_BYTES, b"\x00")
+                for _, padded in payloads(message)
+            ]
+            columns = decoder(
+                np.frombuffer(b"".join(padded), dtype=np.uint8).reshape(
+                    -1, MAX_PAYLOAD_BYTES
+                )
+            )
+            for row, data in enumerate(padded):
+                expected = self.database.decode_message(
+                    message.frame_id, data[: message.length], decode_choices=False
+                )
+                with self.subTest(message=message.name, data=data.hex()):
+                    for name, value in expected.items():
+                        self.assertAlmostEqual(
+                            float(columns[name][row]), value, places=9
+                        )
+
+
+@unittest.skipUnless(os.path.exists(VIEWER_DBC), f"{VIEWER_DBC} not found")
+class ProductionDecodeTest(unittest.TestCase):
+    def test_production_decoders(self):
+        """The decoders BMS_dispatcher actually decodes frames with"""
+        from BMS_dispatcher import (
+            CELL_VALUE_FIELDS,
+            CELLVALUE_HEX,
+            FAST_DECODERS,
+            db,
+            unpack_cell_value,
+        )
+
+        for frame_id, decoder in FAST_DECODERS.items():
+            message = db.get_message_by_frame_id(frame_id)
+            for data, padded in payloads(message):
+                with self.subTest(message=message.name, data=data.hex()):
+                    self.assertEqual(decoder(data), db.decode_message(frame_id, padded))
+
+        message = db.get_message_by_frame_id(CELLVALUE_HEX)
+        for data, padded in payloads(message):
+            with self.subTest(message=message.name, data=data.hex()):
+                expected = db.decode_message(CELLVALUE_HEX, padded)
+                self.assertEqual(
+                    unpack_cell_value(data),
+                    tuple(expected[name] for name in CELL_VALUE_FIELDS),
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,412 @@
+"""
+Synthetic BMS traffic, for stressing the viewer beyond what a recorded log offers.
+
+A SyntheticPack simulates cell voltages and temperatures (a slow random walk
+around a healthy operating point, with optional fault patterns pushing some
+cells out of their safe range) and encodes them with the inverse of the
+BMS_dispatcher decoders. A TrafficGenerator schedules the frames: CELLVALUE
+round robin over the cells at a configurable total rate, and one frame of every
+other BMS message at the status rate. The traffic can be
+
+    replayed in the viewer:    python main.py --interface synthetic --rate 20000 --fault overvoltage
+    sent on a python-can bus:  python traffic_generator.py --interface virtual --channel bms --rate 20000
+    written to a file:         python traffic_generator.py --output synthetic.bmscap --duration 60
+
+See benchmarks/bench_load.py for stepping the load up until the pipeline saturates.
+"""
+
+### IMPORTS ###
+import argparse
+import os
+import time
+from collections import deque
+
+import can
+import numpy as np
+
+from BMS_dispatcher import (
+    CELLVALUE_HEX,
+    CHARGER_STATUS_ERRORS,
+    encode_bmsstat,
+    encode_bmstinf,
+    encode_bmsvinf,
+    encode_cell_value_batch,
+    encode_charger_out,
+    encode_packstat,
+)
+from convert import WRITERS
+from parse import AcceptanceFilter
+
+### CONSTANTS ###
+DEFAULT_CELL_RATE = 1440.0  # 144 cells, 10 times a second
+DEFAULT_STATUS_RATE = 10.0
+NOMINAL_VOLTAGE = 3.7
+NOMINAL_TEMPERATURE = 25.0
+VOLTAGE_WALK = 0.002  # V per sqrt(second)
+TEMPERATURE_WALK = 0.05  # °C per sqrt(second)
+VOLTAGE_RANGE = (3.0, 4.2)
+TEMPERATURE_RANGE = (0.0, 60.0)
+# healthy cells are pulled back towards the operating point at this rate (per second)
+PULL_BACK = 0.1
+# a fault pattern drives a few cells from the operating point to just past the safe range
+FAULTY_CELL_FRACTION = 0.05
+FAULT_TARGETS = {
+    "overvoltage": ("voltage", VOLTAGE_RANGE[1] + 0.1),
+    "undervoltage": ("voltage", VOLTAGE_RANGE[0] - 0.1),
+    "overtemp": ("temperature", TEMPERATURE_RANGE[1] + 5.0),
+    "undertemp": ("temperature", TEMPERATURE_RANGE[0] - 5.0),
+}
+FAULT_ONSET_SECONDS = 10.0
+FAULT_PATTERNS = ("none", *FAULT_TARGETS, "charger", "intermittent")
+# intermittent over voltage faults switch on and off with this period
+INTERMITTENT_PERIOD = 4.0
+CHARGER_VOLTAGE = 360.0
+CHARGER_CURRENT = 5.0
+# how far ahead of the clock a paced source generates, and how long it sleeps when idle
+PACING_INTERVAL = 0.001
+
+
+class SyntheticPack:
+    """
+    Simulated cell voltages and temperatures of a pack, and the BMS frames
+    describing them. step() advances the simulation to a time in seconds.
+    """
+
+    def __init__(self, num_cells: int, fault: str = "none", seed=None):
+        if fault not in FAULT_PATTERNS:
+            raise ValueError(
+                f"Unknown fault pattern {fault!r}, expected one of {FAULT_PATTERNS}"
+            )
+        self.num_cells = num_cells
+        self.fault = fault
+        self.rng = np.random.default_rng(seed)
+        self.voltages = NOMINAL_VOLTAGE + self.rng.normal(0, 0.02, num_cells)
+        self.temperatures = NOMINAL_TEMPERATURE + self.rng.normal(0, 1.0, num_cells)
+        faulty = max(1, int(num_cells * FAULTY_CELL_FRACTION))
+        self.faulty_cells = self.rng.choice(num_cells, faulty, replace=False)
+        self.time = 0.0
+
+    def step(self, time: float) -> None:
+        elapsed = time - self.time
+        if elapsed <= 0:
+            return
+        self.time = time
+        pull_back = min(elapsed * PULL_BACK, 1.0)
+        self.voltages += self.rng.normal(
+            0, VOLTAGE_WALK * np.sqrt(elapsed), self.num_cells
+        )
+        self.voltages += (NOMINAL_VOLTAGE - self.voltages) * pull_back
+        self.temperatures += self.rng.normal(
+            0, TEMPERATURE_WALK * np.sqrt(elapsed), self.num_cells
+        )
+        self.temperatures += (NOMINAL_TEMPERATURE - self.temperatures) * pull_back
+
+        if self.fault in FAULT_TARGETS:
+            signal, target = FAULT_TARGETS[self.fault]
+            values, nominal = (
+                (self.voltages, NOMINAL_VOLTAGE)
+                if signal == "voltage"
+                else (self.temperatures, NOMINAL_TEMPERATURE)
+            )
+            progress = min(time / FAULT_ONSET_SECONDS, 1.0)
+            values[self.faulty_cells] = nominal + (target - nominal) * progress
+        elif (
+            self.fault == "intermittent"
+            and time % INTERMITTENT_PERIOD < INTERMITTENT_PERIOD / 2
+        ):
+            self.voltages[self.faulty_cells] = FAULT_TARGETS["overvoltage"][1]
+
+    def cell_payloads(self, cell_indices: np.ndarray) -> np.ndarray:
+        """CELLVALUE payloads, (N, 8) uint8, for the given cell indices (cell number - 1)"""
+        return encode_cell_value_batch(
+            cell_indices + 1,
+            self.voltages[cell_indices],
+            self.temperatures[cell_indices],
+        )
+
+    def status_messages(self) -> list:
+        """One frame of every BMS message other than CELLVALUE, describing the current state"""
+        voltages, temperatures = self.voltages, self.temperatures
+        max_voltage_cell, min_voltage_cell = int(voltages.argmax()), int(
+            voltages.argmin()
+        )
+        max_temp_cell, min_temp_cell = int(temperatures.argmax()), int(
+            temperatures.argmin()
+        )
+        pack_voltage = float(voltages.sum())
+        pack_current = 20.0 + 5.0 * np.sin(self.time / 10.0)
+
+        faults = {}
+        if voltages.max() > VOLTAGE_RANGE[1]:
+            faults["Over Voltage"] = 1
+        if voltages.min() < VOLTAGE_RANGE[0]:
+            faults["Under Voltage"] = 1
+        if temperatures.max() > TEMPERATURE_RANGE[1]:
+            faults["Over Temp"] = 1
+        if temperatures.min() < TEMPERATURE_RANGE[0]:
+            faults["Under Temp"] = 1
+        status_errors = []
+        if self.fault == "charger":
+            # walk through the charger errors one at a time, a second each
+            status_errors = [
+                CHARGER_STATUS_ERRORS[int(self.time) % len(CHARGER_STATUS_ERRORS)]
+            ]
+
+        return [
+            encode_bmsvinf(
+                {
+                    "max_voltage": float(voltages[max_voltage_cell]),
+                    "min_voltage": float(voltages[min_voltage_cell]),
+                    # the message only has room for 8-bit cell numbers
+                    "max_voltage_cell": (max_voltage_cell + 1) & 0xFF,
+                    "min_voltage_cell": (min_voltage_cell + 1) & 0xFF,
+                }
+            ),
+            encode_bmstinf(
+                {
+                    "max_temp": float(temperatures[max_temp_cell]),
+                    "min_temp": float(temperatures[min_temp_cell]),
+                    "max_temp_cell": (max_temp_cell + 1) & 0xFF,
+                    "min_temp_cell": (min_temp_cell + 1) & 0xFF,
+                }
+            ),
+            encode_bmsstat({"faults": faults}),
+            encode_packstat(
+                {
+                    "pack_voltage": pack_voltage,
+                    "pack_current": pack_current,
+                    "pack_power": pack_voltage * pack_current / 1000.0,
+                }
+            ),
+            encode_charger_out(
+                {
+                    "charger_voltage": CHARGER_VOLTAGE,
+                    "charger_current": CHARGER_CURRENT,
+                    "status_errors": status_errors,
+                }
+            ),
+        ]
+
+
+class TrafficGenerator:
+    """
+    Schedules the frames of a SyntheticPack: cell_rate CELLVALUE frames per
+    second in total, round robin over the cells, and every other BMS message
+    status_rate times per second. generate(until) returns every frame due
+    between the previous call and until (seconds since the start), in order.
+    """
+
+    def __init__(
+        self,
+        num_cells: int,
+        cell_rate: float = DEFAULT_CELL_RATE,
+        status_rate: float = DEFAULT_STATUS_RATE,
+        fault: str = "none",
+        seed=None,
+        start_time: float | None = None,
+    ):
+        self.pack = SyntheticPack(num_cells, fault, seed)
+        self.start_time = time.time() if start_time is None else start_time
+        if status_rate <= 0:
+            raise ValueError("The status rate must be positive")
+        self.status_rate = status_rate
+        self.position = 0.0
+        self.next_cell = 0
+        self.next_status = 0.0
+        self.set_cell_rate(cell_rate)
+
+    def set_cell_rate(self, cell_rate: float) -> None:
+        """Change the CELLVALUE rate from the current position on"""
+        if cell_rate <= 0:
+            raise ValueError("The cell rate must be positive")
+        self.cell_rate = cell_rate
+        self.rate_origin = self.position
+        self.rate_frames = 0
+
+    def generate(self, until: float) -> list[tuple[float, int, bytes]]:
+        """(timestamp, arbitration id, payload) of every frame due up to until seconds"""
+        if until <= self.position:
+            return []
+        self.pack.step(until)
+        self.position = until
+
+        # frame k of the current rate is due at rate_origin + k / cell_rate
+        due = int((until - self.rate_origin) * self.cell_rate)
+        count = max(due - self.rate_frames, 0)
+        offsets = (
+            self.rate_origin
+            + np.arange(self.rate_frames, self.rate_frames + count) / self.cell_rate
+        )
+        self.rate_frames += count
+        cells = (self.next_cell + np.arange(count)) % self.pack.num_cells
+        self.next_cell = (self.next_cell + count) % self.pack.num_cells
+        payloads = self.pack.cell_payloads(cells)
+        timestamps = (self.start_time + offsets).tolist()
+        frames = [
+            (timestamp, CELLVALUE_HEX, payload)
+            for timestamp, payload in zip(timestamps, map(bytes, payloads))
+        ]
+
+        status_frames = []
+        while self.next_status < until:
+            timestamp = self.start_time + self.next_status
+            status_frames.extend(
+                (timestamp, message.arbitration_id, bytes(message.data))
+                for message in self.pack.status_messages()
+            )
+            self.next_status += 1.0 / self.status_rate
+        if status_frames:
+            frames = sorted(frames + status_frames, key=lambda frame: frame[0])
+        return frames
+
+
+class SyntheticBus(can.BusABC):
+    """
+    A bus receiving the frames of a TrafficGenerator in real time, the synthetic
+    counterpart of CANFakeBus. Frames are generated in small slices as the clock
+    reaches them, so the offered rate is sustained as long as the receiving side
+    keeps up; sent_count says how many frames were actually delivered.
+    Filters set with set_filters are enforced on the generated frames before a
+    can.Message is made for them, as CANFakeBus does for logs; rejected frames
+    are not delivered, and are counted by the acceptance filter instead.
+    """
+
+    def __init__(self, generator: TrafficGenerator, **kwargs):
+        self.generator = generator
+        self.started = time.monotonic()
+        self.generator.start_time = time.time()
+        self.queued = deque()
+        self.sent_count = 0
+        self.set_filters(None)
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def set_cell_rate(self, cell_rate: float) -> None:
+        self.generator.set_cell_rate(cell_rate)
+
+    # cannot send messages
+    def send(self, msg, timeout=None): ...
+
+    def _recv_internal(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        accept = self.acceptance.accept
+        while True:
+            if not self.queued:
+                self.queued.extend(self.generator.generate(self.elapsed()))
+            if self.queued:
+                timestamp, arbitration_id, data = self.queued.popleft()
+                if accept(arbitration_id):
+                    self.sent_count += 1
+                    break
+                continue
+            if deadline is not None and time.monotonic() >= deadline:
+                return (None, False)
+            time.sleep(PACING_INTERVAL)
+
+        msg = can.Message(
+            timestamp=timestamp,
+            arbitration_id=arbitration_id,
+            is_extended_id=False,
+            dlc=len(data),
+            data=data,
+        )
+        # (message, filtered?)
+        return (msg, True)
+
+    def _apply_filters(self, filters):
+        self.acceptance = AcceptanceFilter(filters)
+
+
+def send_traffic(
+    bus: can.BusABC, generator: TrafficGenerator, duration: float | None = None
+) -> int:
+    """Send the generated frames on a python-can bus in real time; returns how many were sent"""
+    started = time.monotonic()
+    generator.start_time = time.time()
+    sent = 0
+    while duration is None or time.monotonic() - started < duration:
+        for timestamp, arbitration_id, data in generator.generate(
+            time.monotonic() - started
+        ):
+            bus.send(
+                can.Message(
+                    timestamp=timestamp,
+                    arbitration_id=arbitration_id,
+                    is_extended_id=False,
+                    data=data,
+                )
+            )
+            sent += 1
+        time.sleep(PACING_INTERVAL)
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic BMS traffic generator")
+    parser.add_argument(
+        "--cells", type=int, default=144, help="Number of cells in the pack"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=DEFAULT_CELL_RATE,
+        help="CELLVALUE frames per second",
+    )
+    parser.add_argument(
+        "--status-rate",
+        type=float,
+        default=DEFAULT_STATUS_RATE,
+        help="Frames per second of every other BMS message",
+    )
+    parser.add_argument("--fault", choices=FAULT_PATTERNS, default="none")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--interface", help="python-can interface to send on, e.g. virtual"
+    )
+    parser.add_argument("--channel", default="bms")
+    parser.add_argument(
+        "--output",
+        metavar="OUTPUT FILE",
+        help="Write --duration seconds of traffic to a .log, .csv or .bmscap file instead",
+    )
+    parser.add_argument(
+        "--duration", type=float, help="Seconds of traffic (default: forever)"
+    )
+    args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
+    if args.status_rate <= 0:
+        parser.error("--status-rate must be positive")
+
+    generator = TrafficGenerator(
+        args.cells, args.rate, args.status_rate, args.fault, args.seed
+    )
+    if args.output is not None:
+        writer = WRITERS.get(os.path.splitext(args.output)[1])
+        if writer is None or args.duration is None:
+            print("Error: --output needs a .log, .csv or .bmscap file and a --duration")
+            exit(-1)
+        frames = [
+            frame
+            for second in range(1, int(np.ceil(args.duration)) + 1)
+            for frame in generator.generate(min(second, args.duration))
+        ]
+        writer(((*frame, 0) for frame in frames), args.output)
+        print(f"{len(frames)} frames written to {args.output}")
+    elif args.interface is not None:
+        with can.Bus(channel=args.channel, interface=args.interface) as bus:
+            try:
+                sent = send_traffic(bus, generator, args.duration)
+                print(f"{sent} frames sent")
+            except KeyboardInterrupt:
+                pass
+    else:
+        print(
+            "Error: Provide --interface to send the traffic on or --output to write it to"
+        )
+        exit(-1)
+
+
+if __name__ == "__main__":
+    main()
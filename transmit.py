@@ -0,0 +1,185 @@
+"""
+Periodic transmission of fixed CAN frames: the BMS polling message on every
+bus and the charger command while charging.
+
+TransmitScheduler runs every periodic job on one asyncio task. Each job keeps
+an absolute deadline that advances by exactly its period, so however long a
+send takes, it never delays the next one. A job that falls a whole period or
+more behind skips the deadlines it missed, counting them, rather than sending
+a burst to catch up. Messages are built once, as can.Message, and only
+replaced when their content changes.
+
+Buses that implement periodic sending themselves (SocketCAN's broadcast
+manager) are handed their jobs through python-can's send_periodic instead; the
+kernel then times the sends, and no jitter is measured for them.
+"""
+
+### IMPORTS ###
+import asyncio
+import time
+
+import can
+
+from data_processing import CANMessage
+from parse import CANMessageParser
+
+
+def to_can_message(message: CANMessage, is_extended_id=False) -> can.Message:
+    """Build the python-can message to send from a CANMessage"""
+    return can.Message(
+        arbitration_id=message.arbitration_id,
+        data=message.data,
+        is_extended_id=is_extended_id,
+    )
+
+
+def has_native_periodic(bus: can.BusABC) -> bool:
+    """Whether the bus times periodic sends itself, rather than in a python-can thread"""
+    return type(bus)._send_periodic_internal is not can.BusABC._send_periodic_internal
+
+
+class JitterStats:
+    """How late the sends of one job were against their deadlines, and how many deadlines were missed"""
+
+    def __init__(self):
+        self.sends = 0
+        self.missed = 0
+        self.total_late = 0.0
+        self.max_late = 0.0
+
+    def add(self, late: float) -> None:
+        self.sends += 1
+        self.total_late += late
+        self.max_late = max(self.max_late, late)
+
+    def as_dict(self) -> dict:
+        return {
+            "sends": self.sends,
+            "missed": self.missed,
+            "mean_late_ms": self.total_late / self.sends * 1000 if self.sends else None,
+            "max_late_ms": self.max_late * 1000 if self.sends else None,
+        }
+
+
+class PeriodicJob:
+    """A message sent on one bus every period seconds, and the next deadline it is due at"""
+
+    def __init__(
+        self,
+        parser: CANMessageParser,
+        message: can.Message,
+        period: float,
+        deadline: float,
+    ):
+        self.parser = parser
+        self.message = message
+        self.period = period
+        self.deadline = deadline
+        self.stats = JitterStats()
+        # the bus's own cyclic send task, when it has one
+        self.task = None
+
+
+class TransmitScheduler:
+    """
+    Sends every job's message once per period, on absolute deadlines.
+    add, update and remove are called on the loop running run().
+    """
+
+    def __init__(self, clock=time.monotonic):
+        # the default asyncio loop measures time with time.monotonic as well
+        self.clock = clock
+        self.jobs = {}
+        self.changed = asyncio.Event()
+
+    def add(
+        self, name: str, parser: CANMessageParser, message: can.Message, period: float
+    ):
+        """Start sending message every period seconds, the first time now, replacing any job of that name"""
+        self.remove(name)
+        job = PeriodicJob(parser, message, period, self.clock())
+        if has_native_periodic(parser.bus):
+            try:
+                job.task = parser.bus.send_periodic(message, period, store_task=False)
+            except can.CanError:
+                print(
+                    f"Periodic sending not available for {name}, timing it in software"
+                )
+        self.jobs[name] = job
+        self.changed.set()
+
+    def update(self, name: str, message: can.Message):
+        """Send a different message from the next deadline on"""
+        job = self.jobs[name]
+        job.message = message
+        if job.task is not None:
+            job.task.modify_data(message)
+
+    def remove(self, name: str):
+        job = self.jobs.pop(name, None)
+        if job is not None and job.task is not None:
+            job.task.stop()
+
+    def stats(self) -> dict[str, dict]:
+        """JitterStats.as_dict() of every job, None for jobs the bus times itself"""
+        return {
+            name: None if job.task is not None else job.stats.as_dict()
+            for name, job in list(self.jobs.items())
+        }
+
+    async def run(self):
+        """Send every job's message at its deadlines until cancelled"""
+        try:
+            while True:
+                self.changed.clear()
+                jobs = [job for job in self.jobs.values() if job.task is None]
+                if not jobs:
+                    await self.changed.wait()
+                    continue
+                delay = min(job.deadline for job in jobs) - self.clock()
+                if delay > 0:
+                    # woken early when jobs change, to schedule them afresh
+                    try:
+                        await asyncio.wait_for(self.changed.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                now = self.clock()
+                for job in jobs:
+                    if job.deadline <= now:
+                        self.send(job, now)
+        finally:
+            for name in list(self.jobs):
+                self.remove(name)
+
+    def send(self, job: PeriodicJob, now: float):
+        """Send a job's message for its current deadline and move on to the next"""
+        late = now - job.deadline
+        if late >= job.period:
+            missed = int(late // job.period)
+            job.stats.missed += missed
+            job.deadline += missed * job.period
+            late -= missed * job.period
+        job.parser.send(job.message)
+        job.stats.add(late)
+        job.deadline += job.period
+
+
+def format_transmit_stats(stats: dict[str, dict]) -> str:
+    """Render TransmitScheduler.stats() as a table"""
+    lines = [
+        "Periodic transmit",
+        f"  {'job':<32}{'sends':>8}{'missed':>8}{'mean ms':>10}{'max ms':>10}",
+    ]
+    for name, job in stats.items():
+        if job is None:
+            lines.append(f"  {name:<32}{'timed by the interface':>36}")
+            continue
+        mean = "-" if job["mean_late_ms"] is None else f"{job['mean_late_ms']:.2f}"
+        maximum = "-" if job["max_late_ms"] is None else f"{job['max_late_ms']:.2f}"
+        lines.append(
+            f"  {name:<32}{job['sends']:>8}{job['missed']:>8}{mean:>10}{maximum:>10}"
+        )
+    if not stats:
+        lines.append("  no jobs")
+    return "\n".join(lines)
@@ -0,0 +1,159 @@
+### IMPORTS ###
+import numpy as np
+from PyQt5.QtCore import *
+from PyQt5.QtGui import *
+from PyQt5.QtWidgets import *
+
+from cell_history import CellHistory
+
+### CONSTANTS ###
+TREND_RANGES = [
+    ("10 s", 10),
+    ("1 min", 60),
+    ("10 min", 600),
+    ("1 h", 3600),
+    ("12 h", 43200),
+]
+DEFAULT_TREND_RANGE = 1
+TREND_REFRESH_INTERVAL_MS = 1000
+PLOT_MARGIN = 60
+VOLTAGE_TREND_COLOR = QColor(0, 90, 200)
+TEMPERATURE_TREND_COLOR = QColor(200, 60, 0)
+ENVELOPE_ALPHA = 80
+
+
+class TrendPlot(QWidget):
+    """
+    Draws the min/max envelope of one signal over time: a filled band between
+    the min and max of every point, with the mid line on top. Points are
+    already decimated by CellHistory, so the cost doesn't depend on the range.
+    """
+
+    def __init__(self, title, unit, color):
+        super().__init__()
+        self.title = title
+        self.unit = unit
+        self.color = color
+        self.times = np.empty(0)
+        self.minimums = np.empty(0)
+        self.maximums = np.empty(0)
+        self.seconds = 0
+        self.end = 0.0
+        self.setMinimumSize(400, 160)
+
+    def set_data(self, times, minimums, maximums, seconds, end):
+        """Show the points of the given number of seconds ending at end"""
+        present = ~(np.isnan(minimums) | np.isnan(maximums))
+        self.times = times[present]
+        self.minimums = minimums[present]
+        self.maximums = maximums[present]
+        self.seconds = seconds
+        self.end = end
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.Antialiasing)
+        plot = QRectF(self.rect()).adjusted(PLOT_MARGIN, 20, -10, -20)
+        painter.drawText(
+            QRectF(self.rect()).adjusted(0, 2, 0, 0), Qt.AlignHCenter, self.title
+        )
+        painter.setPen(QPen(Qt.gray, 1))
+        painter.drawRect(plot)
+        if len(self.times) == 0:
+            painter.drawText(plot, Qt.AlignCenter, "No data")
+            return
+
+        low, high = float(self.minimums.min()), float(self.maximums.max())
+        if high - low < 1e-6:
+            low, high = low - 0.5, high + 0.5
+        start = self.end - self.seconds
+
+        xs = plot.left() + (self.times - start) / self.seconds * plot.width()
+        top = plot.bottom() - (self.maximums - low) / (high - low) * plot.height()
+        bottom = plot.bottom() - (self.minimums - low) / (high - low) * plot.height()
+
+        band = QPolygonF(
+            [QPointF(x, y) for x, y in zip(xs, top)]
+            + [QPointF(x, y) for x, y in zip(xs[::-1], bottom[::-1])]
+        )
+        fill = QColor(self.color)
+        fill.setAlpha(ENVELOPE_ALPHA)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(fill)
+        painter.drawPolygon(band)
+        painter.setPen(QPen(self.color, 1.5))
+        painter.drawPolyline(
+            QPolygonF([QPointF(x, y) for x, y in zip(xs, (top + bottom) / 2)])
+        )
+
+        painter.setPen(Qt.black)
+        painter.drawText(
+            QRectF(0, plot.top() - 8, PLOT_MARGIN - 4, 16),
+            Qt.AlignRight | Qt.AlignVCenter,
+            f"{high:.3g}{self.unit}",
+        )
+        painter.drawText(
+            QRectF(0, plot.bottom() - 8, PLOT_MARGIN - 4, 16),
+            Qt.AlignRight | Qt.AlignVCenter,
+            f"{low:.3g}{self.unit}",
+        )
+        painter.drawText(
+            QRectF(plot.left(), plot.bottom() + 2, plot.width(), 16),
+            Qt.AlignLeft,
+            f"-{self.seconds:g} s",
+        )
+        painter.drawText(
+            QRectF(plot.left(), plot.bottom() + 2, plot.width(), 16),
+            Qt.AlignRight,
+            "now",
+        )
+
+
+class TrendDialog(QDialog):
+    """A window showing the voltage and temperature trend of one cell, refreshed every second."""
+
+    def __init__(self, history: CellHistory, cell_number: int, label: str, parent=None):
+        super().__init__(parent)
+        self.history = history
+        self.cell_index = cell_number - 1
+        self.setWindowTitle(f"Cell {label} trend")
+
+        self.range_dropdown = QComboBox(self)
+        for name, _ in TREND_RANGES:
+            self.range_dropdown.addItem(name)
+        self.range_dropdown.setCurrentIndex(DEFAULT_TREND_RANGE)
+        self.range_dropdown.currentIndexChanged.connect(self.refresh)
+
+        self.voltage_plot = TrendPlot("Voltage", "V", VOLTAGE_TREND_COLOR)
+        self.temperature_plot = TrendPlot("Temperature", "°C", TEMPERATURE_TREND_COLOR)
+
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel("Range:"))
+        controls.addWidget(self.range_dropdown)
+        controls.addStretch()
+        layout = QVBoxLayout()
+        layout.addLayout(controls)
+        layout.addWidget(self.voltage_plot)
+        layout.addWidget(self.temperature_plot)
+        self.setLayout(layout)
+
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(TREND_REFRESH_INTERVAL_MS)
+        self.refresh()
+
+    def refresh(self):
+        seconds = TREND_RANGES[self.range_dropdown.currentIndex()][1]
+        trend = self.history.trend(self.cell_index, seconds)
+        end = self.history.latest or 0.0
+        self.voltage_plot.set_data(
+            trend["time"], trend["voltage_min"], trend["voltage_max"], seconds, end
+        )
+        self.temperature_plot.set_data(
+            trend["time"],
+            trend["temperature_min"],
+            trend["temperature_max"],
+            seconds,
+            end,
+        )
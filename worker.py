@@ -1,16 +1,80 @@
 ### IMPORTS ###
-import sys
+import asyncio
+import threading
 import time
 
 from PyQt5.QtCore import *
 
 
-class WorkerSignals(QObject):
-    """Establish communication channels"""
+class RefreshDispatcher(QObject):
+    """
+    Coalesces "data changed" notifications into redraws on the GUI thread.
 
-    finished = pyqtSignal()
-    error = pyqtSignal(tuple)
-    result = pyqtSignal(object)
+    data_changed may be emitted from any thread, as often as data arrives.
+    The first emission after a redraw schedules the next one, no sooner than
+    1 / max_fps seconds after the previous redraw. Emissions while a redraw is
+    already scheduled are absorbed by it, and nothing runs while no data arrives.
+    """
+
+    data_changed = pyqtSignal()
+
+    def __init__(self, take_dirty, redraw, max_fps):
+        super(RefreshDispatcher, self).__init__()
+        self.take_dirty = take_dirty
+        self.redraw = redraw
+        self.frame_interval = 1.0 / max_fps
+        self.last_frame = 0.0
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.run)
+        self.data_changed.connect(self.schedule)
+
+    @pyqtSlot()
+    def schedule(self):
+        """Arrange the next redraw, respecting the maximum frame rate"""
+        if not self.timer.isActive():
+            delay = self.last_frame + self.frame_interval - time.monotonic()
+            self.timer.start(max(0, int(delay * 1000)))
+
+    @pyqtSlot()
+    def run(self):
+        """Redraw whatever became dirty since the previous frame"""
+        self.last_frame = time.monotonic()
+        dirty = self.take_dirty()
+        if dirty:
+            self.redraw(dirty)
+
+
+class AsyncBridge(QObject):
+    """
+    Attaches the GUI to an asyncio IngestionCore (see ingest.py).
+
+    The core's loop runs on a thread of its own rather than inside the Qt event
+    loop. Every snapshot it publishes is re-emitted as snapshot_published, which
+    Qt queues over to the thread of the connected slots; calls the other way go
+    through the core's thread-safe methods.
+    """
+
+    snapshot_published = pyqtSignal(str, object, object)
+
+    def __init__(self, core):
+        super(AsyncBridge, self).__init__()
+        self.core = core
+        self.thread = None
+        core.subscribe(self.snapshot_published.emit)
+
+    def start(self):
+        """Run the core until stop()"""
+        self.thread = threading.Thread(
+            target=asyncio.run, args=(self.core.run(),), name="ingestion", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the core and wait for it to close its buses"""
+        self.core.stop()
+        if self.thread is not None:
+            self.thread.join(timeout)
 
 
 class Worker(QRunnable):
@@ -28,33 +92,3 @@ class Worker(QRunnable):
     def stop(self):
         """Instruct the worker to stop"""
         self.is_running = False
-
-
-class TimedWorker(QRunnable):
-
-    def __init__(self, fn, *args, **kwargs):
-        super(TimedWorker, self).__init__()
-        self.fn = fn
-        self.args = args
-        self.kwargs = kwargs
-        self.signals = WorkerSignals()
-        self.is_running = True
-
-    @pyqtSlot()
-    def run(self):
-        """Run repeatedly every second."""
-        try:
-            while self.is_running:
-                result = self.fn(*self.args, **self.kwargs)
-                self.signals.result.emit(result)
-                time.sleep(0.5)
-
-        except Exception as e:
-            exctype, value, tb = sys.exc_info()
-            self.signals.error.emit((exctype, value, tb))
-        finally:
-            self.signals.finished.emit()
-
-    def stop(self):
-        """Stop the worker loop."""
-        self.is_running = False